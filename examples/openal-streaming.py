@@ -22,15 +22,12 @@ for i in range( cycle_buffers ):
 	print('buffer id', buffs[i] )
 
 n = 4096
-data = (ctypes.c_byte*n)()
-for i in range(n):
-	data[i] = 128 + int(random.uniform( -100, 100 ))
-ptr = ctypes.pointer( data )
+data = bytearray( [128 + int(random.uniform( -100, 100 )) for i in range(n)] )	# passed without copying
 for i in range( cycle_buffers ):
 	al.BufferData(
 		buffs[i],
 		al.AL_FORMAT_MONO8, 
-		ptr, 
+		data, 
 		n, 		# size in bytes
 		11025,
 	)
@@ -1,9 +1,12 @@
-import os, sys, ctypes, inspect
+import os, sys, ctypes, inspect, time, threading
+import mmap as _mmap, struct as _struct, array as _array, glob as _glob
+from ast import literal_eval as _literal_eval
 __os = os
 __sys = sys
 __inspect = inspect
 _list = list
 _CTYPES_CDLLS = []	# support loading functions from multiple libraries
+_RPYTHONIC_LOCK_ = threading.RLock()	# one-time patching of classes, globals and registries, never taken by calls of bound functions
 
 
 PYTHON_RESERVED_KEYWORDS = 'for while in as global with try except lambda return raise if else elif eval exec and not or break continue finally print yield del def class assert from is pass'.split()
@@ -20,15 +23,8 @@ else:
 	_basestring = str
 
 def _CHARP2STRING( charp, encoding='utf-8' ):
-	b = bytes()
-	i = 0
-	while True:
-		char = charp[ i ]
-		if char == _NULLBYTE: break
-		else:
-			b += char
-			i += 1
-	return b.decode( encoding )
+	if not charp: return None		# NULL
+	return ctypes.string_at( charp ).decode( encoding )
 
 ## try to load precompiled c-libraries from this directory, if the library is not there try to load from the system.
 _clibs_dir = os.path.dirname(os.path.abspath(__file__))
@@ -76,15 +72,205 @@ def _load_ctypes_lib( name ):
 		if os.path.isfile( url ): return ctypes.CDLL(url)
 		else: return ctypes.CDLL(name) #fallback
 
+###############################################################
+##						SYMBOL INDEX						##
+###############################################################
+## which loaded library has a symbol, without a dlsym per function per library: the .dynsym tables of an ELF library
+## and of the libraries it needs are read once, and cached with the path each library name resolved to in the symbols
+## directory of rpythonic's CACHEDIR, or RPYTHONIC_SYMBOL_CACHE, empty keeps them in memory only.
+## cache entries are keyed by the inode and mtime of the file. libraries that are not ELF, or need ones that can not be
+## found, fall back to dlsym for the names their index does not have.
+def _rpythonic_cache_dir_():		# CACHEDIR of a loaded generator, else its default, never the wrapper package
+	for name in ( 'rpythonic.rpythonic', 'rpythonic' ):
+		cachedir = getattr( __sys.modules.get( name ), 'CACHEDIR', None )
+		if cachedir: return cachedir
+	return __os.path.join( __os.path.expanduser('~'), '.rpythonic' )
+
+RPYTHONIC_SYMBOL_CACHE = __os.environ.get( 'RPYTHONIC_SYMBOL_CACHE', __os.path.join( _rpythonic_cache_dir_(), 'symbols' ) )
+_RPYTHONIC_SYMBOLS_ = {}		# id of a CDLL -> (set of symbol names, complete), None when not indexed
+_RPYTHONIC_ELF_FILES_ = {}		# real path -> (symbols, needed, runpath)
+_RPYTHONIC_LIBRARY_PATHS_ = {}		# (wrapper dir, library name) -> (path, stamp), from libraries.txt
+_ELF_LIBRARY_DIRS_ = []		# where the dynamic linker looks for needed libraries
+_RPYTHONIC_SYMBOL_FORMAT_ = '2'		# first field of the cache stamp, bumped when the index changes
+
+def _rpythonic_stamp_( path ):
+	try: st = __os.stat( path )
+	except EnvironmentError: return None
+	return '%d:%r' %(st.st_ino, st.st_mtime)
+
+def _rpythonic_elf_read_( path ):
+	'''defined global symbols of .dynsym that dlsym finds, needed libraries and run paths of .dynamic, None when not an ELF file'''
+	try:
+		f = open( path, 'rb' )
+		try: m = _mmap.mmap( f.fileno(), 0, access=_mmap.ACCESS_READ )
+		finally: f.close()
+	except (EnvironmentError, ValueError): return None
+	try:
+		if m[:4] != b'\x7fELF': return None
+		cls, data = _struct.unpack_from( 'BB', m, 4 )
+		e = data == 2 and '>' or '<'
+		if cls == 2: header, section, sym, dyn = 'HHIQQQIHHHHHH', 'IIQQQQIIQQ', 'IBBHQQ', 'qQ'
+		else: header, section, sym, dyn = 'HHIIIIIHHHHHH', 'IIIIIIIIII', 'IIIBBH', 'iI'
+		h = _struct.unpack_from( e+header, m, 16 )
+		shoff, shentsize, shnum = h[5], h[10], h[11]
+		## name, type, flags, addr, offset, size, link, info, addralign, entsize
+		sections = [ _struct.unpack_from( e+section, m, shoff + i*shentsize ) for i in range(shnum) ]
+		symbols = []; needed = []; runpath = []
+		versym = [ v[4] for v in sections if v[1] == 0x6fffffff ]		# SHT_GNU_versym, a version index per .dynsym entry
+		for s in sections:
+			strtab = sections[ s[6] ][4]
+			if s[1] == 11:		# SHT_DYNSYM, the first entry is the null symbol
+				st = _struct.Struct( e+sym )
+				for i, off in enumerate( range( s[4] + st.size, s[4] + s[5], st.size ) ):
+					if cls == 2: name, info, other, shndx = st.unpack_from( m, off )[:4]
+					else: name, value, size, info, other, shndx = st.unpack_from( m, off )
+					if versym and _struct.unpack_from( e+'H', m, versym[0] + 2*(i+1) )[0] & 0x8000: continue		# hidden, an old version
+					if shndx and shndx != 0xfff1 and info >> 4 in (1, 2, 10):		# defined, not SHN_ABS (version names), global, weak or unique
+						a = strtab + name
+						symbols.append( m[ a : m.find(_NULLBYTE, a) ] )
+			elif s[1] == 6:		# SHT_DYNAMIC
+				st = _struct.Struct( e+dyn )
+				for off in range( s[4], s[4] + s[5], st.size ):
+					tag, val = st.unpack_from( m, off )
+					if not tag: break
+					if tag in (1, 15, 29):		# DT_NEEDED, DT_RPATH, DT_RUNPATH
+						a = strtab + val
+						v = m[ a : m.find(_NULLBYTE, a) ]
+						if tag == 1: needed.append( v )
+						else: runpath.extend( v.split(b':') )
+	except (_struct.error, IndexError): return None
+	finally: m.close()
+	if not _ISPYTHON2:
+		symbols = [ s.decode('latin-1') for s in symbols ]
+		needed = [ s.decode('latin-1') for s in needed ]
+		runpath = [ s.decode('latin-1') for s in runpath ]
+	return symbols, needed, runpath
+
+def _rpythonic_elf_file_( path ):
+	'''_rpythonic_elf_read_ through the symbol cache'''
+	path = __os.path.realpath( path )
+	if path not in _RPYTHONIC_ELF_FILES_:
+		stamp = _rpythonic_stamp_( path ); elf = None
+		if stamp: stamp = '%s:%s' %(_RPYTHONIC_SYMBOL_FORMAT_, stamp)
+		cache = RPYTHONIC_SYMBOL_CACHE and stamp and __os.path.join( RPYTHONIC_SYMBOL_CACHE, path.strip('/').replace('/','_') + '.symbols' )
+		if cache and __os.path.isfile( cache ):		# stamp, needed, runpath, then one symbol per line
+			lines = open( cache ).read().split( '\n' )
+			if lines[0] == stamp: elf = lines[3:], [ n for n in lines[1].split('\t') if n ], [ r for r in lines[2].split('\t') if r ]
+		if elf is None:
+			elf = _rpythonic_elf_read_( path )
+			if elf and cache:
+				try:
+					if not __os.path.isdir( RPYTHONIC_SYMBOL_CACHE ): __os.makedirs( RPYTHONIC_SYMBOL_CACHE )
+					tmp = '%s.%d' %(cache, __os.getpid())
+					open( tmp, 'w' ).write( '\n'.join( [stamp, '\t'.join(elf[1]), '\t'.join(elf[2])] + elf[0] ) )
+					__os.rename( tmp, cache )
+				except (EnvironmentError, UnicodeError): pass
+		_RPYTHONIC_ELF_FILES_[ path ] = elf and ( set(elf[0]), elf[1], elf[2] )
+	return _RPYTHONIC_ELF_FILES_[ path ]
+
+def _rpythonic_library_dirs_():
+	if not _ELF_LIBRARY_DIRS_:
+		dirs = [ d for d in __os.environ.get( 'LD_LIBRARY_PATH', '' ).split(':') if d ]
+		confs = [ '/etc/ld.so.conf' ]
+		while confs:
+			try: lines = open( confs.pop(0) ).read().splitlines()
+			except EnvironmentError: continue
+			for line in lines:
+				line = line.split('#')[0].strip()
+				if line.startswith( 'include ' ): confs.extend( sorted( _glob.glob( line[8:].strip() ) ) )
+				elif line: dirs.append( line )
+		if IS32BIT: dirs += [ '/lib', '/usr/lib' ]
+		else: dirs += [ '/lib64', '/usr/lib64', '/lib', '/usr/lib' ]
+		_ELF_LIBRARY_DIRS_.extend( dirs )
+	return _ELF_LIBRARY_DIRS_
+
+def _rpythonic_index_library_( path ):
+	'''the symbols dlsym finds with the handle of this library: its own and those of the libraries it needs'''
+	symbols = set(); complete = True
+	queue = [ __os.path.realpath(path) ]; seen = set()
+	while queue:
+		path = queue.pop( 0 )		# breadth first, like the dynamic linker
+		if path in seen: continue
+		seen.add( path )
+		elf = _rpythonic_elf_file_( path )
+		if elf is None:
+			if len(seen) == 1: return None
+			complete = False; continue
+		own, needed, runpath = elf
+		symbols.update( own )
+		origin = __os.path.dirname( path )
+		dirs = [ d.replace('$ORIGIN', origin).replace('${ORIGIN}', origin) for d in runpath ] + _rpythonic_library_dirs_()
+		for name in needed:
+			for d in dirs:
+				url = __os.path.join( d, name )
+				if __os.path.isfile( url ): queue.append( __os.path.realpath(url) ); break
+			else: complete = False
+	return symbols, complete
+
+def _rpythonic_symbol_library_( name, cdlls=None ):
+	'''the first loaded library with the symbol, dlsym only where the index can not tell, None when none has it'''
+	unknown = []
+	for cdll in cdlls or _CTYPES_CDLLS:
+		key = id( cdll )
+		if key not in _RPYTHONIC_SYMBOLS_:		# indexed on the first lookup, wrappers binding nothing pay nothing
+			with _RPYTHONIC_LOCK_:
+				path = getattr( cdll, '_name', None )
+				if key in _RPYTHONIC_SYMBOLS_: pass
+				elif path and __os.path.isabs( path ) and __os.path.isfile( path ): _RPYTHONIC_SYMBOLS_[ key ] = _rpythonic_index_library_( path )
+				else: _RPYTHONIC_SYMBOLS_[ key ] = None
+		index = _RPYTHONIC_SYMBOLS_[ key ]
+		if index is None or not index[1]: unknown.append( cdll )
+		if index is not None and name in index[0]: return cdll
+	for cdll in unknown:
+		if hasattr( cdll, name ): return cdll
+
+def _rpythonic_library_path_( name ):
+	'''the path a library name resolved to before, if that file did not change'''
+	if not _RPYTHONIC_LIBRARY_PATHS_ and RPYTHONIC_SYMBOL_CACHE:
+		try: lines = open( __os.path.join( RPYTHONIC_SYMBOL_CACHE, 'libraries.txt' ) ).read().splitlines()
+		except EnvironmentError: lines = []
+		for line in lines:		# wrapper dir, name, path, stamp - the last one wins
+			f = line.split( '\t' )
+			if len(f) == 4: _RPYTHONIC_LIBRARY_PATHS_[ (f[0], f[1]) ] = ( f[2], f[3] )
+	path, stamp = _RPYTHONIC_LIBRARY_PATHS_.get( (_clibs_dir, name), (None, None) )
+	if path and _rpythonic_stamp_( path ) == stamp: return path
+
+def _rpythonic_remember_library_path_( name, path ):
+	stamp = _rpythonic_stamp_( path )
+	if not stamp or not RPYTHONIC_SYMBOL_CACHE: return
+	_RPYTHONIC_LIBRARY_PATHS_[ (_clibs_dir, name) ] = ( path, stamp )
+	try:
+		if not __os.path.isdir( RPYTHONIC_SYMBOL_CACHE ): __os.makedirs( RPYTHONIC_SYMBOL_CACHE )
+		open( __os.path.join( RPYTHONIC_SYMBOL_CACHE, 'libraries.txt' ), 'a' ).write( '\t'.join( [_clibs_dir, name, path, stamp] ) + '\n' )
+	except (EnvironmentError, UnicodeError): pass
+
 RPYTHONIC_WRAPPER_FUNCTIONS = {}
 RPYTHONIC_WRAPPER_FUNCTIONS_FAILURES = []
 RPYTHONIC_AUTOPREFIX_IGNORE = []
+RPYTHONIC_LAZY_FUNCTIONS = __os.environ.get( 'RPYTHONIC_LAZY_FUNCTIONS', '0' ) not in ('', '0')
+RPYTHONIC_LAZY_FUNCTIONS_PENDING = {}	# name -> _rpythonic_lazyfunc_, until bound
+
+def _rpythonic_lazy_functions_( lazy ):		# the wrapper default, the environment variable wins
+	global RPYTHONIC_LAZY_FUNCTIONS
+	if 'RPYTHONIC_LAZY_FUNCTIONS' not in __os.environ: RPYTHONIC_LAZY_FUNCTIONS = lazy
+
+## functions in _RPYTHONIC_GIL_HOLDING_ are bound through a PyDLL handle of their library and keep the GIL during the call,
+## RPYTHONIC_HOLD_GIL=0 binds them all through the CDLL, releasing it like before. footers can change it, see metafunc.hold_gil
+RPYTHONIC_HOLD_GIL = __os.environ.get( 'RPYTHONIC_HOLD_GIL', '1' ) not in ('', '0')
+_RPYTHONIC_GIL_HOLDING_ = set()		# names, worked out by the generator
+_RPYTHONIC_PYDLLS_ = {}		# id of a CDLL -> PyDLL on the same handle
+
+def _rpythonic_pydll_( cdll ):
+	if id(cdll) not in _RPYTHONIC_PYDLLS_:
+		with _RPYTHONIC_LOCK_: _RPYTHONIC_PYDLLS_.setdefault( id(cdll), ctypes.PyDLL( cdll._name, handle=cdll._handle ) )
+	return _RPYTHONIC_PYDLLS_[ id(cdll) ]
 
 ## ctypes does not clearly expose these types ##
 PyCFuncPtrType = type(ctypes.CFUNCTYPE(ctypes.c_void_p))
 PyCArrayType = type( ctypes.c_int * 2 )
 PyCPointerType = type( ctypes.POINTER(ctypes.c_int) )
 PyCStructType = type( ctypes.Structure )
+PyCSimpleType = type( ctypes.c_int )
 CArgObject = type( ctypes.byref(ctypes.c_int()) )
 
 class _rpythonic_meta_(object):
@@ -120,8 +306,10 @@ class _rpythonic_meta_(object):
 							a = ',' + '=None,'.join( argnames ) + '=None'
 							b = ','.join( argnames )
 						else: a = b = ''
-						lamb = eval( 'lambda self %s: %s( self.POINTER, %s )' %(a,n,b) )
-						setattr( self.__class__, name, lamb )
+						with _RPYTHONIC_LOCK_:		# another thread may have patched the class meanwhile
+							if name not in self.__class__.__dict__:
+								lamb = eval( 'lambda self %s: %s( self.POINTER, %s )' %(a,n,b) )
+								setattr( self.__class__, name, lamb )
 						#return lamb	# this would return the unbound lambda, must call getattr again
 						return getattr( self, name )
 					else:
@@ -139,67 +327,24 @@ class _rpythonic_meta_(object):
 				print( 'possible auto-prefixes available', self._autoprefix_ )
 				raise AttributeError
 
+	@property
+	def _as_parameter_( self ): return self.POINTER		# ctypes takes meta objects as arguments directly
+
 	def __call__(self, type=False):
 		print('calling object is DEPRECATED - use ob.POINTER or ob.CSTRUCT')
 		if type: return self.CSTRUCT
 		else: return self.POINTER
 
 
-def _rpythonic_generate_subclass_( name, struct, functions ):
+def _rpythonic_generate_subclass_( name, struct, functions, prefixes=(), aliases=() ):
+	'''the OO wrapper class of a struct, the prefixes and short names - (alias, name) - come from the generator'''
 	head = 'class %s( _rpythonic_meta_ ):' %name
 	body = [ 
 		'_rpythonic_parent_classes_ = []' ,
 		'_rpythonic_unbound_lookup_ = {}' 
 	]
 
-	names = [ func.name for func in functions ]
-
-	possibles = {}
-	rank = []		# rank by longest name
-	if len(names) > 3000: print('too many functions to use this hack')
-	else:
-		for n1 in names:
-			prefix = ''
-			for i,char in enumerate(n1):
-				prefix += char
-				if prefix not in possibles:
-					possibles[ prefix ] = 0
-					for n2 in names:
-						if n2.startswith( prefix ):
-							possibles[ prefix ] += 1
-
-					if not rank or len(prefix) > len(rank[-1]) and possibles[prefix] > len(names)/4:
-						rank.append( prefix )
-
-	top = []
-	while rank:
-		best = rank.pop()
-		if possibles[best] > len(functions)/2 and best not in names:
-			if best.endswith('_set_') or best.endswith('_get_'): best = best[ : -4 ]
-			elif best.endswith('Set') or best.endswith('Get'): best = best[ : -3 ]
-
-			rem = []
-			for other in rank:
-				if best.startswith(other): rem.append( other )
-			for r in rem: rank.remove( r )
-
-			if best not in top: top.append( best )
-
-		if len(top) > 3: break
-
-	for n in names:		# find shortest prefixes #
-		prefix = ''
-		for i,char in enumerate(n):		# cammelCase
-			if i==0: prefix += char; continue
-			if char.isupper() and len(prefix) >= 2: break
-			prefix += char
-		if prefix and prefix != n and len(prefix) >= 2:
-			hits = 0
-			for other in names:
-				if other.startswith( prefix ): hits += 1
-			if hits >= 2 and prefix not in top:
-				top.append( prefix )
-				if len(top) >= 6: break
+	names = set( [func.name for func in functions] )
 
 	## setup full names
 	for func in functions:
@@ -217,24 +362,22 @@ def _rpythonic_generate_subclass_( name, struct, functions ):
 		#body.append( '%s._rpythonic_function_ = %s' %(func.name, func.name) )
 
 	## setup short names ##
-	for n in names:
-		for prefix in top:
-			if n.startswith(prefix) and n[len(prefix):] not in names:
-				alt = n[ len(prefix) : ]
-				if alt and alt != n and alt not in PYTHON_RESERVED_KEYWORDS and not alt.isdigit() and not alt[0].isdigit():
-					body.append( '%s = %s' %(alt,n) )
-					names.append( alt )
+	for alt, n in aliases:
+		if n in names:		# not for functions missing from the libraries
+			body.append( '%s = %s' %(alt,n) )
+			names.add( alt )
 
 	gen = head + '\n\t' + '\n\t'.join( body )
-	try: exec( gen )
+	ns = {}		# python3 exec can not add to locals()
+	try: exec( gen, globals(), ns )
 	except:
 		print( gen )
 		raise SyntaxError
 
-	klass = locals()[name]
+	klass = ns[name]
 	klass.CSTRUCT = struct	# ctypes struct class
 
-	klass._autoprefix_ = top
+	klass._autoprefix_ = _list( prefixes )
 	for func in functions:
 		unbound = getattr( klass, func.name )
 		klass._rpythonic_unbound_lookup_[ unbound ] = func
@@ -242,134 +385,369 @@ def _rpythonic_generate_subclass_( name, struct, functions ):
 		# klass.longname == klass.shortname = True
 	return klass
 
-def _rpythonic_convert_structs_to_objects():
-	G = globals()
-	for klass in _OOAPI_:
-		altname = name = klass.__name__
-		prefix = ''
-		for i,char in enumerate(name):
-			if i==0: prefix += char; continue
-			if char.isupper(): break
-			prefix += char
-		if prefix and prefix != name:
-			hits = 0
-			for other in _OOAPI_:
-				if other is not klass:
-					if other.__name__.startswith( prefix ): hits += 1
-			if hits >= 2:
-				altname = name[ len(prefix) : ]
-
-		funcs = _OOAPI_[ klass ]
-		newklass = _rpythonic_generate_subclass_( altname, klass, funcs )
-		klass._rpythonic_wrapper_class_ = newklass
+## worked out by the generator, see static_tables in rpythonic.py ##
+_RPYTHONIC_OO_ = []		# (struct, short name, methods, prefixes, [(alias, name)])
+_RPYTHONIC_RETURNS_ = []		# (function, struct it returns a pointer to)
+_RPYTHONIC_ENUM_ALIASES_ = []		# (alias, key of RPYTHONIC_GLOBAL_ENUMS)
+_RPYTHONIC_STRIPPED_ = None		# (new name, name) for the strip prefixes, None when the globals must be scanned
+_RPYTHONIC_WRAPPER_CLASSES_ = {}		# struct name -> OO wrapper class
+
+def _rpythonic_c_function_( name ):		# the metafunc or lazy proxy of a C function, None when the libraries miss it
+	return RPYTHONIC_WRAPPER_FUNCTIONS.get( name ) or RPYTHONIC_LAZY_FUNCTIONS_PENDING.get( name )
+
+def _rpythonic_struct_wrapper_( klass, name, altname, methods, prefixes, aliases ):
+	funcs = [ _rpythonic_c_function_(n) for n in methods ]
+	newklass = _rpythonic_generate_subclass_( altname, klass, [f for f in funcs if f], prefixes, aliases )
+	klass._rpythonic_wrapper_class_ = newklass
+	_RPYTHONIC_WRAPPER_CLASSES_[ name ] = newklass
+	return newklass
+
+def _rpythonic_convert_structs_to_objects( footer=() ):
+	'''replaces the structs with their OO wrapper classes, with lazy structs only those the ctypes footer uses'''
+	G = globals(); D = _RPYTHONIC_DESCRIPTOR_
+	if D is not None and D.lazy:		# the others on first reference, see __getattr__
+		for name, altname, methods, prefixes, aliases in _RPYTHONIC_OO_:
+			D.oo[ name ] = ( altname, methods, prefixes, aliases )
+			if altname not in D.structs: D.altnames.setdefault( altname, name )
+		for name in D.structs:
+			if name in G and G[ name ] is D.classes.get( name ): del G[ name ]		# declared for the function signatures
+		for name in footer:
+			struct = D.lookup( name )
+			if struct: _rpythonic_struct_object_( struct )
+		return
+	classes = dict( [(klass.__name__, klass) for klass in _OOAPI_] )
+	for name, altname, methods, prefixes, aliases in _RPYTHONIC_OO_:
+		if name not in classes: continue
+		newklass = _rpythonic_struct_wrapper_( classes[name], name, altname, methods, prefixes, aliases )
 		G[ name ] = newklass	# replace struct with wrapper
 		if altname not in G: G[ altname ] = newklass	# safely define with nicer name
 		elif altname != name: # odd cases, maybe a function that returns the object, almost never happens.
 			print('WARN - not replacing something with struct wrapper:', G[altname] )
 
 
+class _rpythonic_struct_return_(object):
+	'''return_wrapper of a function returning a pointer to a lazy struct, its OO class is made on the first call'''
+	__slots__ = ( 'struct', )
+	def __init__( self, struct ): self.struct = struct
+	def __call__( self, pointer=None ): return _rpythonic_struct_object_( self.struct )( pointer=pointer )
+
 def _rpythonic_setup_return_wrappers():
-	R = _rpythonic_function_
-	for klass in _OOAPI_:
-		if klass in _OOAPI_RETURNS_OBJECT_:
-			for f in _OOAPI_RETURNS_OBJECT_[klass]:
-				f.object_oriented = True
-				if not f.return_wrapper:	# just in case the ctypes footer had already defined it, do not overwrite
-					f.return_wrapper = klass._rpythonic_wrapper_class_
+	D = _RPYTHONIC_DESCRIPTOR_
+	for name, struct in _RPYTHONIC_RETURNS_:
+		f = _rpythonic_c_function_( name )
+		if f and D is not None and D.lazy and struct in D.oo:
+			f.object_oriented = True
+			if not f.return_wrapper: f.return_wrapper = _rpythonic_struct_return_( struct )
+		elif f and struct in _RPYTHONIC_WRAPPER_CLASSES_:
+			f.object_oriented = True
+			if not f.return_wrapper:	# just in case the ctypes footer had already defined it, do not overwrite
+				f.return_wrapper = _RPYTHONIC_WRAPPER_CLASSES_[ struct ]
 
 
 ###############################################################
 ##						OLD META FUNC						##
 ###############################################################
 def _rpythonic_function_( name, result=ctypes.c_void_p, args=[]):
-	mname = '_metafunc_%s' %name
-	exec( 'class %s( _rpythonic_metafunc_ ): pass' %mname )
-	k = locals()[mname]
-	return k( name, result, args )
+	if RPYTHONIC_LAZY_FUNCTIONS: return _rpythonic_lazyfunc_( name, result, args )
+	return _rpythonic_bind_function_( name, result, args )
+
+def _rpythonic_bind_function_( name, result=ctypes.c_void_p, args=[]):
+	return _rpythonic_metafunc_( name, result, args )
 _OOAPI_ = {}
 _OOAPI_RETURNS_OBJECT_ = {}
-class _rpythonic_metafunc_(object):
+
+def _rpythonic_argnames_( args ):
+	argnames = []
+	for i,arg in enumerate(args):
+		n = arg[0]
+		if n in PYTHON_RESERVED_KEYWORDS: n = 'C_'+n
+		if n in argnames: n = '%s%s' %(n,i)
+		argnames.append( n )
+	return tuple( argnames )
+
+class _rpythonic_lazyfunc_(object):
+	'''
+	a C function that is not bound yet: only the signature is kept, the library lookup, the metafunc class
+	and its __call__ are made on the first call or attribute access, then the module global is replaced.
+	a function missing from the libraries raises AttributeError on first use, instead of being removed at import.
+	'''
+	__slots__ = ( 'name', 'result', 'args', 'argnames', 'return_wrapper', 'object_oriented', 'string_return' )
 	def __init__(self, name, result=ctypes.c_void_p, args=[]):
 		self.name = name
 		self.result = result
-		self.argtypes = []		# can dynamically change CFUNCTYPE trick
-		self.argnames = []
-		self.argtypestypes = []
-		for i,arg in enumerate(args):
-			n,t = arg
-			if n in PYTHON_RESERVED_KEYWORDS: n = 'C_'+n
-			if n in self.argnames: n = '%s%s' %(n,i)
-			self.argnames.append( n )
-			self.argtypes.append( t )
-			self.argtypestypes.append( type(t) )		# precomputed for speed
-
-		self.argnames = tuple( self.argnames )				# should never change
-		self.numargs = len( self.argtypes )
-		self.callbacks = [None] * self.numargs
+		self.args = args
+		self.return_wrapper = None
+		self.object_oriented = False
+		self.string_return = None		# arguments of return_string, applied when bound
+		RPYTHONIC_LAZY_FUNCTIONS_PENDING[ name ] = self
+		if args is None: return		# signature and OO API from the wrapper descriptor
+		self.argnames = _rpythonic_argnames_( args )
+		## the OO API is made at import, so register like _rpythonic_metafunc_.reset ##
+		if type( result ) is PyCPointerType and type(result._type_) is PyCStructType:
+			_OOAPI_RETURNS_OBJECT_.setdefault( result._type_, [] ).append( self )
+		if args and type(args[0][1]) is PyCPointerType and type(args[0][1]._type_) is PyCStructType:
+			_OOAPI_.setdefault( args[0][1]._type_, [] ).append( self )
+
+	def _bind_( self ):
+		G = globals()
+		func = G.get( self.name )
+		if func is None or func is self or isinstance(func, _rpythonic_lazyfunc_):
+			with _RPYTHONIC_LOCK_:		# once, another thread may have bound it meanwhile
+				func = G.get( self.name )
+				if func is None or func is self or isinstance(func, _rpythonic_lazyfunc_): func = self._bind_locked_()
+		return func
+
+	def _bind_locked_( self ):
+		G = globals(); D = _RPYTHONIC_DESCRIPTOR_
+		if self.args is None:
+			self.result, self.args = D.signature( self.name )
+			if D.lazy: _rpythonic_freeze_structs_()		# also the structs passed by value
+		func = _rpythonic_bind_function_( self.name, self.result, self.args )
+		RPYTHONIC_LAZY_FUNCTIONS_PENDING.pop( self.name, None )
+		if not func.function:
+			G.pop( self.name, None )
+			raise AttributeError( 'C function not found in the loaded libraries: %s' %self.name )
+		if D is not None and D.lazy and self.name in D.returns and not self.return_wrapper:
+			self.return_wrapper = _rpythonic_struct_object_( D.returns[self.name] )		# like _rpythonic_setup_return_wrappers
+			self.object_oriented = True
+		func.return_wrapper = self.return_wrapper
+		func.object_oriented = self.object_oriented
+		if self.string_return: func.return_string( *self.string_return )
+		G[ self.name ] = func
+		return func
+
+	def return_string( self, encoding='utf-8', ownership='borrowed' ):		# from footers, without binding at import
+		self.string_return = ( encoding, ownership )
+		func = globals().get( self.name )
+		if isinstance( func, _rpythonic_metafunc_ ): func.return_string( encoding, ownership )		# bound already
+
+	def __call__( self, *args, **kw ): return self._bind_()( *args, **kw )
+	def __getattr__( self, name ):
+		if name == 'argnames':		# only the names, the OO API needs them at import
+			self.argnames = _rpythonic_argnames_( _RPYTHONIC_DESCRIPTOR_.function(self.name)[1] )
+			return self.argnames
+		return getattr( self._bind_(), name )
+	def __repr__( self ): return '<lazy C function %s>' %self.name
+
+###############################################################
+##						SIGNATURES							##
+###############################################################
+## C functions declared alike share one signature record: result, argument types, names and defaults,
+## and all functions with the same argument types share one metafunc class, its __call__ is their stub.
+_RPYTHONIC_SIGNATURES_ = {}		# (result, argtypes, argnames) -> _rpythonic_signature_
+_RPYTHONIC_ARGTYPES_ = {}		# argtypes -> (argtypestypes, defaults, metafunc class)
+
+class _rpythonic_signature_(object):
+	__slots__ = ( 'result', 'argtypes', 'argtypestypes', 'argnames', 'numargs', 'defaults', 'klass', 'shared', 'pins' )
+	def __init__( self, result, argtypes, argtypestypes, argnames, defaults, klass, shared=True, pins=None ):
+		self.result = result
+		self.argtypes = argtypes
+		self.argtypestypes = argtypestypes		# precomputed for speed
+		self.argnames = argnames		# should never change
+		self.numargs = len( argtypes )
+		self.defaults = defaults
+		self.klass = klass
+		self.shared = shared		# interned, a function changing it gets its own copy first
+		if pins is None: pins = _rpythonic_has_destroy_notify_( argnames, argtypestypes )
+		self.pins = pins		# python callables stay registered after the call, see _rpythonic_callback_
+
+def _rpythonic_has_destroy_notify_( argnames, argtypestypes ):		# C keeps the other function pointers until it calls this one
+	for n,kt in zip( argnames, argtypestypes ):
+		if kt is PyCFuncPtrType and ( 'destroy' in n.lower() or 'notify' in n.lower() ): return True
+	return False
+
+def _rpythonic_argument_defaults_( argtypes ):
+	defaults = []
+	for T in argtypes:
+		if type(T) is PyCFuncPtrType: defaults.append( T() )	# func pointers can not be None
+		elif T in (ctypes.c_int, ctypes.c_uint, ctypes.c_long, ctypes.c_ulong): defaults.append( 0 )
+		elif T in (ctypes.c_float, ctypes.c_double): defaults.append( .0 )
+		else: defaults.append( None )	# None is allowed for all other types
+	return tuple( defaults )
+
+def _rpythonic_signature_get_( result, args ):
+	argtypes = tuple( [ t for n,t in args ] )
+	argnames = _rpythonic_argnames_( args )
+	key = ( result, argtypes, argnames )
+	sig = _RPYTHONIC_SIGNATURES_.get( key )
+	if sig is None:
+		if argtypes not in _RPYTHONIC_ARGTYPES_:
+			defaults = _rpythonic_argument_defaults_( argtypes )
+			klass = type( '_metafunc_%s' %len(_RPYTHONIC_ARGTYPES_), (_rpythonic_metafunc_,), {'__slots__':()} )
+			klass.__call__ = _rpythonic_stub_( argtypes, defaults )
+			_RPYTHONIC_ARGTYPES_[ argtypes ] = ( tuple( [type(t) for t in argtypes] ), defaults, klass )
+		argtypestypes, defaults, klass = _RPYTHONIC_ARGTYPES_[ argtypes ]
+		sig = _RPYTHONIC_SIGNATURES_[ key ] = _rpythonic_signature_( result, argtypes, argtypestypes, argnames, defaults, klass )
+	return sig
+
+class _rpythonic_shared_defaults_(object):
+	'''defaults of an interned signature, read in place, the first change gives the function its own signature'''
+	__slots__ = ( 'func', )
+	def __init__( self, func ): self.func = func
+	def __getitem__( self, index ): return self.func.signature.defaults[ index ]
+	def __setitem__( self, index, value ): self.func._own_signature_().defaults[ index ] = value
+	def __len__( self ): return len( self.func.signature.defaults )
+	def __iter__( self ): return iter( self.func.signature.defaults )
+	def __eq__( self, other ): return _list( self ) == _list( other )
+	def __ne__( self, other ): return not self == other
+	def __repr__( self ): return repr( _list(self) )
+
+class _rpythonic_defaults_(list):
+	'''the defaults of a function with its own signature, changing one recompiles the stub on the next call'''
+	__slots__ = ( 'klass', )
+	def __setitem__( self, index, value ):
+		with _RPYTHONIC_LOCK_:		# not lost to a stub built from the old defaults
+			list.__setitem__( self, index, value )
+			self.klass.__call__ = _rpythonic_restub_
+
+def _rpythonic_restub_( self, *args, **kw ):
+	sig = self.signature
+	with _RPYTHONIC_LOCK_:
+		if sig.klass.__dict__.get( '__call__' ) is _rpythonic_restub_:		# not built by another thread meanwhile
+			sig.klass.__call__ = _rpythonic_stub_( sig.argtypes, sig.defaults )
+	return self( *args, **kw )
+
+class _rpythonic_metafunc_(object):
+	__slots__ = ( 'name', 'signature', 'function', 'return_wrapper', 'object_oriented', 'restype' )
+	def __init__(self, name, result=ctypes.c_void_p, args=[]):
+		self.name = name
+		self.signature = sig = _rpythonic_signature_get_( result, args )
 		self.return_wrapper = None
+		self.restype = None		# set by return_string, else the result of the signature
 		self.object_oriented = False
 		self.function = None
-		for cdll in _CTYPES_CDLLS:	# functions could be multiple libraries
-			if hasattr(cdll, self.name):
+		cdll = _rpythonic_symbol_library_( name )	# functions could be multiple libraries
+		if cdll is not None:
+			if RPYTHONIC_HOLD_GIL and name in _RPYTHONIC_GIL_HOLDING_: cdll = _rpythonic_pydll_( cdll )
+			try:
 				func = self.function = getattr(cdll, self.name )
 				RPYTHONIC_WRAPPER_FUNCTIONS[ name ] = self
-				break
+			except AttributeError: pass
 		if not self.function:
 			RPYTHONIC_WRAPPER_FUNCTIONS_FAILURES.append( name )
 
-		if self.function: self.reset()
+		if self.function:
+			self.__class__ = sig.klass		# __call__ is the stub for these argument types
+			self.reset()
+
+	## the signature, read only unless the function gets its own ##
+	result = property( lambda self: self.signature.result )
+	argtypes = property( lambda self: self.signature.argtypes )
+	argtypestypes = property( lambda self: self.signature.argtypestypes )
+	argnames = property( lambda self: self.signature.argnames )
+	numargs = property( lambda self: self.signature.numargs )
+	@property
+	def defaults( self ):		# footers change the defaults of one function
+		sig = self.signature
+		if sig.shared: return _rpythonic_shared_defaults_( self )		# reading keeps the interned signature
+		return sig.defaults
+
+	def _own_signature_( self ):
+		if self.signature.shared:
+			with _RPYTHONIC_LOCK_:
+				sig = self.signature
+				if sig.shared:		# not made by another thread meanwhile
+					klass = type( '_metafunc_%s' %self.name, (_rpythonic_metafunc_,), {'__slots__':()} )
+					defaults = _rpythonic_defaults_( sig.defaults )
+					defaults.klass = klass
+					self.signature = _rpythonic_signature_( sig.result, _list(sig.argtypes), _list(sig.argtypestypes), sig.argnames, defaults, klass, False, sig.pins )
+					klass.__call__ = _rpythonic_restub_
+					self.__class__ = klass
+		return self.signature
 
 	def change_argument_type( self, name, t ):
-		idx = self.argnames.index( name )
-		self.argtypes[ idx ] = t
-		self.argtypestypes[ idx ] = type(t)
-		self.function.argtypes = self.argtypes
+		with _RPYTHONIC_LOCK_:		# a new signature, calls in flight keep the old one
+			sig = self._own_signature_()
+			idx = sig.argnames.index( name )
+			argtypes = _list( sig.argtypes ); argtypes[ idx ] = t
+			argtypestypes = _list( sig.argtypestypes ); argtypestypes[ idx ] = type(t)
+			self.signature = _rpythonic_signature_( sig.result, argtypes, argtypestypes, sig.argnames, sig.defaults, sig.klass, False, sig.pins )
+			self.function.argtypes = argtypes
+			sig.klass.__call__ = _rpythonic_restub_
+
+	def pin_callbacks( self, pin=True ):
+		'''keep the trampolines of python callables passed to this function registered until released, for C that stores them'''
+		with _RPYTHONIC_LOCK_: self._own_signature_().pins = pin
+
+	holds_gil = property( lambda self: bool( self.function and self.function._flags_ & ctypes._FUNCFLAG_PYTHONAPI ) )
+
+	def hold_gil( self, hold=True ):
+		'''call through a PyDLL handle that keeps the GIL, for trivial functions, or through the CDLL that releases it'''
+		cdll = _rpythonic_symbol_library_( self.name )
+		if cdll is not None and self.function:		# footers run before missing functions are cleaned up
+			func = getattr( hold and _rpythonic_pydll_(cdll) or cdll, self.name )
+			func.restype = self.function.restype
+			func.argtypes = self.function.argtypes
+			self.function = func
+
+	def return_string( self, encoding='utf-8', ownership='borrowed' ):
+		'''
+		convert a char* result to a python string, bytes when encoding is None.
+		ownership is borrowed, or the name of the C function that frees the result after the copy: g_free, free.
+		'''
+		if ownership == 'borrowed':
+			self.restype = ctypes.c_char_p		# ctypes copies the bytes
+			self.return_wrapper = encoding and _rpythonic_string_return_( encoding ) or None
+		else:
+			self.restype = ctypes.c_void_p		# the address, to free it
+			self.return_wrapper = _rpythonic_string_return_( encoding, ownership )
+		if self.function: self.function.restype = self.restype		# footers run before missing functions are cleaned up
+
+	def batch( self, *columns ):
+		'''
+		call the function once per row of the argument columns and return the results as an array, None for void.
+		a column is a list, tuple or buffer (array.array, numpy, ...) of the argument type, or a number used for every row.
+		the loop runs in a C shim compiled on first use (see _rpythonic_batch_shim_), else in python with ctypes.
+		'''
+		return _rpythonic_batch_( self, columns )
+
+	def submit( self, *args, **kw ):
+		'''
+		call in a worker thread of the module executor and return a concurrent.futures.Future of the result.
+		the arguments are kept alive until the call is done, python callables included.
+		'''
+		return _rpythonic_submit_( self, args, kw )
+
+	def acall( self, *args, **kw ):
+		'''submit for asyncio: await func.acall(...) in a coroutine, the event loop keeps running during the call'''
+		import asyncio
+		return asyncio.wrap_future( _rpythonic_submit_( self, args, kw ) )
 
 	def reset(self):
-		if self.argnames:
-			a = ',' + '=None,'.join( self.argnames ) + '=None'
-			b = ','.join( self.argnames )
-		else: a = b = ''
+		sig = self.signature
+		self.function.restype = self.restype or sig.result
+		self.function.argtypes = sig.argtypes
 
-		callmeth = eval( 'lambda self %s: self._call_( %s )' %(a,b) )
-		setattr( self.__class__, '__call__', callmeth )
-
-		self.function.restype = self.result
-		self.function.argtypes = self.argtypes
-
-		if type( self.result ) is PyCPointerType and type(self.result._type_) is PyCStructType:
-			klass = self.result._type_
+		if type( sig.result ) is PyCPointerType and type(sig.result._type_) is PyCStructType:
+			klass = sig.result._type_
 			if klass not in _OOAPI_RETURNS_OBJECT_: _OOAPI_RETURNS_OBJECT_[klass] = []
 			_OOAPI_RETURNS_OBJECT_[klass].append( self )
 
-		self.defaults = []
-		for i in range( self.numargs ):
-			T = self.argtypes[ i ]
-			if type(T) is PyCFuncPtrType:
-				p = T()	# func pointers can not be None
-				self.defaults.append( p )
-				self.callbacks[ i ] = p					# save reference
-			elif T in (ctypes.c_int, ctypes.c_uint, ctypes.c_long, ctypes.c_ulong):
-				self.defaults.append( 0 )
-			elif T in (ctypes.c_float, ctypes.c_double):
-				self.defaults.append( .0 )
-			else: self.defaults.append( None )	# None is allowed for all other types
-
-			## generate OO API ##
-			if i == 0 and type(T) is PyCPointerType and type(T._type_) is PyCStructType:
+		## generate OO API ##
+		if sig.numargs:
+			T = sig.argtypes[ 0 ]
+			if type(T) is PyCPointerType and type(T._type_) is PyCStructType:
 				klass = T._type_
 				if klass not in _OOAPI_: _OOAPI_[ klass ] = []
 				_OOAPI_[ klass ].append( self )
 
-	def _call_( self, *args ):			# allow flexible calling types
-		cargs = _list( self.defaults )
+	def _call_kw_( self, args, kw ):		# calls by argument name take the generic path
+		args = _list( args )
+		for name in kw:
+			if name not in self.argnames: raise TypeError( '%s() got an unexpected keyword argument %s' %(self.name, name) )
+			args[ self.argnames.index(name) ] = kw[ name ]
+		return self._call_( *args )
+
+	def _call_( self, *args ):			# allow flexible calling types, the stubs fall back to this
+		sig = self.signature
+		cargs = _list( sig.defaults )
 		for i,arg in enumerate(args):
 			if isinstance( arg, _rpythonic_meta_ ): arg = arg.POINTER
 			elif hasattr( arg, '_rpythonic_' ): arg = arg.POINTER		# workaround - instance from another module
 
 			t = type(arg)
-			k = self.argtypes[ i ]
-			kt = self.argtypestypes[ i ]
+			k = sig.argtypes[ i ]
+			kt = sig.argtypestypes[ i ]
 			if arg is None and cargs[i] is not None:	# use user defaults, very rare cases
 				continue
 
@@ -400,22 +778,503 @@ class _rpythonic_metafunc_(object):
 					ptr = ctypes.create_string_buffer(arg)				# correct and pypy compatible
 				elif t in (PyCStructType, PyCArrayType):
 					ptr = ctypes.cast( ctypes.pointer( arg ), k )
+				elif isinstance( arg, _CDATA_ ): ptr = arg
 				else:
-					ptr = arg	# TODO print warning?
+					ptr = _rpythonic_buffer_argument_( k, arg )		# bytearray, array.array, numpy, ...
+					if ptr is None: ptr = arg	# TODO print warning?
 				cargs[ i ] = ptr
 
+			elif kt is PyCArrayType and not isinstance( arg, _CDATA_ ):
+				buff = _rpythonic_buffer_argument_( k, arg )
+				if buff is None: cargs[ i ] = arg
+				else: cargs[ i ] = buff
+
 			elif kt is PyCFuncPtrType:
-				if t.__name__ == 'CFunctionType': cargs[ i ] = arg		# assume outside holds pointer
-				else:													# this is not safe #
-					cargs[ i ] = self.callbacks[ i ] = k( arg )				# assume arg is a callable
+				if isinstance( arg, ctypes._CFuncPtr ):		# assume outside holds pointer
+					if t is not k: arg = ctypes.cast( arg, k )
+					cargs[ i ] = arg
+				else: cargs[ i ] = _rpythonic_callback_( arg, k, sig.pins )		# assume arg is a callable, cargs holds it for the call
 			else:
 				cargs[ i ] = arg		# directly pass
 
 		## if you define your own return_wrapper, it must take keyword "pointer"
-		if self.return_wrapper: return self.return_wrapper( pointer=self.function( *cargs ) )
-		else: return self.function( *cargs )
+		if _RPYTHONIC_PROFILING_:
+			t = _clock_(); r = self.function( *cargs )
+			_rpythonic_profile_c_( self.name, _clock_() - t )
+		else: r = self.function( *cargs )
+		if self.return_wrapper: return self.return_wrapper( pointer=r )
+		else: return r
+
+
+
+###############################################################
+##						CALL STUBS							##
+###############################################################
+## __call__ of a metafunc class is a stub specialized for its argument types, stubs are compiled once per signature shape.
+## a stub passes the arguments straight to the ctypes function, only char pointers get a python string or bytes copied first,
+## anything ctypes rejects (meta objects, lists, callables, other pointer types, None for numbers) takes _call_ instead.
+_RPYTHONIC_STUBS_ = {}		# shape -> stub factory
+_ArgumentError = ctypes.ArgumentError
+_str_ = str
+_bytes_ = bytes
+_CHAR_POINTERS_ = ( ctypes.POINTER(ctypes.c_char), ctypes.c_char_p )
+
+def _rpythonic_string_buffer_( s ):
+	if not _ISPYTHON2: s = s.encode('utf-8')	# encode to ascii in python3
+	return ctypes.create_string_buffer( s )		# correct and pypy compatible
+
+def _rpythonic_bytes_buffer_( b ):		# ctypes would pass the immutable bytes by address, see BUFFER ARGUMENTS
+	if RPYTHONIC_STRICT_BUFFERS: raise BufferError( 'a read-only buffer would be copied for a char pointer' )
+	return ctypes.create_string_buffer( b )
+
+def _rpythonic_stub_shape_( argtypes ):
+	return tuple( [ T in _CHAR_POINTERS_ and 'c' or 'v' for T in argtypes ] )
+
+def _rpythonic_stub_source_( shape, profile=False ):
+	n = len( shape )
+	args = ''.join( [ 'a%s, ' %i for i in range(n) ] )
+	params = ''.join( [ ', a%s=d%s' %(i,i) for i in range(n) ] )
+	defaults = ''.join( [ ', d%s' %i for i in range(n) ] )
+	strings = []
+	for i, code in enumerate( shape ):
+		if code == 'c': strings += [
+			'		if a%s.__class__ is _str_: a%s = _rpythonic_string_buffer_( a%s )' %(i,i,i),
+			'		elif a%s.__class__ is _bytes_: a%s = _rpythonic_bytes_buffer_( a%s )' %(i,i,i),
+		]
+	if profile:		# the same with the wall time of the call and of the C function, see _rpythonic_profile_
+		return '\n'.join( [
+			'def _make_stub_( %s ):' %defaults[2:],
+			'	def __call__( self%s, **kw ):' %params,
+			'		t0 = _clock_()',
+			'		if kw: r = self._call_kw_( (%s), kw )' %args,
+			'		else:',
+		] + [ '	' + line for line in strings ] + [
+			'			t1 = _clock_()',
+			'			try: r = self.function( %s )' %args,
+			'			except _ArgumentError: r = _ArgumentError',
+			'			t2 = _clock_()',
+			'			if r is _ArgumentError: r = self._call_( %s )' %args,
+			'			else:',
+			'				_rpythonic_profile_c_( self.name, t2 - t1 )',
+			'				if self.return_wrapper: r = self.return_wrapper( pointer=r )',
+			'		_rpythonic_profile_call_( self.name, _clock_() - t0 )',
+			'		return r',
+			'	return __call__',
+		] )
+	return '\n'.join( [
+		'def _make_stub_( %s ):' %defaults[2:],
+		'	def __call__( self%s, **kw ):' %params,
+		'		if kw: return self._call_kw_( (%s), kw )' %args,
+	] + strings + [
+		'		try: r = self.function( %s )' %args,
+		'		except _ArgumentError: r = _ArgumentError',		# outside the except, errors of _call_ do not chain
+		'		if r is _ArgumentError: return self._call_( %s )' %args,
+		'		if self.return_wrapper: return self.return_wrapper( pointer=r )',
+		'		return r',
+		'	return __call__',
+	] )
+
+def _rpythonic_stub_( argtypes, defaults ):
+	shape = _rpythonic_stub_shape_( argtypes )
+	key = _RPYTHONIC_PROFILING_ and ('profile',) + shape or shape
+	if key not in _RPYTHONIC_STUBS_:
+		ns = {}
+		exec( _rpythonic_stub_source_( shape, _RPYTHONIC_PROFILING_ ), globals(), ns )
+		_RPYTHONIC_STUBS_[ key ] = ns[ '_make_stub_' ]
+	return _RPYTHONIC_STUBS_[ key ]( *defaults )
+
+
+###############################################################
+##						PROFILER							##
+###############################################################
+## call count, total and max wall time, and the part spent in the C function of each wrapped function, the rest is
+## marshalling in python. off by default and free then: enabling rebuilds the call stubs of the module with timing,
+## disabling puts the plain ones back. RPYTHONIC_PROFILE=1 enables it at import in every wrapper module.
+## counts are not locked, calls racing from several threads can be lost.
+RPYTHONIC_PROFILE = __os.environ.get( 'RPYTHONIC_PROFILE', '0' ) not in ('', '0')
+_RPYTHONIC_PROFILING_ = RPYTHONIC_PROFILE
+_RPYTHONIC_PROFILE_ = {}		# name -> [calls, total, max, C time], seconds
+_clock_ = getattr( time, 'perf_counter', time.time )
+
+def _rpythonic_profile_entry_( name ):
+	return _RPYTHONIC_PROFILE_.setdefault( name, [ 0, 0.0, 0.0, 0.0 ] )		# one entry when threads race
+
+def _rpythonic_profile_call_( name, t ):
+	e = _RPYTHONIC_PROFILE_.get( name ) or _rpythonic_profile_entry_( name )
+	e[0] += 1; e[1] += t
+	if t > e[2]: e[2] = t
+
+def _rpythonic_profile_c_( name, t ):
+	e = _RPYTHONIC_PROFILE_.get( name ) or _rpythonic_profile_entry_( name )
+	e[3] += t
+
+def _rpythonic_profile_( enable=True, everywhere=False, reset=False ):
+	'''
+	profile the calls of the functions of this module, or of every loaded wrapper module when everywhere is true.
+	reset clears the counts so far. see _rpythonic_profile_stats_, _rpythonic_profile_pstats_ and _rpythonic_profile_json_
+	'''
+	global _RPYTHONIC_PROFILING_
+	if everywhere:
+		for mod in _list( sys.modules.values() ):
+			func = getattr( mod, '__dict__', {} ).get( '_rpythonic_profile_' )
+			if func is not None and func is not _rpythonic_profile_: func( enable, reset=reset )
+	if reset: _RPYTHONIC_PROFILE_.clear()
+	with _RPYTHONIC_LOCK_:
+		_RPYTHONIC_PROFILING_ = bool( enable )
+		for func in _list( RPYTHONIC_WRAPPER_FUNCTIONS.values() ):
+			func.signature.klass.__call__ = _rpythonic_restub_		# the next call builds the stub for the new mode
+
+def _rpythonic_profile_stats_():
+	'''name -> dict of calls, total, max, c and marshal, in seconds'''
+	stats = {}
+	for name, (calls, total, longest, c) in _list( _RPYTHONIC_PROFILE_.items() ):
+		stats[ name ] = { 'calls':calls, 'total':total, 'max':longest, 'c':c, 'marshal':max(total - c, 0.0) }
+	return stats
+
+def _rpythonic_profile_json_( path=None ):
+	'''the stats as a flat JSON table, one row per function, the most total time first. written to path if given'''
+	import json
+	rows = [ dict( name=name, **s ) for name, s in _rpythonic_profile_stats_().items() ]
+	rows.sort( key=lambda row: -row['total'] )
+	data = json.dumps( rows, indent=1, sort_keys=True )
+	if path: open( path, 'w' ).write( data )
+	return data
+
+class _rpythonic_profile_pstats_source_(object):		# what pstats.Stats loads from a profiler
+	def create_stats( self ):
+		self.stats = {}
+		for name, s in _rpythonic_profile_stats_().items():
+			n = s['calls']
+			key = ( __file__, 0, name )		# tottime is the marshalling, cumtime the whole call
+			self.stats[ key ] = ( n, n, s['marshal'], s['total'], {} )
+			self.stats[ ('~', 0, '<C function %s>' %name) ] = ( n, n, s['c'], s['c'], {key:(n, n, s['c'], s['c'])} )
+
+def _rpythonic_profile_pstats_( path=None ):
+	'''the stats as a pstats.Stats, dumped to path if given, for pstats and the tools that read cProfile output'''
+	import pstats
+	stats = pstats.Stats( _rpythonic_profile_pstats_source_() )
+	if path: stats.dump_stats( path )
+	return stats
+
+
+###############################################################
+##						BUFFER ARGUMENTS					##
+###############################################################
+## objects with the buffer protocol (bytearray, memoryview, array.array, numpy arrays) are passed to pointer and
+## array parameters without copying, items must have the size of the C type, any size for void pointers.
+## read-only (bytes too) and non-contiguous buffers are copied first, or raise BufferError when RPYTHONIC_STRICT_BUFFERS is set.
+RPYTHONIC_STRICT_BUFFERS = __os.environ.get( 'RPYTHONIC_STRICT_BUFFERS', '0' ) not in ('', '0')
+_CDATA_ = ( ctypes.Array, ctypes.Structure, ctypes.Union, ctypes._SimpleCData )
+_FLOAT_CODES_ = 'efdg'
+
+def _rpythonic_buffer_layout_( m ):		# size in bytes and C contiguity, python2 memoryviews have neither attribute
+	nbytes = m.itemsize; contiguous = True
+	for dim, stride in _list( zip( m.shape or (), m.strides or () ) )[::-1]:
+		if dim > 1 and stride != nbytes: contiguous = False
+		nbytes *= dim
+	return nbytes, contiguous
+
+def _rpythonic_buffer_argument_( k, arg ):
+	try: m = memoryview( arg )
+	except TypeError: return None		# no buffer protocol
+	T = k._type_
+	if T is not ctypes.c_void_p:
+		if m.itemsize != ctypes.sizeof( T ):
+			raise TypeError( 'buffer items of %s bytes can not be passed as %s' %(m.itemsize, k.__name__) )
+		code = getattr( T, '_type_', None )
+		if isinstance( code, _str_ ) and (m.format[-1:] in _FLOAT_CODES_) != (code in _FLOAT_CODES_):
+			raise TypeError( 'buffer of format %s can not be passed as %s' %(m.format, k.__name__) )
+	nbytes, contiguous = _rpythonic_buffer_layout_( m )
+	if type(k) is PyCArrayType and nbytes < ctypes.sizeof( k ):
+		raise ValueError( 'buffer of %s bytes is too small for %s' %(nbytes, k.__name__) )
+
+	if contiguous and not m.readonly:
+		try:
+			if type(k) is PyCArrayType: return k.from_buffer( arg )
+			return ctypes.cast( (ctypes.c_char * nbytes).from_buffer( arg ), k )
+		except TypeError: pass		# python2 memoryview, no old style buffer
+	if RPYTHONIC_STRICT_BUFFERS:
+		raise BufferError( 'a %s buffer would be copied for %s' %(m.readonly and 'read-only' or 'non-contiguous', k.__name__) )
+	data = m.tobytes()		# contiguous copy
+	if type(k) is PyCArrayType: return k.from_buffer_copy( data )
+	return ctypes.cast( ctypes.create_string_buffer( data ), k )		# with a null byte, for char pointers
+
+
+###############################################################
+##						STRING RETURNS						##
+###############################################################
+## return_wrapper of the functions set by _rpythonic_metafunc_.return_string, shared per encoding and ownership
+_RPYTHONIC_STRING_RETURNS_ = {}		# (encoding, ownership) -> _rpythonic_string_return_
+
+def _rpythonic_free_function_( name ):
+	cdll = _rpythonic_symbol_library_( name, _CTYPES_CDLLS + [ ctypes.pythonapi ] )		# then the symbols of the process, libc on posix
+	if cdll is not None:
+		func = cdll[ name ]		# a new function object, the cached one has the wrapper argtypes
+		func.argtypes = [ ctypes.c_void_p ]
+		func.restype = None
+		return func
+	raise AttributeError( 'C function not found in the loaded libraries: %s' %name )
+
+def _rpythonic_string_return_( encoding='utf-8', ownership='borrowed' ):
+	key = ( encoding, ownership )
+	if key not in _RPYTHONIC_STRING_RETURNS_:
+		if ownership == 'borrowed': w = _rpythonic_borrowed_string_( encoding )
+		else: w = _rpythonic_owned_string_( encoding, _rpythonic_free_function_( ownership ) )
+		_RPYTHONIC_STRING_RETURNS_[ key ] = w
+	return _RPYTHONIC_STRING_RETURNS_[ key ]
+
+class _rpythonic_borrowed_string_(object):		# the function returns c_char_p bytes
+	__slots__ = ( 'encoding', )
+	def __init__( self, encoding ): self.encoding = encoding
+	def __call__( self, pointer=None ):
+		if pointer is None: return None
+		return pointer.decode( self.encoding )
+
+class _rpythonic_owned_string_(object):		# the function returns the c_void_p address
+	__slots__ = ( 'encoding', 'free' )
+	def __init__( self, encoding, free ):
+		self.encoding = encoding
+		self.free = free
+	def __call__( self, pointer=None ):
+		if pointer is None: return None
+		s = ctypes.string_at( pointer )
+		self.free( pointer )
+		if self.encoding: return s.decode( self.encoding )
+		return s
+
+
+###############################################################
+##						BATCHED CALLS						##
+###############################################################
+## _rpythonic_metafunc_.batch: one C shim per signature takes the function pointer and a pointer and stride per column,
+## compiled quietly with gcc into rpythonic's CACHEDIR/clibs, functions declared alike share it.
+## numbers, bools and pointers only, pointers as addresses; other types, or no gcc, loop with ctypes.
+_RPYTHONIC_BATCH_SHIMS_ = {}		# shim name -> ctypes function, None to loop in python
+_BATCH_CTYPES_ = {
+	'c':'char', 'b':'signed char', 'B':'unsigned char', 'h':'short', 'H':'unsigned short', 'i':'int', 'I':'unsigned int',
+	'l':'long', 'L':'unsigned long', 'q':'long long', 'Q':'unsigned long long', 'f':'float', 'd':'double', '?':'_Bool',
+}
+_BATCH_ARRAYS_ = { 'c':'b', 'o':'B' }		# array.array typecode of the results, else the code
+_BATCH_STORAGE_ = { 'c':ctypes.c_byte, 'p':ctypes.c_size_t }		# numbers for chars, pointers as addresses
+_BATCH_NUMBERS_ = ( int, float )
+if _ISPYTHON2: _BATCH_NUMBERS_ += ( long, )
+
+def _rpythonic_batch_type_( T ):		# code and C type of an argument or result, None when not batchable
+	if T is None: return 'v', 'void'
+	if type(T) is PyCPointerType or T in (ctypes.c_void_p, ctypes.c_char_p): return 'p', 'void *'
+	code = getattr( T, '_type_', None )
+	if type(T) is PyCSimpleType and code in _BATCH_CTYPES_: return code.replace('?','o'), _BATCH_CTYPES_[ code ]
+	return None
+
+def _rpythonic_batch_source_( name, result, args ):
+	params = ''.join( [ ', void *c%s, long s%s' %(i,i) for i in range(len(args)) ] )
+	call = '((%s (*)(%s))f)( %s )' %( result, ', '.join(args), ', '.join( [ '((%s*)c%s)[i*s%s]' %(t,i,i) for i,t in enumerate(args) ] ) )
+	if result != 'void': call = '((%s*)out)[i] = %s' %(result, call)
+	return '\n'.join( [
+		'void %s( void *f, long n, void *out%s ) {' %(name, params),
+		'	long i;',
+		'	for (i = 0; i < n; i++) %s;' %call,
+		'}', '',
+	] )
+
+def _rpythonic_batch_path_( name ):		# GCC.library_path of a loaded generator, else of its default CACHEDIR
+	gen = __sys.modules.get( 'rpythonic' )
+	if hasattr( gen, 'GCC' ): return gen.GCC.library_path( name )
+	if IS32BIT: cachepath = __os.path.join( _rpythonic_cache_dir_(), 'clibs/linux32' )
+	else: cachepath = __os.path.join( _rpythonic_cache_dir_(), 'clibs/linux64' )
+	return __os.path.join( cachepath, 'lib%s.so'%name )
+
+def _rpythonic_batch_compile_( name, source, path ):		# quiet gcc in a private directory next to path, renamed into place
+	import tempfile, shutil, subprocess
+	folder = __os.path.dirname( path )
+	if not __os.path.isdir( folder ):
+		try: __os.makedirs( folder )
+		except OSError:
+			if not __os.path.isdir( folder ): raise
+	tmp = tempfile.mkdtemp( prefix='.%s-' %name, dir=folder )
+	try:
+		src = __os.path.join( tmp, '%s.c' %name )
+		lib = __os.path.join( tmp, __os.path.basename(path) )
+		open( src, 'w' ).write( source )
+		null = open( __os.devnull, 'w' )
+		try: subprocess.check_call( ['gcc', '-O2', '-shared', '-fPIC', '-o', lib, src], stdout=null, stderr=null )
+		finally: null.close()
+		__os.rename( lib, path )		# atomic, other processes see the whole library or none
+	finally: shutil.rmtree( tmp, ignore_errors=True )
+
+def _rpythonic_batch_shim_( types ):
+	name = 'rpythonic_batch_%s_%s' %( types[0][0], ''.join( [ code for code,ctype in types[1:] ] ) )
+	if name not in _RPYTHONIC_BATCH_SHIMS_:
+		with _RPYTHONIC_LOCK_:
+			if name not in _RPYTHONIC_BATCH_SHIMS_:
+				try:
+					path = _rpythonic_batch_path_( name )
+					if not __os.path.isfile( path ):
+						_rpythonic_batch_compile_( name, _rpythonic_batch_source_( name, types[0][1], [ctype for code,ctype in types[1:]] ), path )
+					shim = getattr( ctypes.CDLL( path ), name )
+					shim.argtypes = [ ctypes.c_void_p, ctypes.c_long, ctypes.c_void_p ] + [ ctypes.c_void_p, ctypes.c_long ] * (len(types)-1)
+					shim.restype = None
+				except Exception: shim = None		# no gcc, linker or writable cache
+				_RPYTHONIC_BATCH_SHIMS_[ name ] = shim
+	return _RPYTHONIC_BATCH_SHIMS_[ name ]
+
+def _rpythonic_address_( arg ):
+	if arg is None: return 0
+	if isinstance( arg, _rpythonic_meta_ ) or hasattr( arg, '_rpythonic_' ): arg = arg.POINTER
+	if isinstance( arg, (ctypes.Structure, ctypes.Union) ): return ctypes.addressof( arg )
+	if isinstance( arg, _CDATA_ + (ctypes._Pointer,) ): return ctypes.cast( arg, ctypes.c_void_p ).value or 0
+	return arg
+
+def _rpythonic_batch_column_( T, code, column ):		# pointer to the items and their number, None for a number
+	if isinstance( column, (list, tuple) ):
+		if code == 'p': column = [ _rpythonic_address_(a) for a in column ]
+		return ctypes.cast( (T * len(column))( *column ), ctypes.c_void_p ), len( column )
+	if code == 'p' and (column is None or hasattr( column, '_rpythonic_' ) or isinstance( column, (ctypes.Structure, ctypes.Union, ctypes._Pointer, _rpythonic_meta_) )):
+		column = _rpythonic_address_( column )		# one pointer for every row
+	if isinstance( column, _BATCH_NUMBERS_ ):
+		return ctypes.cast( ctypes.pointer( T(column) ), ctypes.c_void_p ), None
+	ptr = _rpythonic_buffer_argument_( ctypes.POINTER(T), column )
+	if ptr is not None: return ptr, _rpythonic_buffer_layout_( memoryview(column) )[0] // ctypes.sizeof(T)
+	return _rpythonic_batch_column_( T, code, _list(column) )		# python2 array.array, other sequences
+
+def _rpythonic_batch_( func, columns ):
+	sig = func.signature
+	if len( columns ) != sig.numargs: raise TypeError( '%s.batch() takes %s columns, %s given' %(func.name, sig.numargs, len(columns)) )
+	R = func.function.restype
+	if R is ctypes.c_void_p: R = None		# void results are declared c_void_p
+	types = [ _rpythonic_batch_type_( T ) for T in (R,) + tuple(sig.argtypes) ]
+	if None in types: return _rpythonic_batch_python_( func, columns )
+	storage = [ _BATCH_STORAGE_.get( code, T ) for T, (code, ctype) in zip( (R,) + tuple(sig.argtypes), types ) ]
+	args = []; n = None
+	for T, (code, ctype), column in zip( storage[1:], types[1:], columns ):
+		ptr, length = _rpythonic_batch_column_( T, code, column )
+		if length is not None:
+			if n is not None and length != n: raise ValueError( '%s.batch() columns of %s and %s rows' %(func.name, n, length) )
+			n = length
+		args += [ ptr, length is not None and 1 or 0 ]		# stride
+	if n is None: raise ValueError( '%s.batch() needs a column that is not a number' %func.name )
+
+	R = storage[0]; result = out = None
+	if R is not None:
+		try:
+			result = _array.array( _BATCH_ARRAYS_.get( types[0][0], R._type_ ), [0] ) * n
+			if result.itemsize != ctypes.sizeof( R ): raise ValueError
+			out = result.buffer_info()[0]
+		except ValueError:		# no such typecode, long long in python2
+			result = (R * n)()
+			out = ctypes.addressof( result )
+
+	address = ctypes.cast( func.function, ctypes.c_void_p )
+	shim = _rpythonic_batch_shim_( types )
+	if shim: shim( address, n, out, *args )
+	else:		# the same loop with ctypes
+		f = ctypes.CFUNCTYPE( R, *storage[1:] )( address.value )
+		cols = [ (ctypes.cast( ptr, ctypes.POINTER(T) ), stride) for T, ptr, stride in zip( storage[1:], args[::2], args[1::2] ) ]
+		for i in range( n ):
+			r = f( *[ c[ i*stride ] for c, stride in cols ] )
+			if out is not None: result[ i ] = r
+	return result
+
+def _rpythonic_batch_python_( func, columns ):		# structs and other types: a list of what calling func returns
+	n = None
+	for column in columns:
+		if not isinstance( column, _BATCH_NUMBERS_ ): n = len( column )
+	if n is None: raise ValueError( '%s.batch() needs a column that is not a number' %func.name )
+	rows = []
+	for column in columns:
+		if isinstance( column, _BATCH_NUMBERS_ ): column = [ column ] * n
+		elif len( column ) != n: raise ValueError( '%s.batch() columns of %s and %s rows' %(func.name, n, len(column)) )
+		rows.append( column )
+	return [ func( *row ) for row in zip( *rows ) ]
+
+
+###############################################################
+##						OFFLOADED CALLS						##
+###############################################################
+## metafunc.submit and metafunc.acall run blocking C calls in a thread pool of the module, made on first use with
+## RPYTHONIC_WORKERS threads, or like the standard library default. another executor can be set as _RPYTHONIC_EXECUTOR_.
+## ctypes releases the GIL during the call, except for the functions holding it, see metafunc.hold_gil
+RPYTHONIC_WORKERS = int( __os.environ.get( 'RPYTHONIC_WORKERS', '0' ) or 0 )
+_RPYTHONIC_EXECUTOR_ = None
+_RPYTHONIC_EXECUTOR_LOCK_ = threading.Lock()
+_RPYTHONIC_PENDING_ = {}		# future -> (function, args, kw), until the call is done
+
+def _rpythonic_executor_():
+	global _RPYTHONIC_EXECUTOR_
+	if _RPYTHONIC_EXECUTOR_ is None:
+		with _RPYTHONIC_EXECUTOR_LOCK_:
+			if _RPYTHONIC_EXECUTOR_ is None:
+				from concurrent.futures import ThreadPoolExecutor		# the futures backport on python2
+				workers = RPYTHONIC_WORKERS
+				if not workers:
+					import multiprocessing
+					workers = min( 32, multiprocessing.cpu_count() + 4 )
+				_RPYTHONIC_EXECUTOR_ = ThreadPoolExecutor( max_workers=workers )
+	return _RPYTHONIC_EXECUTOR_
+
+def _rpythonic_submit_( func, args, kw ):
+	future = _rpythonic_executor_().submit( func, *args, **kw )
+	_RPYTHONIC_PENDING_[ future ] = ( func, args, kw )		# buffers and structs the C function may still use
+	future.add_done_callback( _rpythonic_submit_done_ )		# right away when already done
+	return future
+
+def _rpythonic_submit_done_( future ): _RPYTHONIC_PENDING_.pop( future, None )
 
 
+###############################################################
+##						CALLBACKS							##
+###############################################################
+## a python callable passed for a function pointer gets a trampoline living as long as the call (qsort, foreach).
+## C can keep the pointer after the call returns (signal handlers, timeouts): functions with a destroy notify argument,
+## pin_callbacks and explicit registrations pin one trampoline per (callable, prototype), reused by every call,
+## until _rpythonic_release_callback_, called by the code or by a destroy notify (_rpythonic_destroy_notify_).
+_RPYTHONIC_CALLBACKS_ = {}		# (callable, prototype) -> [trampoline, pins]
+_RPYTHONIC_CALLBACKS_RELEASED_ = threading.local()		# .trampolines released from inside a C call, freed on the next registration of that thread
+_RPYTHONIC_PROTOTYPES_ = {}		# (restype, argtypes) -> CFUNCTYPE
+
+def _rpythonic_prototype_( restype, *argtypes ):		# CFUNCTYPE is a new class every time
+	key = ( restype, argtypes )
+	if key not in _RPYTHONIC_PROTOTYPES_: _RPYTHONIC_PROTOTYPES_[ key ] = ctypes.CFUNCTYPE( restype, *argtypes )
+	return _RPYTHONIC_PROTOTYPES_[ key ]
+
+def _rpythonic_callback_key_( func, prototype ):
+	try: hash( func )
+	except TypeError: return ( id(func), prototype )		# kept alive by its trampoline
+	return ( func, prototype )		# equal bound methods share a trampoline
+
+def _rpythonic_callback_( func, prototype, pin=True ):
+	'''trampoline of func, pinned until released, or unpinned for the caller to hold during a call'''
+	_RPYTHONIC_CALLBACKS_RELEASED_.trampolines = []		# this thread is out of the ones it released
+	key = _rpythonic_callback_key_( func, prototype )
+	if not pin:
+		entry = _RPYTHONIC_CALLBACKS_.get( key )
+		if entry is None: return prototype( func )
+		return entry[0]		# already pinned
+	with _RPYTHONIC_LOCK_:
+		entry = _RPYTHONIC_CALLBACKS_.get( key )
+		if entry is None: entry = _RPYTHONIC_CALLBACKS_[ key ] = [ prototype( func ), 0 ]
+		entry[1] += 1
+	return entry[0]
+
+def _rpythonic_release_callback_( func, prototype, all=False ):
+	'''unpin the trampoline of func, freed once every registration released it, or now with all=True'''
+	key = _rpythonic_callback_key_( func, prototype )
+	with _RPYTHONIC_LOCK_:
+		entry = _RPYTHONIC_CALLBACKS_.get( key )
+		if entry is None: return False
+		entry[1] -= 1
+		if entry[1] <= 0 or all:
+			released = _RPYTHONIC_CALLBACKS_RELEASED_.__dict__.setdefault( 'trampolines', [] )
+			released.append( _RPYTHONIC_CALLBACKS_.pop( key )[0] )
+	return True
+
+def _rpythonic_destroy_notify_( prototype, func, callback_prototype ):
+	'''trampoline for a destroy notify argument of type prototype, releasing the callback when C calls it'''
+	def notify( *args ):
+		_rpythonic_release_callback_( func, callback_prototype )
+		_rpythonic_release_callback_( notify, prototype )
+	return _rpythonic_callback_( notify, prototype )
+
 
 def _convert_nested_list_to_pointer( k, arg ):
 	depth = 0; s = k
@@ -478,13 +1337,227 @@ class _rpythonic_struct_( ctypes.Structure ):
 		ctypes.Structure.__init__(self, *cargs, **kw)
 
 
+###############################################################
+##					WRAPPER DESCRIPTOR						##
+###############################################################
+_RPYTHONIC_DESCRIPTOR_ = None
+_RPYTHONIC_STRIP_PREFIXES_ = []
+## structs are made on first reference, that needs the module __getattr__ of python 3.7 ##
+RPYTHONIC_LAZY_STRUCTS = __os.environ.get( 'RPYTHONIC_LAZY_STRUCTS', '1' ) not in ('', '0') and sys.version_info >= (3,7)
+if _ISPYTHON2: _rpythonic_text_ = lambda b: b
+else: _rpythonic_text_ = lambda b: b.decode('utf-8')
+
+class _rpythonic_descriptor_(object):
+	'''
+	reader of the compact wrapper written by rpythonic.WrapperDescriptor (output_format="descriptor"):
+		b'RPYD', version and index size as little endian uint32, the index, then the records.
+		index lines are "kind<tab>name<tab>offset<tab>length", records are tab separated text.
+	the file is memory mapped, import reads the index and the small blocks, a struct or function
+	record is decoded when it is frozen or bound, ctypes type expressions are evaluated once per id,
+	with the declared ctypes classes as locals since the struct globals become OO wrapper classes.
+	with lazy structs, type expressions see the struct names through this object (see __getitem__),
+	a struct is declared when a type refers to it and frozen by _rpythonic_struct_class_.
+	'''
+	VERSION = 1
+	def __init__( self, path ):
+		f = open( path, 'rb' )
+		self.data = _mmap.mmap( f.fileno(), 0, access=_mmap.ACCESS_READ )
+		f.close()
+		magic = self.data[ : 4 ]
+		version, size = _struct.unpack( '<II', self.data[4:12] )
+		if magic != b'RPYD' or version != self.VERSION:
+			raise ImportError( 'unsupported wrapper descriptor: %s' %path )
+		self.base = 12 + size
+		self.index = {}		# (kind, name) -> (offset, length)
+		self.names = {}		# kind -> names in file order
+		for line in _rpythonic_text_( self.data[12:self.base] ).splitlines():
+			kind, name, offset, length = line.split('\t')
+			self.index[ (kind,name) ] = ( int(offset), int(length) )
+			self.names.setdefault( kind, [] ).append( name )
+		self.types = None
+		self.init_structs()
+
+	def init_structs( self ):
+		self.resolved = {}		# type id -> ctypes type
+		self.lazy = False
+		self.structs = {}		# name -> U/S/A
+		self.classes = {}		# name -> ctypes class, once declared
+		self.unfrozen = set()	# declared classes waiting for their _fields_
+		self.stack = []
+		self.oo = {}		# struct -> (short name, methods, prefixes, aliases)
+		self.returns = {}		# function -> struct it returns
+		self.depends = {}		# struct -> structs it holds by value
+		self.altnames = {}		# short name -> struct
+
+	def record( self, kind, name ):
+		offset, length = self.index[ (kind,name) ]
+		start = self.base + offset
+		return _rpythonic_text_( self.data[ start : start+length ] )
+
+	def lines( self, block ):
+		if ('B',block) not in self.index: return []
+		return [ line.split('\t') for line in self.record('B',block).splitlines() ]
+
+	def type( self, tid ):
+		if tid not in self.resolved:
+			if self.types is None: self.types = self.record( 'B', 'types' ).split( '\n' )
+			self.resolved[ tid ] = self.evaluate( self.types[int(tid)] )
+		return self.resolved[ tid ]
+
+	def evaluate( self, expr ):
+		if self.lazy: return eval( expr, globals(), self )
+		return eval( expr, globals(), self.classes )		# not the OO wrappers replacing the globals
+
+	def declare( self, name ):
+		kind = self.structs[ name ]
+		if kind == 'U': cls = type( name, (ctypes.Union,), {} )
+		elif kind == 'A': cls = type( name, (_rpythonic_struct_,), {'_array_wrapper_':True} )
+		else: cls = type( name, (_rpythonic_struct_,), {} )
+		self.classes[ name ] = cls
+		self.unfrozen.add( name )
+		return cls
+
+	def __getitem__( self, name ):		# locals of the type expressions
+		if name in self.unfrozen: self.stack.append( name )		# frozen with the struct referring to it
+		if name in self.classes: return self.classes[ name ]
+		if name not in self.structs: raise KeyError( name )
+		self.stack.append( name )
+		return self.declare( name )
+
+	def fields( self, name ):
+		f = self.record( 'S', name )
+		if not f: return []
+		f = f.split( '\t' )
+		return [ (f[i], self.type(f[i+1])) for i in range(0, len(f), 2) ]
+
+	def function( self, name ):		# (restype id, [(argname, type id)])
+		f = self.record( 'C', name ).split( '\t' )
+		return f[0], [ (f[i], f[i+1]) for i in range(1, len(f), 2) ]
+
+	def signature( self, name ):
+		restype, args = self.function( name )
+		return self.type( restype ), [ (n, self.type(t)) for n,t in args ]
+
+	def lookup( self, name ):
+		'''the struct a module attribute names: itself, its short name, or the name without a stripped prefix'''
+		if name in self.structs: return name
+		if name in self.altnames: return self.altnames[ name ]
+		for prefix in _RPYTHONIC_STRIP_PREFIXES_:
+			if prefix + name in self.structs: return prefix + name
+
+class _rpythonic_struct_tables_( _rpythonic_descriptor_ ):
+	'''the structs of a source wrapper: its _RPYTHONIC_STRUCTS_, _RPYTHONIC_FIELDS_ and _RPYTHONIC_DEPENDS_ tables'''
+	def __init__( self, structs, fields, depends ):
+		self.index = {}; self.names = {}
+		self.init_structs()
+		self.structs = dict( structs )
+		self.field_types = dict( fields )		# name -> [(field, type expression)]
+		self.depends = dict( depends )
+
+	def type( self, expr ):
+		if expr not in self.resolved: self.resolved[ expr ] = self.evaluate( expr )
+		return self.resolved[ expr ]
+
+	def fields( self, name ): return [ (n, self.type(t)) for n,t in self.field_types[ name ] ]
+
+def _rpythonic_load_structs_( by_value=() ):
+	'''
+	declares the structs and unions of a source wrapper, its function signatures name them at import.
+	they are frozen here, or with lazy structs on first reference like those of a descriptor, except the ones
+	a function signature holds by value: arrays of them take their size at import.
+	'''
+	global _RPYTHONIC_DESCRIPTOR_
+	G = globals()
+	D = _RPYTHONIC_DESCRIPTOR_ = _rpythonic_struct_tables_( _RPYTHONIC_STRUCTS_, _RPYTHONIC_FIELDS_, _RPYTHONIC_DEPENDS_ )
+	for name, kind in _RPYTHONIC_STRUCTS_: G[ name ] = D.declare( name )
+	if RPYTHONIC_LAZY_STRUCTS:
+		D.lazy = True
+		D.stack.extend( by_value )
+		_rpythonic_freeze_structs_()
+	else:
+		for name, fields in _RPYTHONIC_FIELDS_: _rpythonic_freeze_struct_( D, name )
+
+def _rpythonic_freeze_struct_( D, name ):
+	if name not in D.unfrozen: return
+	D.unfrozen.remove( name )
+	for dep in D.depends.get( name, () ):		# ctypes takes the size of these, also for arrays of them
+		D[ dep ]
+		_rpythonic_freeze_struct_( D, dep )
+	__freeze_rpythonic_struct( D.classes[name], D.fields(name) )		# declares the structs it points to
+
+def _rpythonic_freeze_structs_():
+	'''
+	freezes the declared structs and unions, with every struct they reach by pointer or value,
+	so pointer contents are complete. structs held by value are frozen before the struct holding them.
+	'''
+	D = _RPYTHONIC_DESCRIPTOR_
+	if D.stack:
+		with _RPYTHONIC_LOCK_:		# ctypes takes _fields_ once
+			while D.stack: _rpythonic_freeze_struct_( D, D.stack.pop() )
+
+def _rpythonic_struct_class_( name ):		# the frozen ctypes class of a lazy struct or union
+	cls = _RPYTHONIC_DESCRIPTOR_[ name ]
+	_rpythonic_freeze_structs_()
+	return cls
+
+def _rpythonic_struct_object_( name ):
+	'''the module global of a lazy struct or union: its OO wrapper class'''
+	G = globals(); D = _RPYTHONIC_DESCRIPTOR_
+	klass = _rpythonic_struct_class_( name )
+	newklass = getattr( klass, '_rpythonic_wrapper_class_', None )
+	if newklass is None:
+		with _RPYTHONIC_LOCK_:
+			newklass = getattr( klass, '_rpythonic_wrapper_class_', None )		# not made by another thread meanwhile
+			if newklass is None:
+				altname, methods, prefixes, aliases = D.oo[ name ]
+				newklass = _rpythonic_struct_wrapper_( klass, name, altname, methods, prefixes, aliases )
+				G[ name ] = newklass
+				if altname not in G and altname not in D.structs: G[ altname ] = newklass
+	return newklass
+
+def __getattr__( name ):		# python 3.7 calls this for missing module attributes
+	D = _RPYTHONIC_DESCRIPTOR_
+	if D is not None and D.lazy:
+		struct = D.lookup( name )
+		if struct: return _rpythonic_struct_object_( struct )
+	raise AttributeError( 'module %r has no attribute %r' %(__name__, name) )
+
+def _rpythonic_load_descriptor_( filename ):
+	'''defines the globals, structs and lazy functions of the descriptor next to this module'''
+	global _RPYTHONIC_DESCRIPTOR_
+	G = globals()
+	url = __os.path.join( __os.path.dirname(__os.path.abspath(__file__)), filename )
+	D = _RPYTHONIC_DESCRIPTOR_ = _rpythonic_descriptor_( url )
+	for name, value in D.lines( 'globals' ): G[ name ] = _literal_eval( value )
+	D.structs = dict( D.lines('declare') )
+	for name in D.names.get( 'C', () ): G[ name ] = _rpythonic_lazyfunc_( name, None, None )
+	G[ '_RPYTHONIC_ENUM_ALIASES_' ] = [ tuple(line) for line in D.lines('enum_aliases') ]
+	_RPYTHONIC_GIL_HOLDING_.update( [ line[0] for line in D.lines('gil') ] )
+	if ('B','stripped') in D.index: G[ '_RPYTHONIC_STRIPPED_' ] = [ tuple(line) for line in D.lines('stripped') ]
+	oo = []
+	for name, altname, methods, prefixes, aliases in D.lines( 'oo' ):
+		aliases = [ tuple(alias.split('=')) for alias in aliases.split(',') if alias ]
+		oo.append( (name, altname, [n for n in methods.split(',') if n], [p for p in prefixes.split(',') if p], aliases) )
+	returns = [ (name, struct) for struct, name in D.lines('returns') ]
+	for line in D.lines( 'depends' ): D.depends[ line[0] ] = line[1:]
+	if RPYTHONIC_LAZY_STRUCTS:		# struct classes and their OO API are made on first reference
+		D.lazy = True
+		for entry in oo:
+			D.oo[ entry[0] ] = entry[ 1 : ]
+			if entry[1] not in D.structs: D.altnames.setdefault( entry[1], entry[0] )
+		D.returns = dict( returns )
+		return
+	G[ '_RPYTHONIC_OO_' ] = oo
+	G[ '_RPYTHONIC_RETURNS_' ] = returns
+	for name, kind in D.lines( 'declare' ): G[ name ] = D.declare( name )		# declare first, so that structs can self-reference
+	for name in D.names.get( 'S', () ): _rpythonic_freeze_struct_( D, name )
+
+
 def _rpythonic_make_nice_global_enums_():
 	G = globals()
-	for name in RPYTHONIC_GLOBAL_ENUMS:
-		if '_' in name and name.index('_') <= 4:
-			altname = name[ name.index('_') + 1 : ]
-			if altname not in G:
-				G[altname] = RPYTHONIC_GLOBAL_ENUMS[ name ]
+	for altname, name in _RPYTHONIC_ENUM_ALIASES_:
+		if altname not in G:
+			G[altname] = RPYTHONIC_GLOBAL_ENUMS[ name ]
 
 def _rpythonic_clean_up_missing_functions_():
 	G = globals()
@@ -492,6 +1565,7 @@ def _rpythonic_clean_up_missing_functions_():
 		G.pop( f )
 	print( "C functions loaded: %s" %len(RPYTHONIC_WRAPPER_FUNCTIONS) )
 	print( "C functions failed: %s" %len(RPYTHONIC_WRAPPER_FUNCTIONS_FAILURES) )
+	if RPYTHONIC_LAZY_FUNCTIONS_PENDING: print( "C functions bound on first use: %s" %len(RPYTHONIC_LAZY_FUNCTIONS_PENDING) )
 
 
 
@@ -710,6 +1784,11 @@ class meta:	# NEW API - allow run time switch from ctypes to rffi
 
 def _rpythonic_strip_prefixes_( prefixes ):
 	G = globals()
+	_RPYTHONIC_STRIP_PREFIXES_.extend( prefixes )		# for lazy structs
+	if _RPYTHONIC_STRIPPED_ is not None:
+		for newname, name in _RPYTHONIC_STRIPPED_:
+			if name in G and newname not in G: G[ newname ] = G[ name ]
+		return
 	names = _list(G.keys())	# ensure list in py3
 	for name in names:
 		for prefix in prefixes:
@@ -724,7 +1803,12 @@ def _rpythonic_strip_prefixes_( prefixes ):
 def _rpythonic_load_dynamic_libraries(names):
 	global _CTYPES_CDLLS
 	for name in names:
-		cdll = _load_ctypes_lib( name )
+		path = _rpythonic_library_path_( name )
+		if path: cdll = ctypes.CDLL( path )		# resolved by an earlier import
+		else:
+			cdll = _load_ctypes_lib( name )
+			path = cdll and cdll._name
+			if path and __os.path.isabs( path ) and __os.path.isfile( path ): _rpythonic_remember_library_path_( name, path )
 		if cdll:
 			print('[[dynamic library loaded: %s]]' %name)
 			_CTYPES_CDLLS.append( cdll )
@@ -31,7 +31,11 @@ PYTHON_RESERVED_NAMES = 'self id object type enumerate isinstance len globals lo
 
 
 import os, sys, ctypes, inspect
-import subprocess
+import subprocess, hashlib, json, tempfile, time, re, threading, struct, bisect, fnmatch
+try: import cPickle as pickle
+except ImportError: import pickle
+try: from cStringIO import StringIO
+except ImportError: from io import StringIO
 
 ISPYTHON2 = sys.version_info[0] == 2
 IS32BIT = (ctypes.sizeof(ctypes.c_void_p)==4)
@@ -336,80 +340,242 @@ def module( name, space=None, mode='ctypes', platform='', secondary=None, fold_c
 ########### Wrapper API ############
 STRIP_PREFIXES = []
 CTYPES_FOOTER = ''
+LAZY_FUNCTIONS = False
+OUTPUT_FORMAT = 'source'
+GIL_POLICY = ( [], [], False )		# names or patterns holding the GIL, releasing it, the heuristic for the others
 
-def wrap(
-	name='', 
-	header=None, 
-	library_names=None,
-	insert_headers=[], 
-	library=None, 
-	dynamic_libs=[], 
-	static_libs=[],
-	defines=[], 
-	undefines=[], 
-	includes=[], 
-	ctypes=True, 
-	cplusplus=False, 
-	platform='linux', 
-	system_include=None, 
-	ignore_classes = [],
-	ignore_functions = [],
-	strip_prefixes = [],
-	ctypes_footer='' ):
-
-	assert name
-
-	global LIBS, CTYPES_OUTPUT, RFFI_OUTPUT, INCLUDE_DIRS, SYS_INCLUDE_DIRS, MACRO_DEFS, MACRO_UNDEFS, INSERT_HEADERS, CTYPES_FOOTER, STRIP_PREFIXES
-	_reset_wrapper_state()
-
-	LIBS = []
-	INCLUDE_DIRS = list(includes)		# copy since we modify it
-	INSERT_HEADERS = list( insert_headers )
-	SYS_INCLUDE_DIRS = []
-	CTYPES_FOOTER = ctypes_footer
-	STRIP_PREFIXES = list( strip_prefixes )
-
-	if system_include:
-		SYS_INCLUDE_DIRS.append( system_include )
-		INCLUDE_DIRS.append( system_include )
-		for n in os.listdir( system_include ):
-			if n=='linux':		# for stddef.h
-				sub = os.path.join( system_include, n )
-				if sub not in INCLUDE_DIRS: INCLUDE_DIRS.append( sub )
-
-	if not library:	# DEPRECATE?
-		libname = '%s.so' %name
-		if not libname.startswith('lib'): libname = 'lib'+libname
-		guess1 = os.path.join( '/usr/local/lib', libname )
-		guess2 = os.path.join( '/usr/lib', libname )
-		if os.path.isfile( guess1 ): library = guess1
-		elif os.path.isfile( guess2 ): library = guess2
-	if library: LIBS.append( library )
-
-
-	MACRO_DEFS = list( defines )
-	MACRO_UNDEFS = list( undefines )
-
-	if '-' in name:		# fixes module importing
-		name = name.replace('-','_')
-
-	if ctypes:
-		mdir = os.path.join( CACHEDIR, name )
-		if not os.path.isdir( mdir ): os.makedirs( mdir )
-		## TODO deprecate this global CTYPES_OUTPUT
-		CTYPES_OUTPUT = os.path.join(name,'__init__.py')
-
-	if cplusplus:
-		a = CPlusPlus( header )
-		for lib in dynamic_libs: a.add_library( lib )
-		for lib in static_libs: a.add_library( lib, dynamic=False )
-		for n in ignore_classes: a.add_ignore_class( n )
-		for n in ignore_functions: a.add_ignore_function( n )
-
-	else:	# pycparser C
-		a = C( header, library_names=library_names )
-
-	return a.save( name )
+class WrapperSession(object):
+	'''
+	owns the generator state: the module globals that wrap() configures and the SomeThing registries.
+	the state is swapped in while the session runs and swapped back out after, so sessions can nest
+	or be started from other threads (they run one at a time), and self.state can be inspected after run()
+	'''
+	GLOBALS = 'LIBS INCLUDE_DIRS INSERT_HEADERS SYS_INCLUDE_DIRS MACRO_DEFS MACRO_UNDEFS CTYPES_OUTPUT RFFI_OUTPUT CTYPES_FOOTER STRIP_PREFIXES PYCPARSER_USER_RULES LAZY_FUNCTIONS OUTPUT_FORMAT GIL_POLICY'.split()
+	REGISTRIES = 'Structs Unions Functions Enums SomeThings Arrays MACRO_GLOBALS Types Typedefs EnumTypes'.split()
+	LOCK = threading.RLock()
+
+	OPTIONS = {		# wrap() arguments and their defaults
+		'header' : None,
+		'library_names' : None,
+		'insert_headers' : [],
+		'library' : None,
+		'dynamic_libs' : [],
+		'static_libs' : [],
+		'defines' : [],
+		'undefines' : [],
+		'includes' : [],
+		'ctypes' : True,
+		'cplusplus' : False,
+		'platform' : 'linux',
+		'system_include' : None,
+		'ignore_classes' : [],
+		'ignore_functions' : [],
+		'strip_prefixes' : [],
+		'ctypes_footer' : '',
+		'parse_cache' : True,
+		'pycparser_rules' : [],
+		'lazy_functions' : False,		# bind C functions on first use instead of at import
+		'output_format' : 'source',		# or 'descriptor', a small __init__.py loading the compact wrapper.rpyd
+		'hold_gil' : [],		# functions (fnmatch patterns) called without releasing the GIL, through a PyDLL handle
+		'release_gil' : [],		# functions always releasing it, wins over hold_gil
+		'gil_heuristic' : False,		# opt-in: the other functions hold the GIL when _gil_holding finds them trivial
+	}
+
+	def __init__( self, name='', **options ):
+		assert name
+		for key in options:
+			if key not in self.OPTIONS: raise TypeError( 'unknown wrap option: %s' %key )
+		self.name = name
+		self.options = options
+		self.state = self.new_state()
+		self._saved = []
+
+	@classmethod
+	def new_state( self ):
+		state = {
+			'LIBS' : [],
+			'INCLUDE_DIRS' : [],
+			'INSERT_HEADERS' : [],
+			'SYS_INCLUDE_DIRS' : [],
+			'MACRO_DEFS' : [],
+			'MACRO_UNDEFS' : [],
+			'CTYPES_OUTPUT' : None,
+			'RFFI_OUTPUT' : None,
+			'CTYPES_FOOTER' : '',
+			'STRIP_PREFIXES' : [],
+			'PYCPARSER_USER_RULES' : [],
+			'LAZY_FUNCTIONS' : False,
+			'OUTPUT_FORMAT' : 'source',
+			'GIL_POLICY' : ( [], [], False ),
+		}
+		for n in self.REGISTRIES: state[ 'SomeThing.'+n ] = {}
+		state[ 'SomeThing.Symbols' ] = symbols = SymbolTable()
+		state[ 'SomeThing.Nodes' ] = symbols.nodes
+		state[ 'SomeThing.FROZEN' ] = False
+		return state
+
+	@classmethod
+	def capture( self ):
+		g = globals()
+		state = dict( [(n,g[n]) for n in self.GLOBALS] )
+		for n in self.REGISTRIES + ['Symbols', 'Nodes', 'FROZEN']:
+			state[ 'SomeThing.'+n ] = getattr( SomeThing, n )
+		return state
+
+	@staticmethod
+	def install( state ):
+		g = globals()
+		for key in state:
+			if key.startswith('SomeThing.'): setattr( SomeThing, key.split('.')[-1], state[key] )
+			else: g[ key ] = state[ key ]
+
+	def __enter__( self ):
+		self.LOCK.acquire()
+		self._saved.append( self.capture() )
+		self.install( self.state )
+		return self
+
+	def __exit__( self, *args ):
+		self.state = self.capture()
+		self.install( self._saved.pop() )
+		self.LOCK.release()
+
+	def run( self ):
+		with self: return self.generate()
+
+	def generate( self ):
+		o = dict( self.OPTIONS ); o.update( self.options )
+		name = self.name
+		includes = o['includes']; insert_headers = o['insert_headers']; library = o['library']
+		system_include = o['system_include']; header = o['header']
+
+		global LIBS, CTYPES_OUTPUT, RFFI_OUTPUT, INCLUDE_DIRS, SYS_INCLUDE_DIRS, MACRO_DEFS, MACRO_UNDEFS, INSERT_HEADERS, CTYPES_FOOTER, STRIP_PREFIXES, PYCPARSER_USER_RULES, LAZY_FUNCTIONS, OUTPUT_FORMAT, GIL_POLICY
+		_reset_wrapper_state()
+
+		LIBS = []
+		INCLUDE_DIRS = list(includes)		# copy since we modify it
+		INSERT_HEADERS = list( insert_headers )
+		SYS_INCLUDE_DIRS = []
+		CTYPES_FOOTER = o['ctypes_footer']
+		PYCPARSER_USER_RULES = list( o['pycparser_rules'] )
+		STRIP_PREFIXES = list( o['strip_prefixes'] )
+		LAZY_FUNCTIONS = o['lazy_functions']
+		if o['output_format'] not in ('source', 'descriptor'): raise ValueError( 'unknown output_format: %s' %o['output_format'] )
+		OUTPUT_FORMAT = o['output_format']
+		GIL_POLICY = ( list(o['hold_gil']), list(o['release_gil']), o['gil_heuristic'] )
+
+		if system_include:
+			SYS_INCLUDE_DIRS.append( system_include )
+			INCLUDE_DIRS.append( system_include )
+			for n in os.listdir( system_include ):
+				if n=='linux':		# for stddef.h
+					sub = os.path.join( system_include, n )
+					if sub not in INCLUDE_DIRS: INCLUDE_DIRS.append( sub )
+
+		if not library:	# DEPRECATE?
+			libname = '%s.so' %name
+			if not libname.startswith('lib'): libname = 'lib'+libname
+			guess1 = os.path.join( '/usr/local/lib', libname )
+			guess2 = os.path.join( '/usr/lib', libname )
+			if os.path.isfile( guess1 ): library = guess1
+			elif os.path.isfile( guess2 ): library = guess2
+		if library: LIBS.append( library )
+
+
+		MACRO_DEFS = list( o['defines'] )
+		MACRO_UNDEFS = list( o['undefines'] )
+
+		if '-' in name:		# fixes module importing
+			name = name.replace('-','_')
+
+		if o['ctypes']:
+			mdir = os.path.join( CACHEDIR, name )
+			if not os.path.isdir( mdir ): os.makedirs( mdir )
+			## TODO deprecate this global CTYPES_OUTPUT
+			CTYPES_OUTPUT = os.path.join(name,'__init__.py')
+
+		if o['cplusplus']:
+			a = CPlusPlus( header )
+			for lib in o['dynamic_libs']: a.add_library( lib )
+			for lib in o['static_libs']: a.add_library( lib, dynamic=False )
+			for n in o['ignore_classes']: a.add_ignore_class( n )
+			for n in o['ignore_functions']: a.add_ignore_function( n )
+
+		else:	# pycparser C
+			PARSE_CACHE.enabled = o['parse_cache'] and '--no-parse-cache' not in sys.argv
+			a = C( header, library_names=o['library_names'] )
+			print( 'parse cache: %(hits)s hits, %(misses)s misses' %PARSE_CACHE.stats() )
+
+		return a.save( name )
+
+
+def wrap( name='', header=None, **options ):
+	'''
+	generate the ctypes wrapper CACHEDIR/<name>/__init__.py, see WrapperSession.OPTIONS for the other arguments
+	'''
+	return WrapperSession( name, header=header, **options ).run()
+
+
+def _wrap_batch_job( job ):
+	'''runs in a pool worker, everything the job prints goes to its log'''
+	spec, cachedir, logdir, argv = job
+	spec = dict( spec )
+	name = spec.pop( 'name' )
+	log = os.path.join( logdir, '%s.log' %name )
+	f = open( log, 'wb' )
+	sys.stdout.flush(); sys.stderr.flush()
+	os.dup2( f.fileno(), 1 ); os.dup2( f.fileno(), 2 )		# also catches cpp and gcc
+	sys.argv = argv
+	set_cache( cachedir )
+	error = None
+	start = time.time()
+	try: WrapperSession( name, **spec ).run()
+	except Exception:
+		import traceback; traceback.print_exc()
+		error = '%s: %s' %(sys.exc_info()[0].__name__, sys.exc_info()[1])
+	sys.stdout.flush(); sys.stderr.flush()
+	f.close()
+	return { 'name':name, 'ok':error is None, 'seconds':time.time()-start, 'log':log, 'error':error }
+
+def wrap_batch( specs, jobs=None, logdir=None ):
+	'''
+	run many wraps on a process pool, each spec is a dict of wrap() arguments including "name".
+	each job logs to logdir/<name>.log (default CACHEDIR/logs), prints a summary table and returns the job results.
+	specs writing the same wrapper are run once, the last one wins like with sequential wrap() calls
+	'''
+	import multiprocessing
+	if not jobs: jobs = multiprocessing.cpu_count()
+	if not logdir: logdir = os.path.join( CACHEDIR, 'logs' )
+	if not os.path.isdir( logdir ): os.makedirs( logdir )
+	last = {}
+	for spec in specs:
+		key = spec['name'].replace('-','_')		# the output directory, see WrapperSession.generate
+		if key in last: pprint( 'WARNING: %s queued more than once, only the last spec is wrapped' %spec['name'], 1 )
+		last[ key ] = spec
+	specs = [ spec for spec in specs if last[ spec['name'].replace('-','_') ] is spec ]
+	work = [ (spec, CACHEDIR, logdir, list(sys.argv)) for spec in specs ]
+	if not work: return []
+
+	start = time.time()
+	results = {}
+	pool = multiprocessing.Pool( min(jobs, len(work)), maxtasksperchild=1 )		# a fresh process per wrapper
+	try:
+		for r in pool.imap_unordered( _wrap_batch_job, work ):
+			results[ r['name'] ] = r
+			if r['ok']: pprint( 'done: %s (%.1fs)' %(r['name'], r['seconds']), 2 )
+			else: pprint( 'FAILED: %s - %s' %(r['name'], r['log']), 1 )
+	finally:
+		pool.close(); pool.join()
+	results = [ results[spec['name']] for spec in specs ]
+
+	print( '%-24s %-7s %9s  %s' %('wrapper', 'status', 'seconds', 'log') )
+	for r in results:
+		status = r['ok'] and 'ok' or 'FAILED'
+		print( '%-24s %-7s %9.1f  %s' %(r['name'], status, r['seconds'], r['log']) )
+		if r['error']: print( '\t%s' %r['error'] )
+	failed = len( [r for r in results if not r['ok']] )
+	print( '%s wrappers, %s failed, %s jobs, %.1fs wall, %.1fs total' %(len(results), failed, jobs, time.time()-start, sum([r['seconds'] for r in results])) )
+	return results
 
 
 
@@ -451,13 +617,91 @@ def _reset_wrapper_state():
 	SomeThing.SomeThings.clear()
 	SomeThing.Arrays.clear()
 
-	SomeThing.Nodes = []
+	SomeThing.Symbols.clear()
+	SomeThing.Nodes = SomeThing.Symbols.nodes
+	SomeThing.FROZEN = False
 	SomeThing.MACRO_GLOBALS.clear()
 	SomeThing.Types.clear()
 	SomeThing.Typedefs.clear()
 	SomeThing.EnumTypes.clear()
 
 
+class SymbolTable(object):
+	'''
+	hash indexes over the SomeThing nodes, in declaration (construction) order:
+		by name - the first node with that name, like the old linear scan
+		by enum key - the enum that defines the key
+		by kind - class name -> nodes
+	'''
+	def __init__(self): self.clear()
+
+	def clear(self):
+		self.nodes = []
+		self.order = {}		# node -> position in nodes
+		self.kinds = {}
+		self.enum_keys = {}
+		self.names = {}
+		self.named = 0		# nodes[ : named ] are in self.names
+
+	def add( self, node ):
+		self.order[ node ] = len( self.nodes )
+		self.nodes.append( node )
+		kind = node.__class__.__name__
+		if kind not in self.kinds: self.kinds[ kind ] = []
+		self.kinds[ kind ].append( node )
+
+	def add_enum_key( self, key, enum ): self.enum_keys[ key ] = enum
+
+	def get_enum_with_key( self, key ): return self.enum_keys.get( key )
+
+	def get_enum_value( self, key ):
+		enum = self.enum_keys.get( key )
+		if enum: return enum.enum_value( key )
+		else: return SomeThing.Enums[ key ].enum_value( key )		# KeyError like before
+
+	def get_node_by_name( self, name ):
+		## a node only has its final name once built, index lazily - lookups come after the walk ##
+		while self.named < len( self.nodes ):
+			node = self.nodes[ self.named ]
+			n = node.name()
+			if n not in self.names: self.names[ n ] = node
+			self.named += 1
+		return self.names.get( name )
+
+	def get_kind( self, kind ): return self.kinds.get( kind, [] )
+
+	def in_order( self, things ):
+		'''unique things, sorted by declaration'''
+		order = self.order
+		return sorted( set(things), key=lambda node: order[node] )
+
+	def get_unions_and_structs( self ):
+		return self.in_order( list(SomeThing.Unions.values()) + list(SomeThing.Structs.values()) )
+
+	def get_enums( self ): return self.in_order( SomeThing.Enums.values() )
+
+	def get_funcs( self ):
+		structs = SomeThing.Structs
+		return [ f for f in self.in_order( SomeThing.Functions.values() ) if f.name() not in structs ]	# may16th 2011
+
+
+def _resolved( method ):
+	'''
+	memoize a type resolution method per node, once SomeThing.FROZEN is set after the AST walk
+	the typedef and child chains are final and each node resolves only once
+	'''
+	name = method.__name__
+	def resolve( self ):
+		if not SomeThing.FROZEN: return method( self )
+		try: return self.resolved[ name ]
+		except KeyError:
+			r = self.resolved[ name ] = method( self )
+			return r
+	resolve.__name__ = name
+	resolve.__doc__ = method.__doc__
+	return resolve
+
+
 class SomeThing(object):
 	'''
 	ID, Constant, Typename, Decl, or any subtype of Decl:
@@ -472,53 +716,64 @@ class SomeThing(object):
 	SomeThings = {}
 	Arrays = {}
 
-	Nodes = []
+	Symbols = SymbolTable()
+	Nodes = Symbols.nodes
+	FROZEN = False		# set after the walk, see _resolved
 	MACRO_GLOBALS = {}	# TODO, is there a better way to deal with this?
 
 
 	@staticmethod
 	def sort( things ):
-		for parent in things:
-			pidx = things.index( parent )
-			for child in parent.fields:
+		'''
+		topological order for freezing structs: a struct or union held by-value must get its _fields_
+		before the one that contains it (using it finalizes the ctypes class), pointer members only need
+		the declared class so they are not edges.  Cycles are only possible through pointers, members that
+		Union.mark_cyclic flagged are skipped and anything else left cyclic is reported and broken.
+		Otherwise declaration order is kept.
+		'''
+		by_name = {}
+		for thing in things:
+			n = thing._name()
+			if n not in by_name: by_name[ n ] = thing		# first match, like the old scan
+		deps = {}
+		for thing in things:
+			deps[ thing ] = d = []
+			for child in thing.fields:
+				if child.cyclic or child.is_pointer(): continue
 				type = child.type()
 				if type.startswith('struct:') or type.startswith('union:'):
-					if child.cyclic: continue#; print('skipping cyclic', type); 	# ctypes
-					name = type.split(':')[-1]
-					#print('searching', name)
-					found = False
-					for cidx,c in enumerate( things ):
-						if c._name() == name:
-							found = True
-							if cidx > pidx:
-								print('--sort--', name, cidx, pidx)
-								things.remove( c )
-								things.insert( pidx, c )
-								return True
-					if not found: print('not found', name)
+					c = by_name.get( type.split(':')[-1] )
+					if c is not None and c is not thing: d.append( c )
+
+		order = []
+		state = {}		# 1: visiting, 2: done
+		for root in things:
+			if root in state: continue
+			state[ root ] = 1
+			stack = [ (root, iter(deps[root])) ]
+			while stack:
+				node, it = stack[-1]
+				for dep in it:
+					if dep not in state:
+						state[ dep ] = 1
+						stack.append( (dep, iter(deps[dep])) )
+						break
+					elif state[ dep ] == 1: print( 'WARN - cyclic by-value struct member', node._name(), dep._name() )
+				else:
+					stack.pop()
+					state[ node ] = 2
+					order.append( node )
+		return order
 
 	@staticmethod
 	def get_unions_and_structs(sort=False):
-		valid = SomeThing.Unions.values() + SomeThing.Structs.values()
-		r = []
-		for node in SomeThing.Nodes:
-			if node in valid: r.append( node )
+		r = SomeThing.Symbols.get_unions_and_structs()
 		if not sort: return r
-		else:
-			i = 0
-			while sort and i < 400:
-				sort = SomeThing.sort( r )
-				i += 1
-			print( 'sorts', i )
-			return r
+		else: return SomeThing.sort( r )
 
 
 	@staticmethod
-	def get_enums():
-		r = []; a = SomeThing.Enums.values(); a.sort()
-		for e in a:
-			if e not in r: r.append( e )
-		return r
+	def get_enums(): return SomeThing.Symbols.get_enums()
 
 	@staticmethod
 	def get_unions(): return SomeThing.Unions.values(); a.sort()
@@ -538,13 +793,7 @@ class SomeThing(object):
 		return sorts
 
 	@staticmethod
-	def get_funcs():
-		r = []; a = SomeThing.Functions.values(); a.sort()
-		for e in a:
-			if e not in r:
-				if e.name() not in SomeThing.Structs:	# may16th 2011
-					r.append( e )
-		return r
+	def get_funcs(): return SomeThing.Symbols.get_funcs()
 
 	def get_ancestors(self, ancest=None):
 		if ancest is None: ancest = []
@@ -580,9 +829,7 @@ class SomeThing(object):
 		else: return ['#%s							<ast=%s>' %(self.name(),self.tag) ]
 
 	@classmethod
-	def get_node_by_name( self, name ):
-		for n in self.Nodes:
-			if n.name() == name: return n
+	def get_node_by_name( self, name ): return self.Symbols.get_node_by_name( name )
 
 	Types = {}
 	Typedefs = {}
@@ -590,7 +837,8 @@ class SomeThing(object):
 	def setup( self ): pass		# overloaded
 
 	def __init__(self, ast, parent=None ):
-		SomeThing.Nodes.append( self )
+		SomeThing.Symbols.add( self )
+		self.resolved = {}
 		self.cyclic = False		# for structs and unions
 		self.ast = ast
 		self.tag = ast.__class__.__name__
@@ -688,8 +936,21 @@ class SomeThing(object):
 		if self.num_ast_nodes() > other.num_ast_nodes(): return self
 		else: return other
 
+	@_resolved
+	def is_pointer( self ):		# also counts the pointers of a typedef, like ctypes_type
+		if self.pointers(): return True
+		typedef = self.typedef()
+		return bool( typedef and typedef.pointers() )
+
 	def pointers( self, p=None ):		# p=[]		bad idea
-		if p is None: p = []		# prevents memleak
+		if p is None:
+			if SomeThing.FROZEN and 'pointers' in self.resolved: return self.resolved['pointers']
+			p = self._pointers( [] )		# prevents memleak
+			if SomeThing.FROZEN: self.resolved['pointers'] = p
+			return p
+		else: return self._pointers( p )
+
+	def _pointers( self, p ):
 		if self.pointer: p.append( self )
 		if self.child: return self.child.pointers( p )
 		else: return p
@@ -710,6 +971,7 @@ class SomeThing(object):
 		'__builtin_va_list' :	'VOIDP',
 	}
 
+	@_resolved
 	def rffi_type( self ):
 		type = self.type()
 		typedef = self.typedef()
@@ -820,6 +1082,7 @@ class SomeThing(object):
 
 
 	#Usually, ctypes does strict type checking. This means, if you have POINTER(c_int) in the argtypes list of a function or as the type of a member field in a structure definition, only instances of exactly the same type are accepted. There are some exceptions to this rule, where ctypes accepts other objects. For example, you can pass compatible array instances instead of pointer types. So, for POINTER(c_int), ctypes accepts an array of c_int: - from the ctypes tutorial
+	@_resolved
 	def ctypes_type( self ):		# TODO array for all types
 		import ctypes
 		type = self.type()
@@ -904,6 +1167,7 @@ class SomeThing(object):
 		return ctype
 
 
+	@_resolved
 	def typedef( self ):
 		if isclass( self.ast, 'IdentifierType' ):
 			if self.ast.names:
@@ -922,6 +1186,7 @@ class SomeThing(object):
 		'int64_t'	:	'int64',
 		'uint64_t'	:	'uint64',
 	}
+	@_resolved
 	def type(self):
 		if isclass( self.ast, 'IdentifierType' ):
 			if not self.ast.names: return '<unknown-type>'
@@ -964,6 +1229,7 @@ class SomeThing(object):
 
 
 class Array( SomeThing ):
+	@_resolved
 	def length( self ):
 		if self.ast.dim:
 			val = self.ast.dim
@@ -976,7 +1242,7 @@ class Array( SomeThing ):
 					return 0
 				else: return r
 			elif isclass( val, 'ID' ):
-				e = Enum.search_for_enum_with_key( val.name )
+				e = SomeThing.Symbols.get_enum_with_key( val.name )
 				if e: return e.values_by_key[ val.name ]
 			elif isclass( val, 'TernaryOp' ):
 				print('-------------------TODO TernaryOp parser')
@@ -994,13 +1260,10 @@ class Array( SomeThing ):
 
 class Enum( SomeThing ):		# an enum can be nameless
 	@staticmethod
-	def get_enum_value( name ): return SomeThing.Enums[ name ].enum_value( name )
+	def get_enum_value( name ): return SomeThing.Symbols.get_enum_value( name )
 
 	@staticmethod
-	def search_for_enum_with_key( key ):
-		for name in SomeThing.Enums:
-			if key in SomeThing.Enums[name].values_by_key:
-				return SomeThing.Enums[name]
+	def search_for_enum_with_key( key ): return SomeThing.Symbols.get_enum_with_key( key )
 
 	@staticmethod
 	def compute_binaryop( binop ):
@@ -1097,6 +1360,7 @@ class Enum( SomeThing ):		# an enum can be nameless
 					raise NotImplementedError
 
 			Enum.Enums[ val.name ] = self		# TODO raise if val.name already in Enums?
+			SomeThing.Symbols.add_enum_key( val.name, self )
 			self.values.append( (val.name, i) )
 			self.values_by_key[ val.name ] = i
 			#if not val.value:
@@ -1138,6 +1402,12 @@ class Enum( SomeThing ):		# an enum can be nameless
 			else: r += ' "%s" : %s, ' %(name,value)
 		return r
 
+	def python_values( self ):
+		'''(dict name, [(key, value)]) like _gen writes them, the dict name is None for simple globals'''
+		strip = lambda n: n.startswith('_') and n[1:] not in self.ReservedNames and n[1:] or n
+		if self.is_named_enum(): return strip( self.name() ), list( self.values )
+		return None, [ (strip(name), value) for name,value in self.values ]
+
 
 class Function( SomeThing ):
 
@@ -1234,18 +1504,24 @@ class Function( SomeThing ):
 
 		elif self.static: return '# static function: %s'	%name
 		else:
-			args = ''
+			restype, args = self.ctypes_signature()
 			if len(self.args)==1 and self.args[0].type() == 'void':
-				if self.args[0].name(): args = '("%s",		ctypes.c_void_p)' %self.args[0].name()
-
-			else:
-				for item in self.args:
-					_n = str(item.name())	# can return None
-					_n = _n.replace('None', 'none')
-					args += '\n\t("%s",		%s),' %(_n, item.ctypes_type())
-			restype = self.returns.ctypes_type()
+				args = ''.join( ['("%s",		%s)' %arg for arg in args] )
+			else: args = ''.join( ['\n\t("%s",		%s),' %arg for arg in args] )
 			return '%s = _rpythonic_function_(\t\t"%s", %s, [%s] )\n' %(name, name, restype, args )
 
+	def ctypes_signature( self ):
+		'''(restype, [(argname, argtype)]) as ctypes expressions'''
+		args = []
+		if len(self.args)==1 and self.args[0].type() == 'void':
+			if self.args[0].name(): args.append( (self.args[0].name(), 'ctypes.c_void_p') )
+		else:
+			for item in self.args:
+				_n = str(item.name())	# can return None
+				_n = _n.replace('None', 'none')
+				args.append( (_n, item.ctypes_type()) )
+		return self.returns.ctypes_type(), args
+
 	def gen_python( self ):
 		if self.body:
 			args = ''; name = self.name()
@@ -1261,14 +1537,16 @@ class Union( SomeThing ):
 	def mark_cyclic():
 		r = []
 		things = SomeThing.get_unions_and_structs()
+		by_name = {}
+		for c in things:
+			n = c._name()
+			if n not in by_name: by_name[ n ] = c
 		for p in things:
 			for sub in p.substructures():
-				for c in things:
-					if c._name() == sub.type().split(':')[-1]:
-						if c.contains_struct( p.type().split(':')[-1] ):
-							sub.cyclic = True; r.append( c )
-							print( 'found cyclic member', sub.name() )
-						break
+				c = by_name.get( sub.type().split(':')[-1] )
+				if c is not None and c.contains_struct( p.type().split(':')[-1] ):
+					sub.cyclic = True; r.append( c )
+					print( 'found cyclic member', sub.name() )
 		return r
 
 	def setup(self):
@@ -1354,6 +1632,20 @@ class Union( SomeThing ):
 			#return '%s._fields_=[%s\n]\n' %(name, a)
 			return '__freeze_rpythonic_struct( %s, [%s\n])\n' %(name, a)
 
+	def ctypes_fields( self ):
+		'''(name, ctypes type) of the named fields, opaque ones are left out like gen_ctypes does'''
+		return [ (item.name(), item.ctypes_type()) for item in self.fields if item.name() ]
+
+	def ctypes_kind( self ):		# U union, A struct with arrays, S struct
+		if self.tag == 'Union': return 'U'
+		return self.contains_arrays and 'A' or 'S'
+
+	def gen_ctypes_table( self, declare=False ):
+		'''the row of _RPYTHONIC_STRUCTS_, or of _RPYTHONIC_FIELDS_ with the types as expressions to evaluate later'''
+		if declare: return '\t(%r, %r),' %(self._name(), self.ctypes_kind())
+		a = ''.join( [ '\n\t\t(%r, %r),' %field for field in self.ctypes_fields() ] )
+		return '\t(%r, [%s\n\t]),' %(self._name(), a)
+
 	def gen_python( self, declare=False  ):
 		global TT
 		r = [ 'class %s(object):	# <%s>' %(self._name(),self.tag) ]
@@ -1373,6 +1665,785 @@ class Struct( Union ):
 	pass
 
 
+############### Macro Constants ###############
+class MacroConstants(object):
+	'''
+	folds object-like macros into python constants with a C constant expression evaluator:
+		integer, float, char and string literals with their suffixes, casts, unary, binary and ternary
+		operators, and references to other macros and to enum keys.
+	integers keep their C type as (bits, unsigned), so ~0U, shifts and casts wrap like they do on LP64.
+	values are folded in dependency order, a macro that can not be folded is kept in .failed with the reason.
+	like the old parse_macro, a macro that is only a char literal exports a one character string (see export),
+	and one that only names a type, #define MYINT int, folds to 0 or 0.0.
+	'''
+	TOKENS = re.compile( r'''\s*(?:
+		(?P<float>(?:\d+\.\d*|\.\d+)(?:[eE][-+]?\d+)?[fFlL]?|\d+[eE][-+]?\d+[fFlL]?) |
+		(?P<int>(?:0[xX][0-9a-fA-F]+|0[bB][01]+|\d+)[uUlL]*) |
+		(?P<char>L?'(?:\\.|[^\\'])+') |
+		(?P<string>L?"(?:\\.|[^\\"])*") |
+		(?P<name>[A-Za-z_]\w*) |
+		(?P<op><<|>>|<=|>=|==|!=|&&|\|\||[-+*/%<>&|^~!?:()])
+	)''', re.VERBOSE )
+	ESCAPES = { 'n':'\n', 't':'\t', 'r':'\r', '0':'\0', 'a':'\a', 'b':'\b', 'f':'\f', 'v':'\v', '\\':'\\', "'":"'", '"':'"', '?':'?' }
+	INT = (32,False); UINT = (32,True); LONG = (64,False); ULONG = (64,True)
+	TYPE_WORDS = {		# LP64
+		'char':8, 'short':16, 'int':32, 'long':64, '_Bool':1, 'float':None, 'double':None,
+		'signed':32, 'unsigned':32, 'const':0, 'volatile':0,
+		'int8_t':8, 'int16_t':16, 'int32_t':32, 'int64_t':64, 'intptr_t':64, 'ssize_t':64,
+		'uint8_t':-8, 'uint16_t':-16, 'uint32_t':-32, 'uint64_t':-64, 'uintptr_t':-64, 'size_t':-64,
+	}
+	BINARY = [		# precedence, lowest first
+		['||'], ['&&'], ['|'], ['^'], ['&'], ['==','!='], ['<','>','<=','>='], ['<<','>>'], ['+','-'], ['*','/','%'],
+	]
+
+	def __init__( self, defines, enum_value=None, typedef=None ):
+		'''
+		defines		- list of (name, body), function-like macros are ignored
+		enum_value	- enum_value(name) returns the value of an enum key or None
+		typedef		- typedef(name) returns the C type words of a typedef or None, for casts
+		'''
+		self.bodies = dict( defines )
+		self.enum_value = enum_value or (lambda name: None)
+		self.typedef = typedef or (lambda name: None)
+		self.values = {}		# name -> python value
+		self.types = {}			# name -> ctype
+		self.order = []			# names in dependency order
+		self.failed = {}		# name -> reason
+		self.chars = set()		# names of the lone char literals
+		self.pending = set()	# names being folded, to catch recursive macros
+		for name, body in defines:
+			try: self.fold( name )
+			except ValueError: pass
+
+	def fold( self, name ):
+		if name in self.values: return self.values[ name ]
+		if name in self.failed: raise ValueError( 'depends on %s' %name )
+		if name in self.pending: raise ValueError( 'recursive macro %s' %name )
+		self.pending.add( name )
+		body = self.bodies[ name ]
+		try: value, ctype = self.type_body( body ) or self.evaluate( body )
+		except (ValueError, ZeroDivisionError) as err:
+			self.failed[ name ] = str(err)
+			raise ValueError( 'depends on %s' %name )
+		finally: self.pending.discard( name )
+		if [ kind for kind, text in self.tokenize( body ) ] == [ 'char' ]: self.chars.add( name )
+		self.values[ name ] = value
+		self.types[ name ] = ctype
+		self.order.append( name )
+		return value
+
+	def export( self, name ):
+		'''the value of the macro global, lone char literals as strings, other macros using them see the int'''
+		value = self.values[ name ]
+		if name in self.chars: return chr( value & 0xff )
+		return value
+
+	def type_body( self, body ):
+		'''(0, ctype) or (0.0, 'float') for a body naming a type, else None'''
+		words = body.replace( '(', ' ' ).replace( ')', ' ' ).split()
+		if not words or not set( words ) - set( ['const','volatile'] ): return None
+		if [ word for word in words if word not in self.TYPE_WORDS ]: return None
+		ctype = self.ctype_of( words )
+		if ctype == 'float': return (0.0, 'float')
+		return (0, ctype)
+
+	def tokenize( self, body ):
+		tokens = []; pos = 0; body = body.strip()
+		while pos < len(body):
+			m = self.TOKENS.match( body, pos )
+			if not m or m.end() == pos: raise ValueError( 'can not tokenize: %s' %body[pos:] )
+			pos = m.end()
+			tokens.append( (m.lastgroup, m.group(m.lastgroup)) )
+		return tokens
+
+	def evaluate( self, body ):
+		'''returns (value, ctype), ctype is (bits, unsigned), 'float' or 'str' '''
+		outer = getattr( self, 'tokens', None ), getattr( self, 'pos', 0 )		# macros fold the macros they use first
+		self.tokens = self.tokenize( body ); self.pos = 0
+		try:
+			if not self.tokens: raise ValueError( 'empty' )
+			r = self.ternary()
+			if self.pos != len(self.tokens): raise ValueError( 'unexpected %s' %self.tokens[self.pos][1] )
+		finally: self.tokens, self.pos = outer
+		return r
+
+	## parser ##
+	def peek( self ):
+		if self.pos < len(self.tokens): return self.tokens[ self.pos ]
+		return (None, None)
+
+	def take( self, op=None ):
+		kind, text = self.peek()
+		if kind is None or (op is not None and text != op): raise ValueError( 'expected %s' %(op or 'more') )
+		self.pos += 1
+		return kind, text
+
+	def ternary( self ):
+		cond = self.binary( 0 )
+		if self.peek()[1] != '?': return cond
+		self.take( '?' ); a = self.ternary(); self.take( ':' ); b = self.ternary()
+		if 'str' in (a[1],b[1]): return a if cond[0] else b
+		ctype = self.common( a[1], b[1] )
+		return self.convert( (a if cond[0] else b), ctype )
+
+	def binary( self, level ):
+		if level == len(self.BINARY): return self.unary()
+		left = self.binary( level+1 )
+		while self.peek()[0] == 'op' and self.peek()[1] in self.BINARY[ level ]:
+			op = self.take()[1]
+			right = self.binary( level+1 )
+			left = self.operate( op, left, right )
+		return left
+
+	def unary( self ):
+		kind, text = self.peek()
+		if kind == 'op' and text in ('-','+','~','!'):
+			self.take()
+			v, ctype = self.unary()
+			if ctype == 'str': raise ValueError( 'string operand' )
+			if text == '!': return (int(not v), self.INT)
+			ctype = self.promote( ctype )
+			if text == '~':
+				if ctype == 'float': raise ValueError( '~ on float' )
+				v = ~v
+			elif text == '-': v = -v
+			return self.wrap( v, ctype )
+		if kind == 'op' and text == '(':
+			cast = self.cast_type()
+			if cast is not None: return self.convert( self.unary(), cast )
+			self.take( '(' ); r = self.ternary(); self.take( ')' )
+			return r
+		return self.primary()
+
+	def cast_type( self ):
+		'''the type of a cast starting at the current "(", else None'''
+		end = self.pos + 1; words = []
+		while end < len(self.tokens):
+			kind, text = self.tokens[ end ]
+			if kind == 'op' and text == ')': break
+			if (kind == 'op' and text == '*') or (kind == 'name' and '*' not in words): words.append( text )
+			else: return None
+			end += 1
+		else: return None
+		if not words or words[0] == '*': return None
+		expanded = []
+		for i, word in enumerate( words ):
+			if word in self.TYPE_WORDS or word in ('struct','union','enum','void','*'): expanded.append( word )
+			elif word in self.bodies or self.enum_value( word ) is not None: return None
+			elif self.typedef( word ): expanded += self.typedef( word )
+			elif i and words[i-1] in ('struct','union','enum'): expanded.append( word )		# the tag
+			else: return None
+		self.pos = end + 1
+		if '*' in expanded: return self.ULONG		# pointers are unsigned long on LP64
+		return self.ctype_of( expanded )
+
+	def ctype_of( self, words ):
+		if 'float' in words or 'double' in words: return 'float'
+		if set( words ) & set( ['struct','union','void','function'] ): raise ValueError( 'cast to %s' %' '.join(words) )
+		if 'enum' in words: return self.INT
+		unsigned = 'unsigned' in words
+		bits = 32
+		if 'char' in words: bits = 8
+		elif 'short' in words: bits = 16
+		elif 'long' in words: bits = 64
+		elif '_Bool' in words: return (1, True)
+		else:
+			for word in words:
+				size = self.TYPE_WORDS.get( word )
+				if size and word.endswith('_t'):
+					bits = abs(size); unsigned = size < 0
+		return (bits, unsigned)
+
+	def primary( self ):
+		kind, text = self.take()
+		if kind == 'int': return self.int_literal( text )
+		if kind == 'float':
+			if text[-1] in 'fFlL': text = text[:-1]
+			v = float(text)
+			mantissa = re.split( '[eE]', text )[0]
+			if v == float('inf') or (v == 0.0 and re.search( '[1-9]', mantissa )): raise ValueError( 'out of range for double: %s' %text )		# long double limits
+			return (v, 'float')
+		if kind == 'char':
+			chars = self.unescape( text.lstrip('L')[1:-1] )
+			if len(chars) != 1: raise ValueError( 'multi-character constant %s' %text )
+			v = ord(chars)
+			if v > 127: v -= 256		# char is signed
+			return (v, self.INT)
+		if kind == 'string':
+			s = self.unescape( text.lstrip('L')[1:-1] )
+			while self.peek()[0] == 'string': s += self.unescape( self.take()[1].lstrip('L')[1:-1] )
+			return (s, 'str')
+		if kind == 'name':
+			if self.peek()[1] == '(': raise ValueError( 'call to %s' %text )
+			if text in self.bodies:
+				value = self.fold( text )
+				return (value, self.types[ text ])
+			value = self.enum_value( text )
+			if value is not None: return (value, self.INT)
+			raise ValueError( 'unknown name %s' %text )
+		raise ValueError( 'unexpected %s' %text )
+
+	def unescape( self, s ):
+		if '\\' not in s: return s
+		r = []; i = 0
+		while i < len(s):
+			c = s[i]
+			if c != '\\': r.append( c ); i += 1; continue
+			n = s[ i+1 : i+2 ]
+			if n == 'x':
+				m = re.match( '[0-9a-fA-F]+', s[i+2:] )
+				r.append( chr( int(m.group(), 16) & 0xff ) ); i += 2 + len(m.group())
+			elif n in '01234567' and n:
+				m = re.match( '[0-7]{1,3}', s[i+1:] )
+				r.append( chr( int(m.group(), 8) & 0xff ) ); i += 1 + len(m.group())
+			elif n in self.ESCAPES: r.append( self.ESCAPES[n] ); i += 2
+			else: raise ValueError( 'bad escape \\%s' %n )
+		return ''.join( r )
+
+	def int_literal( self, text ):
+		digits = text.rstrip( 'uUlL' ); suffix = text[ len(digits): ].lower()
+		if digits[:2].lower() == '0x': v = int( digits[2:], 16 )
+		elif digits[:2].lower() == '0b': v = int( digits[2:], 2 )
+		elif len(digits) > 1 and digits[0] == '0': v = int( digits, 8 )
+		else: v = int( digits )
+		decimal = digits[0] != '0' or digits == '0'
+		if 'u' in suffix: candidates = [self.UINT, self.ULONG]
+		elif decimal: candidates = [self.INT, self.LONG]
+		else: candidates = [self.INT, self.UINT, self.LONG, self.ULONG]
+		if 'l' in suffix: candidates = [ c for c in candidates if c[0] == 64 ]
+		for bits, unsigned in candidates:
+			if v < 2**(bits - (not unsigned)): return (v, (bits, unsigned))
+		return (v, self.ULONG)	# too large, gcc warns and uses unsigned long
+
+	## C arithmetic ##
+	def promote( self, ctype ):
+		if ctype == 'float' or ctype[0] >= 32: return ctype
+		return self.INT
+
+	def common( self, a, b ):
+		if 'float' in (a,b): return 'float'
+		a = self.promote( a ); b = self.promote( b )
+		if a[0] != b[0]: return max( a, b )
+		return (a[0], a[1] or b[1])
+
+	def wrap( self, v, ctype ):
+		if ctype == 'float': return (float(v), ctype)
+		bits, unsigned = ctype
+		v = int(v) & ((1 << bits) - 1)
+		if not unsigned and v >= 1 << (bits-1): v -= 1 << bits
+		return (int(v), ctype)		# int again on python2 when it fits
+
+	def convert( self, value, ctype ):
+		v, old = value
+		if old == 'str': raise ValueError( 'cast of a string' )
+		if ctype == (1, True): return (int(bool(v)), ctype)
+		return self.wrap( v, ctype )
+
+	def operate( self, op, left, right ):
+		(a, ta), (b, tb) = left, right
+		if 'str' in (ta,tb): raise ValueError( 'string operand of %s' %op )
+		if op == '&&': return (int(bool(a) and bool(b)), self.INT)
+		if op == '||': return (int(bool(a) or bool(b)), self.INT)
+		if op in ('<<','>>'):
+			if 'float' in (ta,tb): raise ValueError( 'float operand of %s' %op )
+			ctype = self.promote( ta )
+			if b < 0 or b >= ctype[0]: raise ValueError( 'shift by %s' %b )
+			return self.wrap( a << b if op == '<<' else a >> b, ctype )
+		ctype = self.common( ta, tb )
+		a = self.convert( left, ctype )[0]; b = self.convert( right, ctype )[0]
+		if op in ('==','!=','<','>','<=','>='):
+			r = { '==':a==b, '!=':a!=b, '<':a<b, '>':a>b, '<=':a<=b, '>=':a>=b }[ op ]
+			return (int(r), self.INT)
+		if op == '+': v = a + b
+		elif op == '-': v = a - b
+		elif op == '*': v = a * b
+		elif ctype == 'float':
+			if op == '/': v = a / b
+			else: raise ValueError( 'float operand of %' )
+		elif op in ('/','%'):
+			q = abs(a) // abs(b)		# C truncates toward zero
+			if (a < 0) != (b < 0): q = -q
+			v = q if op == '/' else a - b*q
+		elif ctype == 'float': raise ValueError( 'float operand of %s' %op )
+		elif op == '&': v = a & b
+		elif op == '^': v = a ^ b
+		elif op == '|': v = a | b
+		return self.wrap( v, ctype )
+
+
+############### Parse Cache ###############
+def _digest( *parts ):
+	h = hashlib.sha1()
+	for part in parts:
+		if not isinstance( part, bytes ): part = part.encode('utf-8')
+		h.update( part ); h.update( b'\0' )
+	return h.hexdigest()
+
+def _file_digest( path ):
+	f = open( path, 'rb' ); data = f.read(); f.close()
+	return _digest( data )
+
+def _parse_depfile( path ):
+	'''
+	parse the make rule written by "cpp -MD -MF path", returns the absolute paths of all dependencies
+	'''
+	f = open( path, 'rb' ); data = f.read().decode('utf-8'); f.close()
+	data = data.replace( '\\\n', ' ' ).replace( '\\ ', '\0' )
+	if ':' in data: data = data.split(':',1)[-1]	# drop the make target "-:"
+	deps = []
+	for dep in data.split():
+		dep = os.path.abspath( dep.replace('\0',' ') )
+		if dep not in deps: deps.append( dep )
+	return deps
+
+class ParseCache(object):
+	'''
+	content addressed cache of preprocessed headers and parsed ASTs, stored in CACHEDIR/parsecache
+		<key>.deps		- json: header, and the digest of every file cpp reported as a dependency
+		<key>-<deps>.ast	- pickle: cleaned preprocessor output and macro definitions
+		<key>-<deps>.tree	- pickle: the pycparser AST, loaded only when needed (see load_ast)
+	<key> is the cpp command line + source + generator digest, <deps> is the digest of all dependency contents,
+	so an entry is only reused while every included file is unchanged.
+	'''
+	def __init__(self):
+		self.enabled = '--no-parse-cache' not in sys.argv
+		self.hits = 0
+		self.misses = 0
+		self.invalidated = 0
+		self._generator_digest = None
+
+	def get_dir( self ):
+		path = os.path.join( CACHEDIR, 'parsecache' )
+		if not os.path.isdir( path ): os.makedirs( path )
+		return path
+
+	def generator_digest( self ):	# cleaned output and AST layout depend on rpythonic and pycparser
+		if self._generator_digest is None:
+			paths = [ os.path.join(RPYTHONIC_DIR, 'rpythonic.py') ]
+			for n in 'c_ast.py c_lexer.py c_parser.py'.split():
+				paths.append( os.path.join(RPYTHONIC_DIR, 'pycparser', n) )
+			self._generator_digest = _digest( VERSION, *[_file_digest(p) for p in paths] )
+		return self._generator_digest
+
+	def make_key( self, args, source ):
+		return _digest( self.generator_digest(), ' '.join(args), source )
+
+	def lookup( self, key ):
+		manifest = os.path.join( self.get_dir(), key+'.deps' )
+		if not os.path.isfile( manifest ):
+			self.misses += 1
+			return None
+		try: info = json.load( open(manifest,'rb') )
+		except ValueError: return self.drop( key )
+		digests = []
+		for path, digest in info['deps']:
+			if not os.path.isfile( path ) or _file_digest( path ) != digest:
+				print( 'parse cache: dependency changed: %s' %path )
+				self.misses += 1
+				return None
+			digests.append( digest )
+		url = os.path.join( self.get_dir(), '%s-%s.ast' %(key, _digest(*digests)) )
+		if not os.path.isfile( url ):
+			self.misses += 1
+			return None
+		try: f = open( url, 'rb' ); entry = pickle.load( f ); f.close()
+		except Exception: return self.drop( key )		# truncated or from an interrupted store
+		entry['ast'] = url[ : -4 ] + '.tree'
+		self.hits += 1
+		pprint( 'parse cache hit: %s' %info['header'], 2 )
+		return entry
+
+	def dump( self, url, data ):		# a temp file renamed into place, readers never see a partial entry
+		tmp = '%s.%s' %(url, os.getpid())
+		try:
+			f = open( tmp, 'wb' )
+			try:
+				if isinstance( data, bytes ): f.write( data )
+				else: pickle.dump( data, f, pickle.HIGHEST_PROTOCOL )
+			finally: f.close()
+			os.rename( tmp, url )
+		except:
+			if os.path.isfile( tmp ): os.remove( tmp )
+			raise
+
+	def store( self, key, header, deps, entry ):
+		info = { 'header':header, 'deps':[ (path, _file_digest(path)) for path in deps ] }
+		url = os.path.join( self.get_dir(), '%s-%s.ast' %(key, _digest(*[d for p,d in info['deps']])) )
+		limit = sys.getrecursionlimit()		# deeply nested declarators
+		sys.setrecursionlimit( max(limit, 10000) )
+		entry = dict( entry ); ast = entry.pop( 'ast' )
+		try:		# the manifest last, lookup finds nothing until the pickles are complete
+			self.dump( url[:-4]+'.tree', ast )
+			self.dump( url, entry )
+			self.dump( os.path.join(self.get_dir(), key+'.deps'), json.dumps(info).encode('utf-8') )
+		except Exception as err:		# the parse is fine, only the next wrap parses again
+			print( 'WARN - parse cache: can not store %s: %s' %(header, err) )
+		finally: sys.setrecursionlimit( limit )
+
+	def load_ast( self, url ):
+		'''the pickled AST of a lookup, None when the entry is broken and was dropped'''
+		try: f = open( url, 'rb' ); ast = pickle.load( f ); f.close()
+		except Exception:
+			self.hits -= 1
+			return self.drop( os.path.basename(url).split('-')[0] )
+		return ast
+
+	def drop( self, key ):
+		print( 'WARN - parse cache: dropping broken entry: %s' %key )
+		self.misses += 1
+		path = self.get_dir()
+		for n in os.listdir( path ):
+			if n.startswith( key ):
+				try: os.remove( os.path.join(path,n) )
+				except OSError: pass		# removed by another wrap
+		return None
+
+	def invalidate( self, header=None ):
+		'''
+		remove the entries for a header (by path), or all entries if no header is given
+		'''
+		if header: header = os.path.abspath( header )
+		path = self.get_dir()
+		for name in os.listdir( path ):
+			if not name.endswith('.deps'): continue
+			key = name[ : -5 ]
+			if header:
+				info = json.load( open(os.path.join(path,name),'rb') )
+				if os.path.abspath( info['header'] ) != header: continue
+			for n in os.listdir( path ):
+				if n.startswith( key ): os.remove( os.path.join(path,n) )
+			self.invalidated += 1
+
+	def stats( self ):
+		return { 'hits':self.hits, 'misses':self.misses, 'invalidated':self.invalidated }
+
+PARSE_CACHE = ParseCache()
+
+
+############### OO API ###############
+## the naming work magicheader.py used to do at every import, the runtime now only checks which functions the libraries have ##
+def _oo_altnames( names ):
+	'''name -> name without its lower case prefix, when at least two other names share that prefix'''
+	names = sorted( names )
+	altnames = {}
+	for name in names:
+		prefix = name[0]
+		for char in name[1:]:
+			if char.isupper(): break
+			prefix += char
+		if prefix != name:
+			end = prefix[:-1] + chr( ord(prefix[-1]) + 1 )
+			hits = bisect.bisect_left( names, end ) - bisect.bisect_left( names, prefix ) - 1
+			if hits >= 2: altnames[ name ] = name[ len(prefix) : ]
+	return altnames
+
+def _oo_method_prefixes( names ):
+	'''
+	(prefixes, [(alias, name)]) of the methods of one struct wrapper: the prefixes most of the function names share,
+	and short names without them. an alias can point to another alias.
+	'''
+	names = list( names )
+	possibles = {}
+	rank = []		# rank by longest name
+	if len(names) > 3000: print('too many functions to use this hack')
+	else:
+		for n1 in names:
+			prefix = ''
+			for i,char in enumerate(n1):
+				prefix += char
+				if prefix not in possibles:
+					possibles[ prefix ] = 0
+					for n2 in names:
+						if n2.startswith( prefix ):
+							possibles[ prefix ] += 1
+
+					if not rank or len(prefix) > len(rank[-1]) and possibles[prefix] > len(names)/4:
+						rank.append( prefix )
+
+	top = []
+	while rank:
+		best = rank.pop()
+		if possibles[best] > len(names)/2 and best not in names:
+			if best.endswith('_set_') or best.endswith('_get_'): best = best[ : -4 ]
+			elif best.endswith('Set') or best.endswith('Get'): best = best[ : -3 ]
+
+			rem = []
+			for other in rank:
+				if best.startswith(other): rem.append( other )
+			for r in rem: rank.remove( r )
+
+			if best not in top: top.append( best )
+
+		if len(top) > 3: break
+
+	for n in names:		# find shortest prefixes #
+		prefix = ''
+		for i,char in enumerate(n):		# cammelCase
+			if i==0: prefix += char; continue
+			if char.isupper() and len(prefix) >= 2: break
+			prefix += char
+		if prefix and prefix != n and len(prefix) >= 2:
+			hits = 0
+			for other in names:
+				if other.startswith( prefix ): hits += 1
+			if hits >= 2 and prefix not in top:
+				top.append( prefix )
+				if len(top) >= 6: break
+
+	aliases = []
+	for n in names:		# grows with the aliases, they are shortened again
+		for prefix in top:
+			if n.startswith(prefix) and n[len(prefix):] not in names:
+				alt = n[ len(prefix) : ]
+				if alt and alt != n and alt not in PYTHON_RESERVED_KEYWORDS and not alt.isdigit() and not alt[0].isdigit():
+					aliases.append( (alt, n) )
+					names.append( alt )
+	return top, aliases
+
+
+def _value_struct( ctype, declared ):
+	'''the declared struct a ctypes expression holds by value: "name" or "( name * 3 )", not "ctypes.POINTER(name)"'''
+	m = re.match( r'[\s(]*(\w+)\s*(?![.\w])', ctype )
+	if m and m.group(1) in declared: return m.group(1)
+
+def _code_names( source ):
+	'''the names python code refers to, also in the functions it defines, None when it does not compile'''
+	try: codes = [ compile( source, '<ctypes_footer>', 'exec' ) ]
+	except SyntaxError: return None
+	names = set()
+	while codes:
+		code = codes.pop()
+		names.update( code.co_names )
+		codes += [ c for c in code.co_consts if hasattr( c, 'co_names' ) ]
+	return names
+
+
+############### GIL policy ###############
+## functions bound through a PyDLL handle keep the GIL during the call: no release and reacquire around
+## nanosecond getters, but other threads wait for the whole call, so only names and signatures that look trivial.
+GIL_HOLDING_WORDS = 'get is has peek'.split()
+GIL_RELEASING_WORDS = 'wait sync read write recv send poll select sleep lock join flush run main iteration dispatch load save open close connect accept fetch request file contents stream socket query print image pixels state timeout'.split()
+
+def _gil_holding( name, restype, args ):
+	'''heuristic: accessors with few plain arguments, nothing that blocks, does i/o or calls back'''
+	words = [ w.lower() for w in re.findall( r'[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])', name ) ]
+	if not set( words ) & set( GIL_HOLDING_WORDS ) or set( words ) & set( GIL_RELEASING_WORDS ): return False
+	if len( args ) > 4: return False
+	for argname, ctype in args:
+		if 'CFUNCTYPE' in ctype: return False
+	return True
+
+
+############### Wrapper Descriptor ###############
+def _py_literal( value ):
+	'''python source of a folded constant or enum dict, readable by ast.literal_eval on python 2 and 3'''
+	if type(value) is dict: return '{%s}' %', '.join( ['%s: %s' %(_py_literal(k), _py_literal(v)) for k,v in sorted(value.items())] )
+	if type(value) is float: return repr( value )
+	if type(value) in (int, type(2**64)) : return '%d' %value		# no L suffix from python2 longs
+	return repr( value )
+
+class WrapperDescriptor(object):
+	'''
+	compact wrapper of output_format "descriptor", read by _rpythonic_descriptor_ in magicheader.py:
+		b'RPYD', version and index size as little endian uint32, the index, then the records.
+		index lines are "kind<tab>name<tab>offset<tab>length", records are tab separated text:
+			B	- blocks of lines: globals (name, literal), declare (struct, U/S/A), returns (struct, function), types,
+				  depends (struct, the structs it holds by value - they must be frozen first),
+				  oo (struct, short name, methods, prefixes, alias=name - comma separated), enum_aliases and stripped (new name, name)
+			S	- struct fields in freeze order: name, type id, ...
+			C	- function signature: restype id, argname, type id, ...
+	ctypes type expressions are stored once in the types block and referred to by id.
+	'''
+	FILENAME = 'wrapper.rpyd'
+	VERSION = 1
+	def __init__( self ):
+		self.blocks = {}		# name -> lines
+		self.records = []		# (kind, name, text)
+		self.types = []
+		self.type_ids = {}
+
+	def type_id( self, ctype ):
+		if ctype not in self.type_ids:
+			self.type_ids[ ctype ] = str( len(self.types) )
+			self.types.append( ctype )
+		return self.type_ids[ ctype ]
+
+	def add_line( self, block, *fields ): self.blocks.setdefault( block, [] ).append( '\t'.join(fields) )
+	def add( self, kind, name, fields ): self.records.append( (kind, name, '\t'.join(fields)) )
+
+	def tobytes( self ):
+		self.blocks[ 'types' ] = self.types
+		records = [ ('B', name, '\n'.join(self.blocks[name])) for name in sorted(self.blocks) ] + self.records
+		index = []; data = []; offset = 0
+		for kind, name, text in records:
+			if not isinstance( text, bytes ): text = text.encode('utf-8')
+			index.append( '%s\t%s\t%s\t%s' %(kind, name, offset, len(text)) )
+			data.append( text ); offset += len( text )
+		index = '\n'.join( index ).encode('utf-8')
+		return b'RPYD' + struct.pack( '<II', self.VERSION, len(index) ) + index + b''.join( data )
+
+
+############### Wrapper Manifest ###############
+def _ast_text( node ):
+	buf = StringIO()
+	node.show( buf, attrnames=True )	# without coords, moving a declaration is not a change
+	return buf.getvalue()
+
+class WrapperManifest(object):
+	'''
+	sidecar CACHEDIR/<name>/manifest.json of the last generated wrapper:
+		key			- digest of the cleaned source, generator and wrap options, the wrapper is up to date while it matches
+		output		- digest of __init__.py, and of wrapper.rpyd for output_format="descriptor"
+		symbols		- "kind:name" -> [fingerprint, emitted text]
+	regeneration reuses the text of every declaration whose fingerprint did not change,
+	and reports the added, removed and changed symbols.
+	'''
+	def __init__( self, path ):
+		self.path = path
+		self.key = self.output = None
+		self.old = {}
+		self.symbols = {}
+		self.reused = 0
+		if os.path.isfile( path ) and '--no-manifest' not in sys.argv:
+			try:
+				info = json.load( open(path,'rb') )
+				self.key = info['key']; self.output = info['output']; self.old = info['symbols']
+			except (ValueError, KeyError): print( 'WARN - ignoring broken manifest: %s' %path )
+
+	def is_up_to_date( self, key, *output_paths ):
+		if self.key != key: return False
+		data = []
+		for path in output_paths:
+			if not os.path.isfile( path ): return False
+			f = open( path, 'rb' ); data.append( f.read() ); f.close()
+		return _digest( *data ) == self.output
+
+	def emit( self, kind, name, fingerprint, generate ):
+		key = '%s:%s' %(kind,name)
+		old = self.old.get( key )
+		if old and old[0] == fingerprint:
+			text = old[1]
+			if str is bytes: text = text.encode('utf-8')		# json gives unicode on python2
+			self.reused += 1
+		else: text = generate()
+		self.symbols[ key ] = [ fingerprint, text ]
+		return text
+
+	def report( self ):
+		added = [ k for k in self.symbols if k not in self.old ]
+		removed = [ k for k in self.old if k not in self.symbols ]
+		changed = [ k for k in self.symbols if k in self.old and self.old[k][1] != self.symbols[k][1] ]
+		pprint( 'manifest: %s added, %s removed, %s changed, %s reused' %(len(added), len(removed), len(changed), self.reused), 2 )
+		if self.old:		# the first generation adds everything
+			for label, keys in (('added',added), ('removed',removed), ('changed',changed)):
+				keys.sort()
+				if len(keys) > 20: keys = keys[ : 20 ] + [ '... %s more' %(len(keys)-20) ]
+				for k in keys: print( '\t%s: %s' %(label, k) )
+		return { 'added':added, 'removed':removed, 'changed':changed }
+
+	def save( self, key, output_digest ):
+		info = { 'key':key, 'output':output_digest, 'symbols':self.symbols }
+		f = open( self.path, 'w' ); json.dump( info, f ); f.close()
+
+
+def _ast_names( node ):
+	'''typedef names and identifiers a declaration refers to, and the enum keys it defines'''
+	refs = set(); keys = []
+	stack = [ node ]
+	while stack:
+		n = stack.pop()
+		if isclass( n, 'IdentifierType' ): refs.update( n.names )
+		elif isclass( n, 'ID' ): refs.add( n.name )
+		elif isclass( n, 'Enumerator' ): keys.append( n.name )
+		stack.extend( [child for name,child in n.children()] )
+	return refs, keys
+
+def _declaration_digests( exts ):
+	'''
+	digest of each top level declaration: its AST text and the digests of the typedefs and enums it refers to.
+	C declares those before use, so only earlier declarations are looked up, and a changed typedef
+	only changes the digests of the declarations that depend on it.
+	'''
+	digests = []
+	defined = {}		# typedef name or enum key -> indices of the declarations defining it
+	for i,ext in enumerate( exts ):
+		refs, keys = _ast_names( ext )
+		deps = set()
+		for ref in refs: deps.update( defined.get(ref, ()) )
+		digests.append( _digest( _ast_text(ext), *sorted([digests[j] for j in deps]) ) )
+		if isclass( ext, 'Typedef' ): keys.append( ext.name )
+		for key in keys: defined.setdefault( key, [] ).append( i )
+	return digests
+
+class FragmentCache(object):
+	'''
+	declarations emitted from included headers, shared by every wrapper built with the same configuration:
+		CACHEDIR/fragments/<digest of configuration and header>.json - "kind:name" -> [fingerprint, emitted text]
+	a wrapper reuses the text another wrapper emitted for the same header while the fingerprint matches,
+	and counts where each of its declarations came from: manifest, fragment or generated.
+	'''
+	SOURCES = ( 'manifest', 'fragment', 'generated' )
+	def __init__( self, path, config ):
+		self.path = path
+		self.config = config
+		self.fragments = {}		# header -> symbols
+		self.new = {}			# header -> symbols generated by this wrapper
+		self.counts = {}		# header -> source -> [declarations, bytes]
+
+	def url( self, header ): return os.path.join( self.path, '%s.json' %_digest(self.config, header) )
+
+	def load( self, header ):
+		url = self.url( header )
+		if os.path.isfile( url ):
+			try: return json.load( open(url,'rb') )['symbols']
+			except (ValueError, KeyError): print( 'WARN - ignoring broken fragment: %s' %url )
+		return {}
+
+	def emit( self, header, kind, name, fingerprint, generate ):
+		if header not in self.fragments: self.fragments[ header ] = self.load( header )
+		key = '%s:%s' %(kind,name)
+		old = self.fragments[ header ].get( key )
+		if old and old[0] == fingerprint:
+			text = old[1]
+			if str is bytes: text = text.encode('utf-8')		# json gives unicode on python2
+			return text
+		text = generate()
+		self.fragments[ header ][ key ] = self.new.setdefault( header, {} )[ key ] = [ fingerprint, text ]
+		return text
+
+	def count( self, header, source, text ):
+		c = self.counts.setdefault( header, {} ).setdefault( source, [0,0] )
+		c[0] += 1; c[1] += len(text)
+
+	def report( self ):
+		totals = dict( [(s,[0,0]) for s in self.SOURCES] )
+		for header in self.counts:
+			for s in self.counts[ header ]:
+				totals[ s ][0] += self.counts[ header ][ s ][0]; totals[ s ][1] += self.counts[ header ][ s ][1]
+		n = sum( [totals[s][0] for s in self.SOURCES] ) or 1
+		size = sum( [totals[s][1] for s in self.SOURCES] ) or 1
+		pprint( 'declarations: ' + ', '.join( ['%s %s (%.1f%% of the text)' %(totals[s][0], s, 100.0*totals[s][1]/size) for s in self.SOURCES] ), 2 )
+		rows = []
+		for header in self.counts:
+			c = self.counts[ header ]
+			rows.append( (sum([v[0] for v in c.values()]), header, c.get('fragment',[0])[0]) )
+		rows.sort( reverse=True )
+		for total, header, reused in rows[ : 20 ]:
+			print( '\t%6s declarations, %6s from the shared fragment: %s' %(total, reused, header) )
+		if len(rows) > 20: print( '\t... %s more headers' %(len(rows)-20) )
+		return totals
+
+	def save( self ):
+		if self.new and not os.path.isdir( self.path ): os.makedirs( self.path )
+		for header in self.new:
+			symbols = self.load( header )		# another wrapper may have saved this fragment meanwhile
+			symbols.update( self.new[ header ] )
+			url = self.url( header )
+			tmp = '%s.%s' %(url, os.getpid())
+			f = open( tmp, 'w' ); json.dump( {'header':header, 'symbols':symbols}, f ); f.close()
+			os.rename( tmp, url )		# atomic, wrap_batch jobs share fragments
+		self.new = {}
+
 class SourceCode(object):
 	def __init__(self, url, library_names=[], debug=False, platform=None):
 		path,name = os.path.split(url)
@@ -1398,12 +2469,24 @@ class SourceCode(object):
 
 
 		self.if_defs = []
+		self.macro_defines = []		# (name, body, file) of the object-like macros cpp saw, set by c_preprocessor
 		self.macro_globals = []
 		self.macro_globals_values = {}
 		## workaround
 		SomeThing.MACRO_GLOBALS = self.macro_globals_values
 
+		self.parse_cache_key = None		# set by c_preprocessor when the parse cache is used
+		self.parse_cache_deps = []
+		self.cached_ast = None		# path of the cached AST
+		self.timings = []		# (phase, seconds)
+		self.manifest = None		# set by parse when there is ctypes output
+		self.wrapper_key = None
+		self.up_to_date = False
+		self.fragments = None		# set by parse when the shared fragment cache is used
+
+		t = time.time()
 		if '--no-preprocessor' not in sys.argv: self.source_processed = self.c_preprocessor()
+		self.timings.append( ('preprocess', time.time()-t) )
 		self.parse( self.source_processed, debug=debug )
 
 	def save(self, name=None):
@@ -1417,89 +2500,112 @@ class SourceCode(object):
 			f = open(url,'wb'); f.write( data ); f.close()
 			pprint('saved rffi wrapper: %s' %url, 2)
 
-		if CTYPES_OUTPUT:
+		if CTYPES_OUTPUT and self.up_to_date:
+			pprint('ctypes wrapper is up to date: %s' %os.path.join( CACHEDIR, CTYPES_OUTPUT ), 2)
+		elif CTYPES_OUTPUT:
 			print( 'saving ctypes wrapper: %s' %CTYPES_OUTPUT )
-			data = self.generate_ctypes_wrapper()
-			url = os.path.join( CACHEDIR, CTYPES_OUTPUT )
-			f = open(url,'wb'); f.write( data ); f.close()
-			pprint('saved ctypes wrapper: %s' %url, 2)
-
-	def parse_macro( self, name, start, srclines ):
-		if '(' in name or ')' in name: return False		# fixed april 15th
-		if name == 'bool': return False						# fixed May3, openjpeg.h braindamage
-
-		_clean = lambda line: line.split('/*')[0].split('//')[0].strip()
-		n = start
-		v = _clean( srclines[ n ] )
-		while v.endswith('\\'):
-			n += 1; v = v[:-1] + _clean( srclines[ n ] )
-		line = v
-		v = v.split()
-
-		if name != v[1]:
-			print( 'TODO: function macro: %s' %name )
-			print( line )
-			return False
-		if len(v) >=4:
-			#print('macro >=4')
-			a = line.split('(')[-1]		# take last
-			a = a.replace(')','')		# assume just closing pairs
-			a = a.strip()
-			if len(a) >= 2 and a[0] in '0123456789' and a[1] =='U':
-				a = a.replace('U', '')
-
-			val = None
-			if a == 'int': val = 0
-			elif a == 'float': val = .0
+			t = time.time()
+			if OUTPUT_FORMAT == 'descriptor':
+				data, descriptor = self.generate_ctypes_descriptor()
+				outputs = [ (CTYPES_OUTPUT, data), (self.descriptor_output(), descriptor) ]
 			else:
-				try: val = eval( a )
-				except: print('HARD macro to parse:', line)
-
-			if val is not None:
-				self.macro_globals.append( name )	# retain order
-				self.macro_globals_values[ name ] = val
-				return True
-
-		elif len(v) >= 3:
-			#print( 'macro >=3' )
-			val = v[-1]
-			val = val.split('(')[-1]
-			if val.endswith(')'): val = val[:-1]
-			if '.' in val and val.lower().endswith('f'): val = val[:-1]	# float litteral
-			if len(val) >= 2 and val[0] in '0123456789' and val[1] =='U':
-				val = val.replace('U', '')
-
-			if val == 'int':	# invalid?
-				self.macro_globals.append( name )	# retain order
-				self.macro_globals_values[ name ] = 0
-				return True
-			else:
-				try:
-					val = eval( val )
-					self.macro_globals.append( name )	# retain order
-					self.macro_globals_values[ name ] = val
-					return True
-				except:
-					try:
-						a = v[-1]; b = v[-2]
-						if a in self.macro_globals_values:
-							val = self.macro_globals_values[ a ]
-							self.macro_globals.append( name )	# retain order
-							self.macro_globals_values[ name ] = val
-							return True
-						elif a.count('(') == 1 and a.count(')') == 1:
-							val = eval( a, self.macro_globals_values, self.macro_globals_values )
-							self.macro_globals.append( name )	# retain order
-							self.macro_globals_values[ name ] = val
-							return True
-						else: print( 'WARN: non trival macro', line ); return False
-					except:
-						pprint('WARNING: can not parse: %s'%name, 6)
-						pprint( line, 1 )
-						pprint('-'*80)
-						return False
-		else: pprint( 'not touching unused macro: %s' %name, 4 )
+				data = self.generate_ctypes_wrapper()
+				outputs = [ (CTYPES_OUTPUT, data) ]
+			self.timings.append( ('generate', time.time()-t) )
+			for path, data in outputs:
+				url = os.path.join( CACHEDIR, path )
+				if os.path.isfile( url ) and open(url,'rb').read() == data:
+					pprint('ctypes wrapper unchanged: %s' %url, 2)		# keep the mtime for packaging
+				else:
+					f = open(url,'wb'); f.write( data ); f.close()
+					pprint('saved ctypes wrapper: %s' %url, 2)
+			if self.manifest:
+				if OUTPUT_FORMAT == 'descriptor':		# nothing was emitted, keep the texts for the next source build
+					self.manifest.symbols = self.manifest.old
+				else: self.manifest.report()
+				self.manifest.save( self.wrapper_key, _digest(*[data for path,data in outputs]) )
+			if self.fragments and OUTPUT_FORMAT != 'descriptor':
+				self.fragments.report()
+				self.fragments.save()
+		pprint( 'timings: %s' %', '.join( ['%s %.2fs' %t for t in self.timings] ), 2 )
+
+	DEFINE = re.compile( r'#define ([A-Za-z_]\w*)(\(?)\s*(.*)' )
+	LINE_MARKER = re.compile( r'# \d+ "(.*)"' )
+	def collect_macros( self, data, skip=() ):
+		'''
+		takes the #define and #undef lines "cpp -dD" leaves in its output into self.macro_defines,
+		with the file that defined them. the lines are blanked, so line numbers stay the same.
+		'''
+		defines = {}; order = []; path = None
+		lines = data.split( '\n' )
+		for i, line in enumerate( lines ):
+			if not line.startswith( '#' ): continue
+			m = self.LINE_MARKER.match( line )
+			if m: path = m.group(1); continue
+			if line.startswith( '#define ' ):
+				m = self.DEFINE.match( line )
+				name, function, body = m.groups()
+				if name in defines: order.remove( name )
+				if not function and body.strip() and name not in skip:
+					defines[ name ] = ( name, body.strip(), path ); order.append( name )
+				elif name in defines: del defines[ name ]
+				lines[ i ] = ''
+			elif line.startswith( '#undef ' ):
+				name = line.split()[1]
+				if name in defines: del defines[ name ]; order.remove( name )
+				lines[ i ] = ''
+		self.macro_defines = [ defines[name] for name in order ]
+		return '\n'.join( lines )
+
+	def fold_macros( self, enum_value=None, typedef=None ):
+		'''
+		folds the macros defined by the header and by headers under INCLUDE_DIRS into macro globals, in dependency order.
+		macros of other headers (libc, compiler builtins) are only used to fold those.
+		'''
+		dirs = [ os.path.join( os.path.abspath(d), '' ) for d in INCLUDE_DIRS if d ]
+		wanted = set()
+		for name, body, path in self.macro_defines:
+			if path == '<stdin>': wanted.add( name )
+			elif not path.startswith('<') and [ d for d in dirs if os.path.abspath(path).startswith(d) ]: wanted.add( name )		# not <built-in> or <command-line>
+		folder = MacroConstants( [ (name,body) for name,body,path in self.macro_defines ], enum_value, typedef )
+		for name in folder.order:
+			if name in wanted:
+				self.macro_globals.append( name )
+				self.macro_globals_values[ name ] = folder.export( name )
+		failed = [ name for name,body,path in self.macro_defines if name in wanted and name in folder.failed ]
+		pprint( 'macros: %s folded, %s not folded' %(len(self.macro_globals), len(failed)), 2 )
+		if '--debug' in sys.argv:
+			for name in failed: print( '\t%s: %s' %(name, folder.failed[name]) )
+		return failed
 
+	def use_parse_cache( self ):
+		return PARSE_CACHE.enabled and self.__class__ is not CPlusPlus
+
+	def cpp_args( self ):
+		args = ['cpp']
+		if self.__class__ == CPlusPlus:
+			args.append( '-x' )
+			args.append( 'c++' )
+			#args.append( '-Ihacks/c++/' )
+			args.append( '-C' )	# keep comments
+		args.append( '-Wunused-macros' )
+
+		if '--no-gnu' in sys.argv: args +=  ['-U__GNUC__' ]
+
+		## avoid using fake libc
+		if FAKE_LIBC: args.append( '-I%s' %FAKE_LIBC )
+
+		if SYS_INCLUDE_DIRS:
+			#args += '-nostdinc -nostdinc++'.split()		# cpp prints some warning
+			args.append( '-nostdinc' )
+
+		## macro defs need to come before the includes ##
+		for macro in MACRO_DEFS: args.append( '-D%s' %macro )
+		for macro in MACRO_UNDEFS: args.append( '-U%s' %macro )
+		for path in self.includes: args.append( '-I%s' %path )
+		
+		args.append( '-' )
+		return args
 
 	def c_preprocessor( self, source_type=None ):
 		source = self.source_data
@@ -1512,15 +2618,33 @@ class SourceCode(object):
 				assert os.path.isfile( header )
 				source += '\n' + open(header,'rb').read()
 
-		## first pass inspection, check includes, try to parse macros ##	
-		for idx, line in enumerate(source.splitlines()):
+		## pre cpp - extra define hacks - why is this not working ##
+		pre = [
+			'#define const __const',
+			'#define const __const__',
+		]
+		cppsource = '\n'.join( pre ) + '\n' + source
+
+		## always check for unused macro defines ##
+		args = self.cpp_args()
+
+		## reuse the cleaned output and AST if the header and everything it includes are unchanged ##
+		if self.use_parse_cache():
+			self.parse_cache_key = PARSE_CACHE.make_key( args + [repr(PYCPARSER_USER_RULES)], cppsource )
+			entry = PARSE_CACHE.lookup( self.parse_cache_key )
+			if entry:
+				self.if_defs = entry['if_defs']
+				self.macro_defines = entry['macro_defines']
+				self.cached_ast = entry['ast']
+				return entry['source']
+
+		## first pass inspection, check includes, macros come from cpp -dD ##
+		for line in source.splitlines():
 			if line.startswith('#'):
 				line = line[1:]
 				line = line.split('//')[0]
 				line = line.split('/*')[0]
-				if line.startswith( 'define' ):
-					self.parse_macro( line.split()[1], idx, source.splitlines() )	# march21,2011
-				elif line.startswith('ifndef'):
+				if line.startswith('ifndef'):
 					self.if_defs.append( line.split()[-1] )
 				elif 'include' in line.split():
 					name = line.split()[-1]
@@ -1534,38 +2658,14 @@ class SourceCode(object):
 
 		## post headers, just a hack to combine many headers ##
 		#for header in HEADERS: source += '#include "%s"\n' %header			# TODO deprecate HEADERS
+		source = cppsource
 
-		## pre cpp - extra define hacks - why is this not working ##
-		pre = [
-			'#define const __const',
-			'#define const __const__',
-		]
-		source = '\n'.join( pre ) + '\n' + source
+		args = args[ : -1 ] + [ '-dD', '-' ]		# keep the macro definitions, with the file of each
+		depfile = None
+		if self.parse_cache_key:	# ask cpp for every file it includes, so the cache entry can be validated
+			fd, depfile = tempfile.mkstemp( suffix='.d' ); os.close( fd )
+			args = args[ : -1 ] + [ '-MD', '-MF', depfile, '-' ]
 
-		## always check for unused macro defines ##
-		args = ['cpp']
-		if self.__class__ == CPlusPlus:
-			args.append( '-x' )
-			args.append( 'c++' )
-			#args.append( '-Ihacks/c++/' )
-			args.append( '-C' )	# keep comments
-		args.append( '-Wunused-macros' )
-
-		if '--no-gnu' in sys.argv: args +=  ['-U__GNUC__' ]
-
-		## avoid using fake libc
-		if FAKE_LIBC: args.append( '-I%s' %FAKE_LIBC )
-
-		if SYS_INCLUDE_DIRS:
-			#args += '-nostdinc -nostdinc++'.split()		# cpp prints some warning
-			args.append( '-nostdinc' )
-
-		## macro defs need to come before the includes ##
-		for macro in MACRO_DEFS: args.append( '-D%s' %macro )
-		for macro in MACRO_UNDEFS: args.append( '-U%s' %macro )
-		for path in self.includes: args.append( '-I%s' %path )
-		
-		args.append( '-' )
 		print( '_'*80 )
 		print( ' '.join( args ) )
 		print( '_'*80 )
@@ -1581,6 +2681,10 @@ class SourceCode(object):
 			print( err )
 			raise SyntaxError
 
+		if depfile:
+			self.parse_cache_deps = _parse_depfile( depfile )
+			os.remove( depfile )
+
 		unused_macros = []
 		if err.strip():
 			srclines = source.splitlines()
@@ -1604,6 +2708,8 @@ class SourceCode(object):
 					print( 'C pre-processor error! giving up.')
 					raise SyntaxError
 
+		data = self.collect_macros( data, skip=[ line.split()[1] for line in pre ] )
+
 		# remove bad stuff pycparser can not handle #
 		if self.__class__ is CPlusPlus: d = data
 		else:
@@ -1615,313 +2721,314 @@ class SourceCode(object):
 
 
 ## data = output of C pre processor ##
-def make_pycparser_compatible( data ):
+# Rules to make the C pre processor output pycparser compatible, applied in order to every line.
+# how to hack this:
+#	run rpythonic to generate your wrapper,
+#	when pycparser fails check /tmp/_debug_[name of your header].h
+#	then search for "__attribute" since most of the GNU extensions look like that.
+#	add a rule below, or pass your own to wrap( pycparser_rules=[...] )
+# a rule is ( test, pattern, action, value )
+#	test/pattern can be tuples, then all tests must pass, the action works on the first pattern
+# tests:
+#	word				pattern in line.split()
+#	in					pattern in line
+#	is					line == pattern
+#	strip-is			line.strip() == pattern
+#	startswith			line.startswith( pattern )
+#	endswith			line.endswith( pattern )
+#	strip-startswith	line.strip().startswith( pattern )
+#	strip-endswith		line.strip().endswith( pattern )
+# actions:
+#	replace		line.replace( pattern, value )
+#	set			line = value
+#	cut			line.split( pattern )[0] + value
+#	cut-keep	cut, keep the ending ";" if there is one
+#	cut-tail	cut, keep the last char unless it is ")"
+#	cut-skip	cut + value, then drop lines until one ends with ";"
+#	skip		line = value, then drop lines until one ends with ";"
+#	skip-to		line = "", then drop lines until one is value
+PYCPARSER_RULES = [
+	( 'in',			'__attribute__((__unused__))',		'replace',	'' ),	# blender bmesh
+	( 'word',		'((__noreturn__))',				'replace',	'' ),	# pthread.h
+	## strange cases in python3.2/abstract.h
+	( 'is',		'char *__const__ * _PySequence_BytesToCharpArray(PyObject* self);',	'set',	'' ),
+	( 'is',		'void _Py_FreeCharPArray(char *__const__ array[]);',				'set',	'' ),
+	## pypy generated C
+	( ('word','in'),	('__builtin_offsetof','pypy'),		'set',		';' ),
+	( ('word','in'),	('(__builtin_offsetof','pypy'),		'set',		';' ),
+	( 'word',			'__builtin_offsetof',			'replace',	'offsetof' ),
+	( ('in','word'),	('__builtin_offsetof','(__builtin_offsetof'),	'replace',	'offsetof' ),
+
+	( ('strip-startswith','strip-endswith'),	('__attribute__((format(printf,', ')));'),	'set',	';' ),
+	( 'word',		'__attribute__((packed))',		'replace',	'' ),
+	( 'word',		'__attribute__((malloc))',		'replace',	'' ),
+	( 'word',		'__attribute__((deprecated))',	'replace',	'' ),	# alut.h
+	## libavcodec
+	( 'strip-endswith',	'__attribute__((deprecated));',		'replace',	';' ),
+	( 'word',			'__attribute__((__const__))',		'replace',	'' ),
+	( 'strip-endswith',	'__attribute__((alloc_size(2)));',	'replace',	';' ),
+	( 'strip-endswith',	'((__format__ (__printf__, 3, 4)));',	'replace',	';' ),
+	## libavformat
+	( 'strip-endswith',	'((__format__ (__printf__, 2, 3)));',	'replace',	';' ),
+
+	( ('word','strip-endswith'),	('__attribute__((__malloc__))',';'),	'cut',	';' ),
+	( 'strip-endswith',	'__attribute__((warn_unused_result));',	'replace',	';' ),
+	( 'word',			'__attribute__((warn_unused_result))',	'cut-keep',	'' ),
+	( 'word',			'__attribute__((always_inline))',		'replace',	'' ),
+	( 'word',			'((__malloc__));',						'replace',	';' ),	# stdio.h:225
+	( 'word',			'((__malloc__))',						'replace',	'' ),
+	( 'word',			'__attribute__((visibility("default")))',	'replace',	'' ),
+	( 'word',			'__attribute__((__deprecated__))',		'replace',	'' ),	# ode/mass.h:69
+
+	( 'word',		'__extension__',	'replace',	'' ),
+	( 'word',		'__attribute__',	'replace',	'' ),
+	( 'word',		'__THROW',			'replace',	'' ),
+	( 'word',		'__inline__',		'replace',	'' ),
+	( 'word',		'__inline',			'replace',	'' ),	# odemath.h:316
+	( 'word',		'((__nothrow__))',	'replace',	'' ),	# inttypes.h
+	( 'word',		'((__nothrow__));',	'replace',	';' ),
+
+	( 'word',		'((__const__))',	'replace',	'' ),
+	( 'word',		'((__const__));',	'replace',	';' ),
+	( 'word',		'*__const',			'replace',	'__const' ),	#unistd.h:541 sys_errlist.h
+	( 'strip-is',	'((__const));',		'set',		';' ),		# /usr/include/ctype.h
+	( 'word',		'__const__',		'replace',	'const' ),
+	( 'word',		'__const',			'replace',	'const' ),
+	( 'word',		'(__const',			'replace',	'(const' ),
+	( ('in','in'),	('(__const__','(__const__ '),	'replace',	'(const' ),
+	( 'in',			',__const__',		'replace',	',const' ),
+
+	( 'word',		'***__restrict',	'replace',	'***' ),	# dirent.h
+	( 'word',		'**__restrict',		'replace',	'**' ),
+	( 'word',		'*__restrict',		'replace',	'*' ),
+	( 'word',		'__restrict',		'replace',	'' ),
+
+	## stdio.h:385
+	( ('strip-startswith','strip-endswith'),	('((__format__ (','))) ;'),	'set',	';' ),
+	( ('strip-startswith','strip-endswith'),	('((__format__ (',')));'),	'set',	';' ),
+
+	( ('word','startswith'),	('((visibility("default")))','extern'),	'replace',	'' ),	# SDL_cdrom.h
+
+	## types.h
+	( 'endswith',	'((__mode__ (__QI__)));',	'replace',	';' ),
+	( 'endswith',	'((__mode__ (__HI__)));',	'replace',	';' ),
+	( 'endswith',	'((__mode__ (__SI__)));',	'replace',	';' ),
+	( 'endswith',	'((__mode__ (__DI__)));',	'replace',	';' ),
+	( 'endswith',	'((__mode__ (__word__)));',	'replace',	';' ),
+
+	( 'word',		'__asm__',		'cut-keep',	'' ),
+	( ('word','strip-endswith'),	('((__nonnull__',';'),	'cut',	';' ),	#unistd.h
+
+	( 'strip-endswith',	'((__noreturn__));',	'replace',	';' ),	#unistd.h:596 _exit
+	( ('word','strip-endswith'),	('((__pure__))',';'),	'cut',	';' ),	# string.h:45
+	( 'strip-endswith',	'__attribute__((__pure__));',	'replace',	';' ),
+	( 'strip-startswith',	'__attribute__((visibility("hidden")))',	'replace',	'' ),	#glib-2.0/glib/gmessages.h:97
+	( 'strip-endswith',	'__attribute__;',		'replace',	';' ),	# glib-2.0/glib/gmessages.h:113
+	( ('word','strip-endswith'),	('__attribute__((__format_arg__',';'),	'cut',	';' ),
+	( 'strip-endswith',	'__attribute__((const));',	'replace',	';' ),	#glib-2.0/glib/gquark.h
+
+	( 'strip-endswith',	'((__transparent_union__));',	'replace',	';' ),	# stdlib.h:72
+	( 'strip-endswith',	'((__warn_unused_result__));',	'replace',	';' ),	# stdlib.h:400
+	( 'strip-endswith',	'__attribute__((__const__));',	'replace',	';' ),	# glib-2.0/glib/gquark.h:39
+	( ('word','strip-endswith'),	('__attribute__((__format__','));'),	'cut',	';' ),
+	( 'strip-endswith',	'__attribute__((__malloc__));',	'replace',	';' ),
+	( 'word',			'((unused))',		'replace',	'' ),	# glib-2.0/glib/gutils.h:300
+	( 'word',			'__attribute__((may_alias))',	'replace',	'' ),	# glib-2.0/glib/gatomic.h:38
+	( 'strip-endswith',	'((__deprecated__));',	'replace',	';' ),	#/usr/include/signal.h:196
+	( 'strip-endswith',	'__attribute__ ;',		'replace',	';' ),	#/usr/include/bits/sigthread.h:33
+	( 'strip-endswith',	'__attribute__((__sentinel__));',	'replace',	';' ),	#glib-2.0/gobject/gobject.h:414
+	( 'strip-endswith',	'((__aligned__));',		'replace',	';' ),
+
+	## pthread.h:665
+	( ('word','strip-endswith'),		('((__regparm__',';'),	'cut',	';' ),
+	( ('word','strip-startswith'),	('((__regparm__','((__regparm__'),	'set',	'' ),
+	( 'strip-is',	'((__weak__))',		'set',	'' ),
+
+	( 'startswith',	'#pragma',		'set',	'' ),
+	( ('startswith','endswith'),	('extern int __sigsetjmp (struct __jmp_buf_tag',';'),	'set',	'extern int __sigsetjmp ();' ),
+
+	## strange that forcing these typedefs to int works
+	( 'is',		'typedef XnMutex* XN_MUTEX_HANDLE;',					'set',	'typedef int XN_MUTEX_HANDLE;' ),
+	( 'is',		'typedef XN_MUTEX_HANDLE XN_CRITICAL_SECTION_HANDLE;',	'set',	'typedef int XN_CRITICAL_SECTION_HANDLE;' ),
+
+	( 'strip-is',	'((format (printf, 3, 4)));',	'set',	';' ),	# for blender.h
+	( 'strip-is',	'((format (printf, 1, 2)));',	'set',	';' ),
+	( 'strip-is',	'((__pure__));',				'set',	';' ),	# /usr/include/wchar.h
+	( 'strip-endswith',	'((__pure__));',			'replace',	';' ),
+
+	## pypy hybrid gc creates this funny line in pypy_g_ll_arena_round_up_for_allocation
+	#  l_v3659 = ((((l_arg0_6)>=(l_arg1_6)?(l_arg0_6):(l_arg1_6)) + (offsetof (struct rpy_memory_alignment_test2, s)-1)) & ~(offsetof (struct rpy_memory_alignment_test2, s)-1));
+	( ('in','strip-endswith'),	('& ~(offsetof (struct rpy_memory_alignment_test2',';'),	'set',	';' ),
+	( ('strip-startswith','strip-endswith'),	('asm volatile',';'),	'set',	';' ),		# for boehm gc
+
+	################ SKIP SKIPTO #############
+	( ('strip-startswith','strip-endswith'),	('__asm__',';'),	'set',	';' ),
+	( 'strip-startswith',	'__asm__',			'skip',		'' ),
+	( 'in',					'__extension__',	'skip-to',	'}' ),
+
+	( 'in',		'__attribute__((alloc_size(1)))',	'replace',	'' ),	#/usr/include/libxml2/libxml/xmlmemory.h
+	( 'in',		'__attribute__((',					'cut-tail',	'' ),	# ugly __attribute__ hack
+
+	###################64bit hacks ###############
+	( 'in',					'((__vector_size__',	'set',	';' ),
+	( 'strip-is',			'extern  __m64',		'set',	'' ),
+	( 'strip-startswith',	'return (__m64)',		'set',	'return;' ),
+	( 'strip-is',			'return _mm_cvtsi32_si64 (__i);',	'set',	';' ),
+	( 'strip-startswith',	'return _mm_cvtsd_si32(',			'skip-to',	'}' ),
+	( 'strip-is',			'__m128d t = _mm_set_sd( value );',	'set',	'' ),	# opencv 64bit
+	#####################################
+
+	( ('in','strip-endswith'),	('__asm(',');'),	'cut',	';' ),	# darwin - stdio.h
+	( 'in',		'({ union { uint8_t b8[2]; uint16_t b16; } _tmp; uint16_t _tmp2 = (uint16_t)',	'set',	';' ),	#libusb-1.0/libusb.h:886
+
+	## android include/machine/_types.h		include/asm/types.h
+	( 'word',	'__signed__',	'replace',	'signed' ),
+	( 'word',	'__signed',		'replace',	'signed' ),
+
+	( ('in','endswith'),	('__OSX_AVAILABLE_STARTING(',';'),	'cut',	';' ),
+	( 'strip-is',	'__asm("_" "pselect" )',	'set',	'' ),		# darwin - select.h
+	( 'strip-is',	'__asm("_" "select" )',		'set',	'' ),
+	( ('in','strip-endswith'),	('__OSX_AVAILABLE_BUT_DEPRECATED(',';'),	'cut',	';' ),
+	( 'in',					'__OSX_AVAILABLE_BUT_DEPRECATED(',			'cut-skip',	'' ),
+
+	( ('strip-startswith','strip-endswith'),	('((format (printf,',')))'),	'set',	'' ),
+
+	### blender ###
+	( 'in',			'__attribute((always_inline))',	'replace',	'' ),
+	( 'in',			'__attribute__((__unused__))',	'replace',	'' ),
+	( 'endswith',	'((__sentinel__(0)));',			'replace',	';' ),
+
+	## final hacks ##
+	( 'endswith',	'__attribute__;',					'replace',	';' ),
+	( 'endswith',	'((__nothrow__ , __leaf__));',		'replace',	';' ),
+	( 'endswith',	'((__nothrow__ , __leaf__))  ;',	'replace',	';' ),
+	( 'endswith',	'__attribute__ ;',					'replace',	';' ),
+	( 'endswith',	'((__nothrow__ , __leaf__)) ;',		'replace',	';' ),
+	( ('in','strip-endswith'),	('((__nothrow__ , __leaf__))',';'),	'replace',	'' ),
+	( 'endswith',	'((__format__ (__scanf__, 2, 0)));',	'replace',	';' ),
+	( 'in',			'((__nothrow__ , __leaf__))',		'replace',	'' ),	# wayland
+
+	( ('strip-startswith','strip-endswith'),	('((format(printf',')))'),	'set',	'' ),	#blender/blenlib/BLI_string.h
+	( 'strip-is',	'_Static_assert((sizeof(BMHeader) <= 16), "BMHeader size has grown!");;',	'set',	'' ),	# blender/bmesh/bmesh_class.h:85
+]
+PYCPARSER_USER_RULES = []	# set by wrap( pycparser_rules=... ), applied before the rules above
+
+
+class RuleEngine(object):
 	'''
-	this function is a super hack - looking for a better solution.
-	how to hack this:
-		run rpythonic to generate your wrapper,
-		when pycparser fails check /tmp/_debug_[name of your header].h
-		then search for "__attribute" since most of the GNU extensions look like that.
+	applies a list of rules to every line in one pass, lines that contain none of the rule patterns
+	are passed through without testing any rule.
 	'''
+	TESTS = 'word in is strip-is startswith endswith strip-startswith strip-endswith'.split()
+	ACTIONS = 'replace set cut cut-keep cut-tail cut-skip skip skip-to'.split()
+
+	def __init__( self, rules ):
+		self.rules = []
+		for rule in rules:
+			test, pattern, action, value = rule
+			if type(test) is str: tests, patterns = (test,), (pattern,)
+			else: tests, patterns = tuple(test), tuple(pattern)
+			assert len(tests) == len(patterns)
+			for t in tests:
+				if t not in self.TESTS: raise SyntaxError( 'unknown pycparser rule test: %s' %t )
+			if action not in self.ACTIONS: raise SyntaxError( 'unknown pycparser rule action: %s' %action )
+			self.rules.append( (tuple(zip(tests,patterns)), patterns[0], action, value) )
+		self.hits = [0] * len(self.rules)
+		## every test needs its pattern somewhere in the line ##
+		patterns = sorted( set([r[1] for r in self.rules]), key=len, reverse=True )
+		if patterns: self.matcher = re.compile( '|'.join( [re.escape(p) for p in patterns] ) )
+		else: self.matcher = None
+
+	def apply( self, lines ):
+		'''generator over the cleaned lines'''
+		search = self.matcher and self.matcher.search
+		rules = self.rules; hits = self.hits
+		skip = False
+		skipTO = None
+		for line in lines:
+			if skip:
+				if skipTO is not None:
+					if line.strip() == skipTO:
+						skip = False
+						skipTO = None
+					else:
+						continue
+				elif line.strip().endswith(';'): line = ';'; skip = False; skipTO = None
+				else: continue
 
-	d = ''
-	TYPEDEF_HACKS = [ 
+			if not search or not search( line ):
+				yield line
+				continue
+
+			words = None
+			for idx, (tests, pattern, action, value) in enumerate( rules ):
+				if pattern not in line: continue		# cheap, every test implies it
+				ok = True
+				for test, p in tests:
+					if test == 'word':
+						if words is None: words = line.split()
+						ok = p in words
+					elif test == 'in': ok = p in line
+					elif test == 'strip-endswith': ok = line.strip().endswith( p )
+					elif test == 'strip-startswith': ok = line.strip().startswith( p )
+					elif test == 'endswith': ok = line.endswith( p )
+					elif test == 'startswith': ok = line.startswith( p )
+					elif test == 'strip-is': ok = line.strip() == p
+					else: ok = line == p
+					if not ok: break
+				if not ok: continue
+
+				hits[ idx ] += 1
+				if action == 'replace': line = line.replace( pattern, value )
+				elif action == 'set': line = value
+				elif action == 'cut': line = line.split( pattern )[0] + value
+				elif action == 'cut-keep':
+					if line.strip().endswith(';'): line = line.split( pattern )[0] + ';'
+					else: line = line.split( pattern )[0]
+				elif action == 'cut-tail':
+					x = line.split( pattern )[0]
+					y = line.strip()[-1]
+					if y == ')': line = x
+					else: line = x + y
+				elif action == 'cut-skip':
+					line = line.split( pattern )[0] + value; skip = True
+				elif action == 'skip':
+					line = value; skip = True
+				elif action == 'skip-to':
+					line = ''; skip = True; skipTO = value
+				words = None
+
+			yield line
+
+	def stats( self ):
+		'''(hits, rule) for every rule that was used, most hits first'''
+		r = [ (self.hits[i], self.rules[i][1], self.rules[i][2]) for i in range(len(self.rules)) if self.hits[i] ]
+		r.sort( key=lambda a: a[0], reverse=True )
+		return r
+
+
+def make_pycparser_compatible( data ):
+	'''
+	this function is a super hack - looking for a better solution, see PYCPARSER_RULES
+	'''
+	TYPEDEF_HACKS = [
 		('char *', '__builtin_va_list'),
 		#('unsigned char', '_Bool'),	# pypy generated, check for _GNUC_ and uses _Bool (PyCparser 2.06 now supports _Bool)
 	]
 	if '--no-gnu' in sys.argv:
 		TYPEDEF_HACKS.append(('long long int', 'int64_t'))
-	for type, name in TYPEDEF_HACKS: d += 'typedef %s %s;\n' %(type,name)
+	d = [ 'typedef %s %s;\n' %(type,name) for type, name in TYPEDEF_HACKS ]
 	################ above is deprecated
 
-	skip = False
-	skipTO = None
-	for num, line in enumerate(data.splitlines()):
-		if skip:
-			if skipTO is not None:
-				if line.strip() == skipTO:
-					skip = False
-					skipTO = None
-				else:
-					continue
-			elif line.strip().endswith(';'): line = ';'; skip = False; skipTO = None
-			else: continue
-
-		if '__attribute__((__unused__))' in line: line = line.replace('__attribute__((__unused__))', '')	# blender bmesh
-
-		if '((__noreturn__))' in line.split(): line = line.replace('((__noreturn__))','')	# pthread.h
-
-		if line in ('char *__const__ * _PySequence_BytesToCharpArray(PyObject* self);', 'void _Py_FreeCharPArray(char *__const__ array[]);'):
-			line = ''	# strange cases in python3.2/abstract.h
-
-		if '__builtin_offsetof' in line.split() or '(__builtin_offsetof' in line.split():
-			if 'pypy' in line: line = ';'	# pypy generated C
-			else: line = line.replace('__builtin_offsetof', 'offsetof')
-
-		if line.strip().startswith('__attribute__((format(printf,') and line.strip().endswith(')));'):
-			line = ';'
-
-		if '__attribute__((packed))' in line.split(): line = line.replace( '__attribute__((packed))', '' )
-
-		if '__attribute__((malloc))' in line.split(): line = line.replace( '__attribute__((malloc))', '' )
-
-		if '__attribute__((deprecated))' in line.split():	# alut.h
-			line = line.replace( '__attribute__((deprecated))', '' )
-
-		## libavcodec
-		if line.strip().endswith('__attribute__((deprecated));'):
-			line = line.replace( '__attribute__((deprecated));', ';' )
-		if '__attribute__((__const__))' in line.split():
-			line = line.replace( '__attribute__((__const__))', '' )
-		if line.strip().endswith('__attribute__((alloc_size(2)));'):
-			line = line.replace( '__attribute__((alloc_size(2)));', ';')
-		if line.strip().endswith('((__format__ (__printf__, 3, 4)));'):
-			line = line.replace('((__format__ (__printf__, 3, 4)));', ';')
-		## libavformat
-		if line.strip().endswith('((__format__ (__printf__, 2, 3)));'):
-			line = line.replace( '((__format__ (__printf__, 2, 3)));', ';' )
-
-
-		if '__attribute__((__malloc__))' in line.split() and line.strip().endswith(';'):
-			line = line.split('__attribute__((__malloc__))')[0] + ';'
-
-		if line.strip().endswith('__attribute__((warn_unused_result));'):
-			line = line.replace('__attribute__((warn_unused_result));', ';' )
-		if '__attribute__((warn_unused_result))' in line.split():
-			_line = line.split('__attribute__((warn_unused_result))')[0]
-			if line.strip().endswith(';'): _line += ';'
-			line = _line
-
-		if '__attribute__((always_inline))' in line.split(): line = line.replace('__attribute__((always_inline))', '')
-
-		if '((__malloc__));' in line.split(): line = line.replace('((__malloc__));', ';')	# stdio.h:225
-		if '((__malloc__))' in line.split(): line = line.replace('((__malloc__))', '')
-
-		if '__attribute__((visibility("default")))' in line.split():
-			line = line.replace('__attribute__((visibility("default")))', '')
-
-		if '__attribute__((__deprecated__))' in line.split():
-			line = line.replace( '__attribute__((__deprecated__))', '' )	# ode/mass.h:69
-
-		if '__extension__' in line.split(): line = line.replace('__extension__','')
-		if '__attribute__' in line.split(): line = line.replace('__attribute__', '')
-		if '__THROW' in line.split(): line = line.replace('__THROW', '')
-
-		if '__inline__' in line.split(): line = line.replace( '__inline__', '' )
-		if '__inline' in line.split(): line = line.replace('__inline', '' )	# odemath.h:316
-
-		if '((__nothrow__))' in line.split(): line = line.replace('((__nothrow__))', '')	# inttypes.h
-		if '((__nothrow__));' in line.split(): line = line.replace('((__nothrow__));', ';')
-
-		if '((__const__))' in line.split(): line = line.replace('((__const__))', '')
-		if '((__const__));' in line.split(): line = line.replace('((__const__));', ';')
-		if '*__const' in line.split(): line = line.replace('*__const', '__const')	#unistd.h:541 sys_errlist.h
-		if line.strip() == '((__const));': line = ';'	# /usr/include/ctype.h
-		if '__const__' in line.split(): line = line.replace('__const__', 'const' )
-		if '__const' in line.split(): line = line.replace('__const', 'const' )
-		if '(__const' in line.split(): line = line.replace('(__const', '(const' )
-
-		if '(__const__ ' in line: line = line.replace('(__const__', '(const' )
-		if ',__const__' in line: line = line.replace( ',__const__', ',const' )
-
-		if '***__restrict' in line.split(): line = line.replace('***__restrict', '***')	# dirent.h
-		if '**__restrict' in line.split(): line = line.replace('**__restrict', '**')
-		if '*__restrict' in line.split(): line = line.replace('*__restrict', '*' )
-		if '__restrict' in line.split(): line = line.replace('__restrict', '' )
-
-		if line.strip().startswith('((__format__ ('):		# stdio.h:385
-			_s = line.strip()
-			if _s.endswith( '))) ;' ) or _s.endswith(')));'): line = ';'
-
-		if line.startswith('extern') and '((visibility("default")))' in line.split():		# SDL_cdrom.h
-			line = line.replace( '((visibility("default")))', '' )
-
-		# types.h #
-		for ugly in ['((__mode__ (__QI__)));' , '((__mode__ (__HI__)));' , '((__mode__ (__SI__)));' , '((__mode__ (__DI__)));' , '((__mode__ (__word__)));']:
-			if line.endswith( ugly ): line = line.replace(ugly, ';')
-
-		if '__asm__' in line.split(): #and '__isoc99_' in line:
-			if line.strip().endswith(';'): line = line.split('__asm__')[0] + ';'
-			else: line = line.split('__asm__')[0]
-
-
-		if '((__nonnull__' in line.split():		#unistd.h
-			if line.strip().endswith(')));') or line.strip().endswith('))) ;') or line.strip().endswith('((__deprecated__)) ;'):
-				line = line.split('((__nonnull__')[0] + ';'
-			elif line.strip().endswith(';'):
-				line = line.split('((__nonnull__')[0] + ';'	# this is always safe?
-
-		if line.strip().endswith('((__noreturn__));'): line = line.replace('((__noreturn__));', ';')	#unistd.h:596 _exit
-		if '((__pure__))' in line.split():		# string.h:45
-			if line.strip().endswith(';'): line = line.split('((__pure__))')[0] + ';'
-		if line.strip().endswith('__attribute__((__pure__));'):
-			line = line.replace('__attribute__((__pure__));', ';')
-		if line.strip().startswith('__attribute__((visibility("hidden")))'):	#glib-2.0/glib/gmessages.h:97
-			line = line.replace('__attribute__((visibility("hidden")))', '')
-		if line.strip().endswith('__attribute__;'):	# glib-2.0/glib/gmessages.h:113
-			line = line.replace('__attribute__;', ';')
-		if '__attribute__((__format_arg__' in line.split() and line.strip().endswith(';'):
-			line = line.split('__attribute__((__format_arg__')[0] + ';'
-
-		if line.strip().endswith('__attribute__((const));'): line = line.replace('__attribute__((const));', ';')	#glib-2.0/glib/gquark.h
-
-		#if '__const struct' in line:	# time.h:187, this can go away, will pop __const in _fix_decl_name_type
-		#	print('WARNING: %s' %line)
-		#	line = line.replace( '__const struct', 'struct' )
-
-		if line.strip().endswith( '((__transparent_union__));' ):	# stdlib.h:72
-			line = line.replace( '((__transparent_union__));', ';' )
-
-		if line.strip().endswith( '((__warn_unused_result__));' ):
-			line = line.replace('((__warn_unused_result__));', ';' )	# stdlib.h:400
-
-		if line.strip().endswith('__attribute__((__const__));'):	# glib-2.0/glib/gquark.h:39
-			line = line.replace('__attribute__((__const__));', ';' )
-
-		if '__attribute__((__format__' in line.split() and line.strip().endswith('));'):
-			line = line.split('__attribute__((__format__')[0] + ';'
+	engine = RuleEngine( PYCPARSER_USER_RULES + PYCPARSER_RULES )
+	for line in engine.apply( data.splitlines() ):
+		d.append( line ); d.append( '\n' )
+	stats = engine.stats()
+	print( 'pycparser rules: %s used, %s rewrites' %(len(stats), sum([s[0] for s in stats])) )
+	if '--debug' in sys.argv:
+		for hits, pattern, action in stats: print( '\t%6s  %-10s %s' %(hits, action, pattern) )
+	return ''.join( d )
 
-		if line.strip().endswith('__attribute__((__malloc__));'):
-			line = line.replace( '__attribute__((__malloc__));', ';')
-
-		if '((unused))' in line.split():	# glib-2.0/glib/gutils.h:300
-			line = line.replace('((unused))', '')
-
-		if '__attribute__((may_alias))' in line.split():	# glib-2.0/glib/gatomic.h:38
-			line = line.replace('__attribute__((may_alias))', '')
-
-		if line.strip().endswith('((__deprecated__));'):	#/usr/include/signal.h:196
-			line = line.replace('((__deprecated__));', ';')
-
-		if line.strip().endswith('__attribute__ ;'):		#/usr/include/bits/sigthread.h:33
-			line = line.replace('__attribute__ ;', ';')
-
-		if line.strip().endswith('__attribute__((__sentinel__));'):	#glib-2.0/gobject/gobject.h:414
-			line = line.replace('__attribute__((__sentinel__));', ';')
-
-		if line.strip().endswith('((__aligned__));'):
-			line = line.replace('((__aligned__));', ';')
-
-		if '((__regparm__' in line.split():	# pthread.h:665
-			if line.strip().endswith(';'):
-				line = line.split('((__regparm__')[0] + ';'
-			elif line.strip().startswith('((__regparm__'): line = ''
-		if line.strip() == '((__weak__))': line = ''
-
-		if line.startswith('#pragma'): line = ''
-
-		if line.startswith('extern int __sigsetjmp (struct __jmp_buf_tag') and line.endswith(';'):
-			line = 'extern int __sigsetjmp ();'
-
-		#if line == 'struct XnMutex;': line = 'typedef struct XnMutex;'
-		if line == 'typedef XnMutex* XN_MUTEX_HANDLE;':	# strange that forcing these typedefs to int works
-			line = 'typedef int XN_MUTEX_HANDLE;'
-		if line == 'typedef XN_MUTEX_HANDLE XN_CRITICAL_SECTION_HANDLE;':
-			line = 'typedef int XN_CRITICAL_SECTION_HANDLE;'
-
-		if line.strip() == '((format (printf, 3, 4)));' or line.strip()=='((format (printf, 1, 2)));': line = ';'	# for blender.h
-
-		if line.strip() == '((__pure__));': line = ';'	# /usr/include/wchar.h
-		if line.strip().endswith('((__pure__));'): line = line.replace('((__pure__));', ';')
-
-		## pypy hybrid gc creates this funny line in pypy_g_ll_arena_round_up_for_allocation
-		#  l_v3659 = ((((l_arg0_6)>=(l_arg1_6)?(l_arg0_6):(l_arg1_6)) + (offsetof (struct rpy_memory_alignment_test2, s)-1)) & ~(offsetof (struct rpy_memory_alignment_test2, s)-1));
-		if '& ~(offsetof (struct rpy_memory_alignment_test2' in line and line.strip().endswith(';'):
-			line = ';'
-
-		if line.strip().startswith('asm volatile') and line.strip().endswith(';'): line = ';'		# for boehm gc
-
-		################ SKIP SKIPTO #############
-		#####################################
-		if line.strip().startswith('__asm__'):
-			if line.strip().endswith(';'): line = ';'
-			else: line = ''; skip = True
-		if '__extension__' in line:
-			line = ''
-			skip = True
-			skipTO = '}'
-
-		if '__attribute__((alloc_size(1)))' in line:	#/usr/include/libxml2/libxml/xmlmemory.h
-			line = line.replace( '__attribute__((alloc_size(1)))', '' )
-
-		if '__attribute__((' in line:
-			#print('WARN: ugly __attribute__ hack')
-			x = line.split('__attribute__((')[0]
-			y = line.strip()[-1]
-			if y == ')': line = x
-			else: line = x + y
-
-		###################64bit hacks ###############
-
-		if '((__vector_size__' in line:
-			line = ';'
-
-		if line.strip() == 'extern  __m64': line = ''
-		if line.strip().startswith('return (__m64)'):
-			line = 'return;'
-		if line.strip() == 'return _mm_cvtsi32_si64 (__i);':
-			line = ';'
-		if line.strip().startswith('return _mm_cvtsd_si32('):
-			line = ''
-			skip = True
-			skipTO = '}'
-		if line.strip() == '__m128d t = _mm_set_sd( value );':	# opencv 64bit
-			line = ''
-
-		#####################################
-
-
-		if '__asm(' in line and line.strip().endswith(');'):	# darwin - stdio.h
-			line = line.split('__asm(')[0] + ';'
-
-		if '({ union { uint8_t b8[2]; uint16_t b16; } _tmp; uint16_t _tmp2 = (uint16_t)' in line: line = ';'	#libusb-1.0/libusb.h:886
-
-		## android include/machine/_types.h		include/asm/types.h
-		#if line.strip() == 'typedef __int8_t __int_least8_t;': line = 'typedef signed char __int_least8_t;'
-		#if line.strip() == 'typedef __int8_t int8_t;' : line = 'typedef signed char int8_t;'
-		if '__signed__' in line.split(): line = line.replace( '__signed__', 'signed' )
-		if '__signed' in line.split(): line = line.replace( '__signed', 'signed' )
-
-		if '__OSX_AVAILABLE_STARTING(' in line and line.endswith(';'):
-			line = line.split( '__OSX_AVAILABLE_STARTING(' )[0] + ';'
-		if line.strip() in ['__asm("_" "pselect" )', '__asm("_" "select" )']:		# darwin - select.h
-			line = ''
-		if '__OSX_AVAILABLE_BUT_DEPRECATED(' in line:
-			if line.strip().endswith(';'):
-				line = line.split('__OSX_AVAILABLE_BUT_DEPRECATED(')[0] + ';'
-			else:
-				line = line.split('__OSX_AVAILABLE_BUT_DEPRECATED(')[0]
-				skip = True
-
-		if line.strip().startswith('((format (printf,') and line.strip().endswith(')))'):
-			line = ''
-
-		### blender ###
-		if '__attribute((always_inline))' in line: line = line.replace('__attribute((always_inline))', '')
-		if '__attribute__((__unused__))' in line: line = line.replace( '__attribute__((__unused__))', '')
-		if line.endswith('((__sentinel__(0)));'): line = line.replace( '((__sentinel__(0)));', ';' )
-
-		## final hacks ##
-		if line.endswith('__attribute__;'): line = line.replace('__attribute__;',';')
-
-		if line.endswith('((__nothrow__ , __leaf__));'): line = line.replace( '((__nothrow__ , __leaf__));', ';')
-		if line.endswith('((__nothrow__ , __leaf__))  ;'): line = line.replace('((__nothrow__ , __leaf__))  ;', ';')
-		if line.endswith('__attribute__ ;'): line = line.replace('__attribute__ ;', ';')
-		if line.endswith('((__nothrow__ , __leaf__)) ;'): line = line.replace('((__nothrow__ , __leaf__)) ;',';')
-		if line.strip().endswith(';') and '((__nothrow__ , __leaf__))' in line: line = line.replace('((__nothrow__ , __leaf__))','')
-		if line.endswith('((__format__ (__scanf__, 2, 0)));'): line = line.replace('((__format__ (__scanf__, 2, 0)));',';')
-
-		if '((__nothrow__ , __leaf__))' in line: line = line.replace('((__nothrow__ , __leaf__))', '')	# wayland
-
-		if line.strip().startswith('((format(printf') and line.strip().endswith(')))'): #blender/blenlib/BLI_string.h
-			line = ''
-		if line.strip() == '_Static_assert((sizeof(BMHeader) <= 16), "BMHeader size has grown!");;':
-			# special case for blender/bmesh/bmesh_class.h:85
-			line = ''
-
-		#######################
-		d += line + '\n'
-	return d
 
 TRANS_HEADER = '''
 
@@ -2110,12 +3217,19 @@ class GCC(object):
 		       -fpcc-struct-return.
 
 	'''
+	@staticmethod
+	def library_path( name ):		# where compile puts lib<name>.so
+		if IS32BIT: cachepath = os.path.join(CACHEDIR,'clibs/linux32')
+		else: cachepath = os.path.join(CACHEDIR,'clibs/linux64')
+		return os.path.join( cachepath, 'lib%s.so'%name )
+
 	@staticmethod
 	def compile( name, paths=[], source=None, includes=[], defines=[], links=[], cplusplus=False, optimize=2, pthread=True, glibc=True, gc=None, warnings=True, runpath=None ):
 		assert paths or source
 		if not paths:
 			if cplusplus: paths = ['/tmp/_compile_.cpp']
 			else: paths = ['/tmp/_compile_.c']
+			if not isinstance( source, bytes ): source = source.encode('utf-8')		# python3
 			f = open(paths[0],'wb')
 			f.write( source ); f.close()
 
@@ -2150,10 +3264,8 @@ class GCC(object):
 
 		for lib in links:
 			cmd += ' -l%s ' %lib		# name without path or 'lib' prefix or '.so' extension, ie: 'OgreMain' not libOgreMain.so
-		if IS32BIT: cachepath = os.path.join(CACHEDIR,'clibs/linux32')
-		else: cachepath = os.path.join(CACHEDIR,'clibs/linux64')
-		if not os.path.isdir(cachepath): os.makedirs( cachepath )
-		libpath = os.path.join( cachepath, 'lib%s.so'%name )
+		libpath = GCC.library_path( name )
+		if not os.path.isdir(os.path.dirname(libpath)): os.makedirs( os.path.dirname(libpath) )
 		cmd += '-o %s ' %libpath
 		for asmob in asmobjects: cmd += ' %s ' %asmob
 		print( cmd )
@@ -3227,13 +4339,35 @@ class C( SourceCode ):		# using pycparser
 		self.set_ctypes_header()
 		self.set_rffi_header()
 
-		#CParser = pycparser.c_parser.CParser( lex_optimize=False, yacc_debug=True, yacc_optimize=False )
-		parser = CParser( lex_optimize=False, yacc_debug=True, yacc_optimize=False )
-		if '--debug' in sys.argv:
-			ast = parser.parse( string, debuglevel=2 )
-		else:
-			ast = parser.parse( string, debuglevel=debug )
+		if CTYPES_OUTPUT:		# before loading or parsing the AST, an up to date wrapper needs neither
+			self.manifest = WrapperManifest( os.path.join(CACHEDIR, os.path.dirname(CTYPES_OUTPUT), 'manifest.json') )
+			self.wrapper_key = _digest( PARSE_CACHE.generator_digest(), string, self.CTYPES_HEADER, CTYPES_FOOTER, repr(STRIP_PREFIXES), repr(self.macro_defines), repr(INCLUDE_DIRS), OUTPUT_FORMAT, repr(GIL_POLICY) )
+			outputs = [ os.path.join(CACHEDIR, CTYPES_OUTPUT) ]
+			if OUTPUT_FORMAT == 'descriptor': outputs.append( os.path.join(CACHEDIR, self.descriptor_output()) )
+			if self.manifest.is_up_to_date( self.wrapper_key, *outputs ):
+				self.up_to_date = True
+				return
+
+		t = time.time()
+		ast = None
+		if self.cached_ast is not None: ast = PARSE_CACHE.load_ast( self.cached_ast )
+		if ast is None:
+			parser = get_cparser()
+			if '--debug' in sys.argv:
+				ast = parser.parse( string, debuglevel=2 )
+			else:
+				ast = parser.parse( string, debuglevel=debug )
+			if self.parse_cache_key:
+				entry = {
+					'source' : string,
+					'ast' : ast,
+					'if_defs' : self.if_defs,
+					'macro_defines' : self.macro_defines,
+				}
+				PARSE_CACHE.store( self.parse_cache_key, self.source_url, self.parse_cache_deps, entry )
+		self.timings.append( ('parse', time.time()-t) )
 		self.ast = ast
+
 		self.python = self.output = []
 		self.structs = []
 		self.unions = []
@@ -3243,13 +4377,24 @@ class C( SourceCode ):		# using pycparser
 		self.somethings = []
 		self.indent = 0
 		self.objects = []
+		t = time.time()
 		self.walk( ast )
+		self.fold_macros( self.enum_key_value, self.typedef_words )
+		SomeThing.FROZEN = True		# type resolution is final from here on
 		self.cyclics = Union.mark_cyclic()
+		if self.manifest:
+			exts = self.ast.ext
+			self.declaration_digests = dict( zip( [id(ext) for ext in exts], _declaration_digests(exts) ) )
+			if '--no-fragment-cache' not in sys.argv:
+				config = [ a for a in self.cpp_args() if not a.startswith('-I') ]		# include dirs only decide which headers are found
+				self.fragments = FragmentCache( os.path.join(CACHEDIR, 'fragments'), _digest(PARSE_CACHE.generator_digest(), repr(config)) )
+		self.timings.append( ('walk', time.time()-t) )
 
 	def set_ctypes_header(self):
 		self.CTYPES_HEADER =  CTYPES_HEADER + '\n' + '''
 _rpythonic_load_dynamic_libraries( %s )
 ''' %self.shared_library_names
+		if LAZY_FUNCTIONS: self.CTYPES_HEADER += '_rpythonic_lazy_functions_( True )\n'
 
 
 	def set_rffi_header( self ):
@@ -3282,11 +4427,12 @@ _rpythonic_load_dynamic_libraries( %s )
 		a = '################ Globals ##############\n'
 		for name in self.macro_globals:
 			value = self.macro_globals_values[ name ]
-			if type(value) is str: a += '%s = "%s"\n' %(name,value)
+			if type(value) is str: a += '%s = %r\n' %(name,value)		# folded strings may hold quotes and escapes
 			else: a += '%s = %s\n' %(name,value)
+		symbols = SomeThing.Symbols
 		a += '################# ENUMS ################\n'
-		a += '\n'.join( [o.gen_rffi() for o in SomeThing.get_enums()] ) + '\n'
-		us = SomeThing.get_unions_and_structs()
+		a += '\n'.join( [o.gen_rffi() for o in symbols.get_enums()] ) + '\n'
+		us = symbols.get_unions_and_structs()
 
 		a += '################# Forwardref Structs ################\n'
 		a += '\n'.join( [o.gen_rffi(declare=False, forward=True) for o in us] ) + '\n'
@@ -3297,29 +4443,74 @@ _rpythonic_load_dynamic_libraries( %s )
 		a += '################# Become Structs ################\n'
 		a += '\n'.join( [o.gen_rffi(declare=False, become=True) for o in us] ) + '\n'
 		a += '################# Functions ################\n'
-		a += '\n'.join( [o.gen_rffi() for o in SomeThing.get_funcs()] )
+		a += '\n'.join( [o.gen_rffi() for o in symbols.get_funcs()] )
 		return self.RFFI_HEADER + a
 
+	def enum_key_value( self, key ):
+		enum = SomeThing.Symbols.get_enum_with_key( key )
+		if enum: return enum.enum_value( key )
+
+	def typedef_words( self, name ):
+		typedef = SomeThing.Typedefs.get( name )
+		if typedef is None: return None
+		words = typedef.type().replace( ':', ' ' ).split()
+		if typedef.pointers(): words.append( '*' )
+		return words
+
+	def emit( self, kind, name, o, generate, fingerprint=None ):
+		'''
+		text of one declaration: reused from the manifest when its fingerprint did not change,
+		else from the shared fragment of the header that declared it, else generated
+		'''
+		if not self.manifest: return generate()
+		header = '<wrapper>'
+		if o is not None:
+			root = o
+			while root.parent: root = root.parent
+			digest = self.declaration_digests.get( id(root.ast) )
+			if digest is None: return generate()		# not a top level declaration, never reused
+			fingerprint = _digest( PARSE_CACHE.generator_digest(), digest )
+			coord = root.ast.coord
+			if coord and coord.file and coord.file != '<stdin>': header = coord.file
+
+		source = [ 'manifest' ]
+		def _generate():
+			source[0] = 'generated'
+			return generate()
+		def _fragment():
+			source[0] = 'fragment'
+			return self.fragments.emit( header, kind, name, fingerprint, _generate )
+		if self.fragments and header != '<wrapper>': text = self.manifest.emit( kind, name, fingerprint, _fragment )
+		else: text = self.manifest.emit( kind, name, fingerprint, _generate )
+		if self.fragments: self.fragments.count( header, source[0], text )
+		return text
+
 	def generate_ctypes_wrapper(self):	
 		a = '## macro globals ##\n'
 		for name in self.macro_globals:
 			value = self.macro_globals_values[ name ]
 			if name in PYTHON_RESERVED_NAMES: name = 'C_%s'%name
-			if type(value) is str: a += '%s = "%s"\n' %(name,value)
-			else: a += '%s = %s\n' %(name,value)
+			if type(value) is str: line = '%s = %r\n' %(name,value)		# folded strings may hold quotes and escapes
+			else: line = '%s = %s\n' %(name,value)
+			a += self.emit( 'macro', name, None, lambda: line, fingerprint=line )
 
+		symbols = SomeThing.Symbols
+		enums = symbols.get_enums()
+		funcs = symbols.get_funcs()
 		a += '## enums ##\n'
-		a += '\n'.join( [o.gen_ctypes() for o in SomeThing.get_enums()] ) + '\n'
+		a += '\n'.join( [self.emit('enum', o.name() or ','.join([k for k,v in o.values]), o, o.gen_ctypes) for o in enums] ) + '\n'
 		a += '## simple enums ##\n'
 		a += 'RPYTHONIC_GLOBAL_ENUMS = { \n'
-		for o in SomeThing.get_enums():
+		for o in enums:
 			if not o.is_named_enum():
 				a += o.dict_format() + '\n'
 		a += '\n}\n'
 
 		## declare unions/structs first, so that they can self-reference
-		u = SomeThing.get_unions_and_structs()
-		a += '\n'.join( [o.gen_ctypes(declare=True) for o in u] ) + '\n'
+		tables = self.static_tables()
+		u = symbols.get_unions_and_structs()
+		a += '## union and structures ##\n'
+		a += '_RPYTHONIC_STRUCTS_ = [\n%s\n]\n' %'\n'.join( [self.emit('declare', o._name(), o, lambda: o.gen_ctypes_table(declare=True)) for o in u] )
 
 		## func prototypes ##
 		#for o in SomeThing.get_funcs(): a += '%s\n' %o.gen_ctypes(prototype=True)
@@ -3332,7 +4523,7 @@ _rpythonic_load_dynamic_libraries( %s )
 					n = n.split(':')[-1]
 					if n not in protos: protos.append( n )
 		## check for functions that take arguments pointing to another function(callback)
-		for func in SomeThing.get_funcs():
+		for func in funcs:
 			for arg in func.args:
 				argtype = arg.type()
 				if argtype.startswith('function:'):
@@ -3347,19 +4538,113 @@ _rpythonic_load_dynamic_libraries( %s )
 		#		a += '%s\n' %func.gen_ctypes(prototype=True)
 		#	else: assert 0
 
-		a += '## union and structures ##\n'
 		## define unions/structs members (must be ordered), cyclic fields can still break ctypes - is that possible in C?
+		## frozen at import, or on first reference with lazy structs, see _rpythonic_load_structs_
 		u = SomeThing.get_unions_and_structs( sort=True )
-		a += '\n'.join( [o.gen_ctypes(declare=False) for o in u] ) + '\n'
+		a += '_RPYTHONIC_FIELDS_ = [\n%s\n]\n' %'\n'.join( [self.emit('struct', o._name(), o, lambda: o.gen_ctypes_table()) for o in u] )
+		a += '_RPYTHONIC_DEPENDS_ = [\n%s]\n' %''.join( ['\t%r,\n' %(entry,) for entry in tables['depends']] )
+		a += '_rpythonic_load_structs_( %r )\n' %(tables['by_value'],)
 
 		a += '## wrapper functions ##\n'
+		a += '_RPYTHONIC_GIL_HOLDING_ = set( [%s] )\n' %''.join( ['\n\t%r,' %name for name in tables['gil']] )
 		## write wrapper functions
-		for o in SomeThing.get_funcs():
+		for o in funcs:
 			if not o.name().startswith('__') and not o.static and not o.has_ellipsis:
-				a += '%s\n' %o.gen_ctypes()
+				a += '%s\n' %self.emit( 'function', o.name(), o, o.gen_ctypes )
+
+		a += '## OO API and aliases ##\n'
+		for name in 'oo returns enum_aliases'.split():
+			a += '_RPYTHONIC_%s_ = [\n%s]\n' %( name.upper(), ''.join(['\t%r,\n' %(entry,) for entry in tables[name]]) )
+		if tables['stripped'] is not None:
+			a += '_RPYTHONIC_STRIPPED_ = [\n%s]\n' %''.join( ['\t%r,\n' %(entry,) for entry in tables['stripped']] )
+
+		return self.CTYPES_HEADER + '\n' + a + '\n' + self.ctypes_tail( tables )
+
+	def static_tables( self ):
+		'''
+		what the tail of a wrapper used to work out from its globals at every import:
+			oo				- (struct, short name, methods, prefixes, [(alias, name)]) in freeze order, unions have no methods
+			returns			- (function, struct) of the functions returning a pointer to a struct
+			enum_aliases	- (alias, key) of RPYTHONIC_GLOBAL_ENUMS
+			stripped		- (new name, name) for STRIP_PREFIXES, None when the ctypes footer can add names
+			gil				- names of the functions that hold the GIL, see _gil_holding and the hold_gil/release_gil options
+			depends			- (struct, [structs]) it holds by value, they must be frozen first
+			by_value		- structs a function signature holds by value, frozen at import with lazy structs
+			footer			- structs and short names the ctypes footer refers to, made at import with lazy structs
+		'''
+		symbols = SomeThing.Symbols
+		names = [ (name in PYTHON_RESERVED_NAMES and 'C_%s' %name or name) for name in self.macro_globals ]
+		enum_keys = []
+		for o in symbols.get_enums():
+			dictname, values = o.python_values()
+			if dictname: names.append( dictname )
+			else:
+				for key, value in values:
+					if key not in enum_keys: enum_keys.append( key )
+		names += enum_keys
 
+		u = SomeThing.get_unions_and_structs( sort=True )
+		structs = set( [o._name() for o in u if o.tag != 'Union'] )
+		methods = dict( [(o._name(), []) for o in u] )
+		declared = set( [o._name() for o in u] )
+		depends = []
+		for o in u:
+			held = []
+			for name, ctype in o.ctypes_fields():
+				v = _value_struct( ctype, declared )
+				if v and v not in held: held.append( v )
+			if held: depends.append( (o._name(), held) )
+		returns = []; gil = []; by_value = set()
+		hold, release, heuristic = GIL_POLICY
+		for o in symbols.get_funcs():
+			if o.name().startswith('__') or o.static or o.has_ellipsis: continue
+			restype, args = o.ctypes_signature()
+			for ctype in [ restype ] + [ t for n,t in args ]:
+				if _value_struct( ctype, declared ): by_value.add( _value_struct( ctype, declared ) )
+			pointee = lambda t: t.startswith('ctypes.POINTER(') and t[15:-1] in structs and t[15:-1]
+			if pointee( restype ): returns.append( (o.name(), pointee(restype)) )
+			if args and pointee( args[0][1] ): methods[ pointee(args[0][1]) ].append( o.name() )
+			if [ p for p in release if fnmatch.fnmatchcase( o.name(), p ) ]: continue
+			if [ p for p in hold if fnmatch.fnmatchcase( o.name(), p ) ] or (heuristic and _gil_holding( o.name(), restype, args )):
+				gil.append( o.name() )
+		funcs = [ f.name() for f in symbols.get_funcs() if not (f.name().startswith('__') or f.static or f.has_ellipsis) ]
+
+		altnames = _oo_altnames( [o._name() for o in u] )
+		oo = []
+		for o in u:
+			name = o._name()
+			prefixes, aliases = _oo_method_prefixes( methods[name] )
+			oo.append( (name, altnames.get(name, name), methods[name], prefixes, aliases) )
+		names += [ o._name() for o in u ] + funcs + [ entry[1] for entry in oo ]
+
+		struct_names = set( [o._name() for o in u] + list(altnames.values()) )
+		enum_aliases = []
+		for key in enum_keys:
+			if '_' in key and key.index('_') <= 4:
+				alias = key[ key.index('_') + 1 : ]
+				if alias not in struct_names: enum_aliases.append( (alias, key) )
+		names += [ alias for alias, key in enum_aliases ]
+
+		stripped = None
+		if STRIP_PREFIXES and not CTYPES_FOOTER:
+			stripped = []
+			for name in names:
+				for prefix in STRIP_PREFIXES:
+					if name.startswith( prefix ) and name[ len(prefix) : ]: stripped.append( (name[len(prefix):], name) )
+		footer = []
+		if CTYPES_FOOTER:
+			used = _code_names( CTYPES_FOOTER )
+			for name, altname, methods, prefixes, aliases in oo:
+				if used is None or name in used: footer.append( name )
+				elif altname in used and altname not in declared: footer.append( altname )
+		return {
+			'oo':oo, 'returns':returns, 'enum_aliases':enum_aliases, 'stripped':stripped, 'gil':sorted(gil),
+			'depends':depends, 'by_value':[ o._name() for o in u if o._name() in by_value ], 'footer':footer,
+		}
+
+	def ctypes_tail( self, tables ):
 		_tail = [
-				'_rpythonic_convert_structs_to_objects()',
+				'_rpythonic_convert_structs_to_objects( %r )' %(tables['footer'],),
 				CTYPES_FOOTER,	# this must come after structs are converted to smart-objects
 				'_rpythonic_setup_return_wrappers()',
 				'_rpythonic_make_nice_global_enums_()',
@@ -3369,7 +4654,53 @@ _rpythonic_load_dynamic_libraries( %s )
 		]
 		if STRIP_PREFIXES:
 			_tail.append( '_rpythonic_strip_prefixes_(%s)' %STRIP_PREFIXES )
-		return self.CTYPES_HEADER + '\n' + a + '\n' + '\n'.join(_tail)
+		return '\n'.join(_tail)
+
+	def descriptor_output( self ): return os.path.join( os.path.dirname(CTYPES_OUTPUT), WrapperDescriptor.FILENAME )
+
+	def generate_ctypes_descriptor( self ):
+		'''(__init__.py, wrapper.rpyd) for output_format "descriptor", the same wrapper as generate_ctypes_wrapper'''
+		d = WrapperDescriptor()
+		for name in self.macro_globals:
+			value = self.macro_globals_values[ name ]
+			if name in PYTHON_RESERVED_NAMES: name = 'C_%s'%name
+			d.add_line( 'globals', name, _py_literal(value) )
+
+		symbols = SomeThing.Symbols
+		global_enums = {}
+		for o in symbols.get_enums():
+			dictname, values = o.python_values()
+			if dictname: d.add_line( 'globals', dictname, _py_literal(dict(values)) )
+			else:
+				for key, value in values: d.add_line( 'globals', key, _py_literal(value) )
+				global_enums.update( dict(values) )
+		d.add_line( 'globals', 'RPYTHONIC_GLOBAL_ENUMS', _py_literal(global_enums) )
+
+		tables = self.static_tables()
+		for o in symbols.get_unions_and_structs(): d.add_line( 'declare', o._name(), o.ctypes_kind() )
+		for o in SomeThing.get_unions_and_structs( sort=True ):
+			fields = []
+			for name, ctype in o.ctypes_fields(): fields += [ name, d.type_id(ctype) ]
+			d.add( 'S', o._name(), fields )
+		for name, depends in tables['depends']: d.add_line( 'depends', name, *depends )
+
+		for o in symbols.get_funcs():
+			if o.name().startswith('__') or o.static or o.has_ellipsis: continue
+			restype, args = o.ctypes_signature()
+			fields = [ d.type_id(restype) ]
+			for name, ctype in args: fields += [ name, d.type_id(ctype) ]
+			d.add( 'C', o.name(), fields )
+
+		for name, altname, methods, prefixes, aliases in tables['oo']:
+			d.add_line( 'oo', name, altname, ','.join(methods), ','.join(prefixes), ','.join(['%s=%s' %alias for alias in aliases]) )
+		for function, name in tables['returns']: d.add_line( 'returns', name, function )
+		for alias, key in tables['enum_aliases']: d.add_line( 'enum_aliases', alias, key )
+		for name in tables['gil']: d.add_line( 'gil', name )
+		if tables['stripped'] is not None:
+			d.blocks[ 'stripped' ] = [ '%s\t%s' %entry for entry in tables['stripped'] ]
+
+		loader = '_rpythonic_load_descriptor_( %r )' %WrapperDescriptor.FILENAME
+		return self.CTYPES_HEADER + '\n' + loader + '\n' + self.ctypes_tail( tables ), d.tobytes()
 
 
 
@@ -3402,6 +4733,72 @@ _rpythonic_load_dynamic_libraries( %s )
 
 if pycparser:
 	class CParser( pycparser.c_parser.CParser ):
+		RULES_WITH_OPT = (		# from pycparser.c_parser.CParser.__init__
+			'abstract_declarator',
+			'assignment_expression',
+			'declaration_list',
+			'declaration_specifiers',
+			'designation',
+			'expression',
+			'identifier_list',
+			'init_declarator_list',
+			'parameter_type_list',
+			'specifier_qualifier_list',
+			'block_item_list',
+			'type_qualifier_list',
+			'struct_declarator_list'
+		)
+
+		def __init__( self, lex_optimize=False, yacc_debug=False, yacc_optimize=False, tabdir=None ):
+			'''
+			table caching mode (tabdir given): the lexer table module and the pickled LALR tables are saved in tabdir,
+			named by grammar_digest(), and reused by later runs and other processes.
+			yacc_debug writes parser.out, it is only useful when changing the grammar.
+			'''
+			if not tabdir:
+				pycparser.c_parser.CParser.__init__( self, lex_optimize=lex_optimize, yacc_debug=yacc_debug, yacc_optimize=yacc_optimize )
+				return
+
+			import ply.yacc
+			digest = self.grammar_digest()
+			if not os.path.isdir( tabdir ): os.makedirs( tabdir )
+			if tabdir not in sys.path: sys.path.append( tabdir )	# lextab is loaded with import
+
+			self.clex = pycparser.c_lexer.CLexer(
+				error_func=self._lex_error_func,
+				type_lookup_func=self._lex_type_lookup_func)
+			self.clex.build( optimize=True, lextab='rpythonic_lextab_%s' %digest, outputdir=tabdir )
+			self.tokens = self.clex.tokens
+
+			for rule in self.RULES_WITH_OPT: self._create_opt_rule( rule )
+
+			self.cparser = ply.yacc.yacc(
+				module=self,
+				start='translation_unit',
+				debug=yacc_debug,
+				debugfile=os.path.join( tabdir, 'parser.out' ),
+				optimize=True,		# trust the pickle, it is keyed by the grammar digest
+				picklefile=os.path.join( tabdir, 'rpythonic_yacctab_%s.pickle' %digest ) )
+			self._scope_stack = [set()]
+
+		@classmethod
+		def grammar_digest( self ):
+			'''
+			digest of the lexer rules, tokens, precedence and every grammar rule docstring,
+			including the rules overridden here (p_decl_body)
+			'''
+			import ply.yacc
+			lexer = pycparser.c_lexer.CLexer
+			parts = [ ply.yacc.__version__, repr(lexer.tokens), repr(getattr(lexer,'states',())), repr(self.precedence), repr(self.RULES_WITH_OPT) ]
+			for name in sorted( dir(lexer) ):
+				if name.startswith('t_'):
+					rule = getattr( lexer, name )
+					if type(rule) is str: parts.append( '%s=%s' %(name,rule) )
+					else: parts.append( '%s=%s' %(name,rule.__doc__) )
+			for name in sorted( dir(self) ):
+				if name.startswith('p_'): parts.append( '%s=%s' %(name, getattr(self,name).__doc__) )
+			return _digest( *parts )[ : 16 ]
+
 		#def p_pp_directive(self,p):
 		#	""" pp_directive  : PPHASH 
 		#	"""
@@ -3490,6 +4887,15 @@ if pycparser:
 			type.type = c_ast.IdentifierType(typename)
 			return decl
 
+	_CPARSERS = {}
+	def get_cparser():
+		'''
+		one CParser per process and tables directory, building the tables is the slow part and parse() resets its own state
+		'''
+		tabdir = os.path.join( CACHEDIR, 'parsetabs' )
+		if tabdir not in _CPARSERS:
+			_CPARSERS[ tabdir ] = CParser( yacc_debug='--yacc-debug' in sys.argv, tabdir=tabdir )
+		return _CPARSERS[ tabdir ]
 
 
 class AndroidPackage( object ):
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+## calls per second of generated ctypes wrappers releasing the GIL (CDLL) and holding it (PyDLL) ##
+## builds a small C library with gcc, wraps it and times each function both ways:
+##	release		- bound through the CDLL, the GIL is released and reacquired around every call
+##	hold		- bound through a PyDLL handle of the same library, see metafunc.hold_gil
+## once from one thread and once from --threads threads calling together, where releasing also means contention.
+## usage: python bench-gil.py [--calls=N] [--threads=N] [--output=dir]
+import os, sys, shutil, time, tempfile, subprocess, threading
+sys.path.append('..')
+import rpythonic
+
+CALLS = 200000
+THREADS = 4
+OUTPUT = None
+for arg in sys.argv:
+	if arg.startswith('--calls='): CALLS = int( arg.split('=')[-1] )
+	elif arg.startswith('--threads='): THREADS = int( arg.split('=')[-1] )
+	elif arg.startswith('--output='): OUTPUT = arg.split('=')[-1]
+
+HEADER = '''
+struct bench_obj { int v; double w; };
+int bench_obj_get_v( struct bench_obj *o );
+int bench_is_set( int flags, int bit );
+double bench_get_scale( double x, float k );
+void bench_nop( void );
+int bench_sum_range( int n );
+'''
+SOURCE = '''
+#include "bench.h"
+int bench_obj_get_v( struct bench_obj *o ) { return o->v; }
+int bench_is_set( int flags, int bit ) { return (flags >> bit) & 1; }
+double bench_get_scale( double x, float k ) { return x * k; }
+void bench_nop( void ) { }
+int bench_sum_range( int n ) { int i, s = 0; for (i = 0; i < n; i++) s += i ^ s; return s; }
+'''
+
+tmp = OUTPUT or tempfile.mkdtemp( prefix='rpythonic-bench-gil-' )
+try:
+	if not os.path.isdir( tmp ): os.makedirs( tmp )
+	open( os.path.join(tmp,'bench.h'), 'w' ).write( HEADER )
+	open( os.path.join(tmp,'bench.c'), 'w' ).write( SOURCE )
+	lib = os.path.join( tmp, 'libbench.so' )
+	subprocess.check_call( ['gcc', '-O2', '-shared', '-fPIC', '-o', lib, os.path.join(tmp,'bench.c')] )
+
+	rpythonic.set_cache( tmp )
+	rpythonic.wrap( 'rpythonic_bench_gil', header=os.path.join(tmp,'bench.h'), library_names=[lib], gil_heuristic=True )
+	sys.path.insert( 0, tmp )
+	import rpythonic_bench_gil as B
+
+	obj = B.bench_obj()
+	CASES = [
+		( 'bench_nop()',					B.bench_nop,		() ),
+		( 'bench_obj_get_v(pointer)',		B.bench_obj_get_v,	(obj.POINTER,) ),
+		( 'bench_is_set(int, int)',			B.bench_is_set,		(5, 2) ),
+		( 'bench_get_scale(double, float)',	B.bench_get_scale,	(1.5, 2.0) ),
+		( 'bench_sum_range(1000)',			B.bench_sum_range,	(1000,) ),
+	]
+
+	def rate( func, args, threads=1 ):
+		calls = CALLS // threads
+		def loop():
+			for i in range( calls ): func( *args )
+		workers = [ threading.Thread( target=loop ) for i in range(threads) ]
+		start = time.time()
+		for t in workers: t.start()
+		for t in workers: t.join()
+		return calls * threads / (time.time() - start)
+
+	print( 'functions holding the GIL by the heuristic: %s' %', '.join( sorted(B._RPYTHONIC_GIL_HOLDING_) ) )
+	print( '%-32s %11s %11s %7s %11s %11s %7s' %('calls per second', 'release', 'hold', 'speedup', 'release x%s' %THREADS, 'hold x%s' %THREADS, 'speedup') )
+	for label, func, args in CASES:
+		default = func.holds_gil
+		func.hold_gil( False )
+		release = rate( func, args ); release_mt = rate( func, args, THREADS )
+		func.hold_gil( True )
+		hold = rate( func, args ); hold_mt = rate( func, args, THREADS )
+		func.hold_gil( default )
+		print( '%-32s %11d %11d %6.2fx %11d %11d %6.2fx' %(label, release, hold, hold/release, release_mt, hold_mt, hold_mt/release_mt) )
+finally:
+	if not OUTPUT: shutil.rmtree( tmp, ignore_errors=True )		# a temp dir of this run, --output keeps it
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+## calls per second of generated ctypes wrappers ##
+## builds a small C library with gcc, wraps it and times each function three ways:
+##	generic		- metafunc._call_, the argument conversion every call used to take
+##	stub		- metafunc(...), the per-signature call stub
+##	ctypes		- the bare ctypes function, the floor
+## usage: python bench-wrappers.py [--calls=N] [--output=dir]
+import os, sys, shutil, time, tempfile, subprocess
+sys.path.append('..')
+import rpythonic
+
+CALLS = 200000
+OUTPUT = None
+for arg in sys.argv:
+	if arg.startswith('--calls='): CALLS = int( arg.split('=')[-1] )
+	elif arg.startswith('--output='): OUTPUT = arg.split('=')[-1]
+
+HEADER = '''
+struct bench_obj { int v; double w; };
+int bench_add( int a, int b );
+double bench_scale( double x, float k );
+int bench_len( const char *s );
+int bench_get( struct bench_obj *o );
+void bench_nop( void );
+'''
+SOURCE = '''
+#include <string.h>
+#include "bench.h"
+int bench_add( int a, int b ) { return a + b; }
+double bench_scale( double x, float k ) { return x * k; }
+int bench_len( const char *s ) { return (int)strlen( s ); }
+int bench_get( struct bench_obj *o ) { return o->v; }
+void bench_nop( void ) { }
+'''
+
+tmp = OUTPUT or tempfile.mkdtemp( prefix='rpythonic-bench-' )
+try:
+	if not os.path.isdir( tmp ): os.makedirs( tmp )
+	open( os.path.join(tmp,'bench.h'), 'w' ).write( HEADER )
+	open( os.path.join(tmp,'bench.c'), 'w' ).write( SOURCE )
+	lib = os.path.join( tmp, 'libbench.so' )
+	subprocess.check_call( ['gcc', '-O2', '-shared', '-fPIC', '-o', lib, os.path.join(tmp,'bench.c')] )
+
+	rpythonic.set_cache( tmp )
+	rpythonic.wrap( 'rpythonic_bench', header=os.path.join(tmp,'bench.h'), library_names=[lib] )
+	sys.path.insert( 0, tmp )
+	import rpythonic_bench as B
+
+	obj = B.bench_obj()
+	CASES = [
+		( 'bench_nop()',				B.bench_nop,	() ),
+		( 'bench_add(int, int)',		B.bench_add,	(1, 2) ),
+		( 'bench_scale(double, float)',	B.bench_scale,	(1.5, 2.0) ),
+		( 'bench_len(str)',				B.bench_len,	('rpythonic',) ),
+		( 'bench_get(meta object)',		B.bench_get,	(obj,) ),
+		( 'bench_get(pointer)',			B.bench_get,	(obj.POINTER,) ),
+	]
+
+	def rate( func, args ):
+		start = time.time()
+		for i in range( CALLS ): func( *args )
+		return CALLS / (time.time() - start)
+
+	print( '%-28s %12s %12s %12s %8s' %('calls per second', 'generic', 'stub', 'ctypes', 'speedup') )
+	for label, func, args in CASES:
+		generic = rate( func._call_, args )
+		stub = rate( func, args )
+		if 'str' in label or 'meta' in label: native = None		# ctypes alone does not take these
+		else: native = rate( func.function, args )
+		print( '%-28s %12d %12d %12s %7.1fx' %(label, generic, stub, native and '%d' %native or '-', stub/generic) )
+	print( 'shared call stubs: %s' %len(B._RPYTHONIC_STUBS_) )
+finally:
+	if not OUTPUT: shutil.rmtree( tmp, ignore_errors=True )		# a temp dir of this run, --output keeps it
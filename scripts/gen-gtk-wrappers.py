@@ -8,6 +8,18 @@ if sys.argv[-1].startswith('--output='):
 else:
 	rpythonic.set_cache('../examples' )
 
+## --jobs=N collects the wrappers and runs them on a process pool, see rpythonic.wrap_batch ##
+JOBS = 1
+for arg in sys.argv:
+	if arg.startswith('--jobs='): JOBS = int( arg.split('=')[-1] )
+BATCH = []
+def wrap( name='', **kw ):
+	if JOBS > 1:
+		kw['name'] = name
+		BATCH.append( kw )
+	else: rpythonic.wrap( name, **kw )
+
+
 
 GINCLUDE = [
 	'/usr/include/glib-2.0/',
@@ -24,7 +36,7 @@ glibfooter = open( 'glibfooter.py', 'rb' ).read()
 gtkfooter = open( 'gtkfooter.py', 'rb' ).read()
 
 if '--gtk3' in sys.argv:
-	rpythonic.wrap(
+	wrap(
 		'gtk3',		# do not use "gtk" (already used by old pygtk)
 		header='/usr/include/gtk-3.0/gtk/gtk.h', 
 		library='/usr/lib/libgtk-3.so',
@@ -38,7 +50,7 @@ if '--gtk3' in sys.argv:
 
 if '--clutter' in sys.argv:
 	# yum install clutter-gtk-devel		# this also gets gtk-devel
-	rpythonic.wrap(
+	wrap(
 		'libclutter-gtk',
 		header='/usr/include/clutter-gtk-1.0/clutter-gtk/clutter-gtk.h', 
 		library_name='libclutter-gtk-1.0',
@@ -61,7 +73,7 @@ GTK2INCLUDE = [
 ]
 
 if '--gtk2' in sys.argv:
-	rpythonic.wrap( 
+	wrap( 
 		'gtk2', 
 		header='/usr/include/gtk-2.0/gtk/gtk.h', 
 		includes=GTK2INCLUDE + GINCLUDE, ctypes_footer=glibfooter + gtkfooter,
@@ -73,7 +85,7 @@ if '--gtk2' in sys.argv:
 
 if '--wnck' in sys.argv:
 	#sudo apt-get install libwnck-dev
-	rpythonic.wrap( 'wnck', 
+	wrap( 'wnck', 
 		defines = ['WNCK_I_KNOW_THIS_IS_UNSTABLE'],
 		#includes=[ '/usr/include/libwnck-1.0'] + GTK2INCLUDE + GINCLUDE,
 		includes=[ '/usr/include/libwnck-1.0', '/usr/include/gtk-3.0/'] + GINCLUDE,
@@ -84,7 +96,7 @@ if '--wnck' in sys.argv:
 
 
 if '--gimp' in sys.argv:
-	rpythonic.wrap( 'libgimp', 
+	wrap( 'libgimp', 
 		header='/usr/include/gimp-2.0/libgimp/gimp.h',
 		library = '/usr/lib/libgimp-2.0.so',
 		includes = ['/usr/include/gimp-2.0/'] + GINCLUDE,
@@ -97,7 +109,6 @@ if '--gstreamer' in sys.argv:
 	## TODO glib connect in footer - get from magicheader.py
 	footer = '''
 _RETURNS_CHARP_ = (
-	gst_version_string,
 	gst_structure_get_name,
 	gst_format_get_name,
 	gst_message_type_get_name,
@@ -105,10 +116,11 @@ _RETURNS_CHARP_ = (
 )
 
 for func in _RETURNS_CHARP_:
-	func.return_wrapper = lambda pointer=None: _CHARP2STRING(pointer)
+	func.return_string()
+gst_version_string.return_string( ownership='g_free' )
 '''
 
-	rpythonic.wrap( 'libgstreamer', 
+	wrap( 'libgstreamer', 
 		header='/usr/include/gstreamer-0.10/gst/gst.h',
 		library = 'libgstreamer-0.10.so',
 		includes = ['/usr/include/gstreamer-0.10/', '/usr/include/libxml2'] + GINCLUDE,
@@ -139,7 +151,7 @@ if '--nautilus' in sys.argv:
 
 	includes = ['/usr/include/libxml2', '../../nautilus', '../../nautilus/src', '../../nautilus/libnautilus-extension', '../../nautilus/libnautilus-private']
 
-	rpythonic.wrap( 'libnautilus', 
+	wrap( 'libnautilus', 
 		header='../../nautilus/src/nautilus-window.h',
 		insert_headers = headers,
 		includes=[
@@ -152,10 +164,8 @@ if '--nautilus' in sys.argv:
 if '--gio' in sys.argv:
 	footer = '''
 _RETURNS_CHARP_ = (
-	g_settings_get_string,
 	g_checksum_get_string,
 	g_hmac_get_string,
-	g_key_file_get_string,
 	g_match_info_get_string,
 	g_param_spec_get_name,
 
@@ -169,33 +179,40 @@ _RETURNS_CHARP_ = (
 	g_app_info_get_commandline,
 
 	g_dbus_proxy_get_name,
-	g_dbus_proxy_get_name_owner,
 	g_dbus_proxy_get_object_path,
 	g_dbus_proxy_get_interface_name,
-	g_drive_get_name,
 
 	g_file_info_get_content_type,
 	g_file_info_get_name,
 	g_file_info_get_display_name,
 	g_file_info_get_edit_name,
 	g_io_extension_get_name,
-	g_mount_get_name,
-	g_volume_get_name,
 
 	g_dbus_object_manager_client_get_name,
-	g_dbus_object_manager_client_get_name_owner,
 
 	g_menu_attribute_iter_get_name,
 	g_menu_link_iter_get_name,
 )
 
+_RETURNS_CHARP_GFREE_ = (
+	g_settings_get_string,
+	g_key_file_get_string,
+	g_dbus_proxy_get_name_owner,
+	g_drive_get_name,
+	g_mount_get_name,
+	g_volume_get_name,
+	g_dbus_object_manager_client_get_name_owner,
+)
+
 for func in _RETURNS_CHARP_:
-	func.return_wrapper = lambda pointer=None: _CHARP2STRING(pointer)
+	func.return_string()
+for func in _RETURNS_CHARP_GFREE_:
+	func.return_string( ownership='g_free' )
 
 '''
 
 
-	rpythonic.wrap( 'libgio', 
+	wrap( 'libgio', 
 		header='/usr/include/glib-2.0/gio/gio.h',
 		includes = GINCLUDE,
 		ctypes_footer= glibfooter + footer,
@@ -204,7 +221,7 @@ for func in _RETURNS_CHARP_:
 	)
 
 if '--gvfs' in sys.argv:	# not working
-	rpythonic.wrap( 'libgvfs', 
+	wrap( 'libgvfs', 
 		header='/usr/include/glib-2.0/gio/gvfs.h',
 		includes = GINCLUDE,
 		ctypes_footer= glibfooter,
@@ -216,13 +233,13 @@ if '--gvfs' in sys.argv:	# not working
 # sudo apt-get install libwebkit-dev
 # sudo apt-get install libwebkitgtk-3.0-dev
 if '--webkit' in sys.argv:
-	rpythonic.wrap( 'webkit', 
+	wrap( 'webkit', 
 		header = '/usr/include/webkitgtk-3.0/JavaScriptCore/JavaScript.h',	# JavaScriptCore.h will want 
 		includes=['/usr/include/webkitgtk-3.0/'],
 		library_names=['libwebkitgtk-3.0'],
 	)
 
-	rpythonic.wrap( 'webkitgtk', 
+	wrap( 'webkitgtk', 
 		header='/usr/include/webkitgtk-3.0/webkit/webkit.h',
 		insert_headers = ['/usr/include/webkitgtk-3.0/JavaScriptCore/JavaScript.h'],
 		includes=['/usr/include/webkitgtk-3.0/', '/usr/include/libsoup-2.4/', '/usr/include/gtk-3.0/'] + GINCLUDE,
@@ -234,7 +251,7 @@ if '--webkit' in sys.argv:
 
 #sudo apt-get install libgirepository1.0-dev
 if '--gi' in sys.argv:
-	rpythonic.wrap( 'libgi', 
+	wrap( 'libgi', 
 		header = '/usr/include/gobject-introspection-1.0/girepository.h',
 		library_names=['libgirepository-1.0'],
 		includes = GINCLUDE,
@@ -244,7 +261,7 @@ if '--gi' in sys.argv:
 
 # apt-get install libappindicator-dev
 if '--appindicator' in sys.argv:
-	rpythonic.wrap( 'libappindicator', 
+	wrap( 'libappindicator', 
 		header='/usr/include/libappindicator-0.1/libappindicator/app-indicator.h',
 		includes=[
 			'/usr/include/gtk-3.0/',
@@ -255,3 +272,4 @@ if '--appindicator' in sys.argv:
 	)
 
 
+if BATCH: rpythonic.wrap_batch( BATCH, jobs=JOBS )
@@ -8,6 +8,18 @@ if sys.argv[-1].startswith('--output='):
 else:
 	rpythonic.set_cache('../examples' )
 
+## --jobs=N collects the wrappers and runs them on a process pool, see rpythonic.wrap_batch ##
+JOBS = 1
+for arg in sys.argv:
+	if arg.startswith('--jobs='): JOBS = int( arg.split('=')[-1] )
+BATCH = []
+def wrap( name='', **kw ):
+	if JOBS > 1:
+		kw['name'] = name
+		BATCH.append( kw )
+	else: rpythonic.wrap( name, **kw )
+
+
 
 ALL = '--all' in sys.argv
 
@@ -15,7 +27,7 @@ debug=0
 if '--emokit' in sys.argv or ALL:
 	#apt-get install libmcrypt-dev liboscpack-dev
 	#git clone http://github.com/qdot/emokit.git
-	rpythonic.wrap( 'emokit', 
+	wrap( 'emokit', 
 		header='/usr/local/include/libepoc.h',
 		library = '/usr/local/lib/libepoc.so',
 	)
@@ -23,7 +35,7 @@ if '--emokit' in sys.argv or ALL:
 
 if '--python3' in sys.argv or ALL:
 	footer = 'PyRun_SimpleString = PyRun_SimpleStringFlags'
-	rpythonic.wrap( 'python3', 
+	wrap( 'python3', 
 		header='/usr/include/python3.2/Python.h',
 		library = '/usr/lib/libpython3.2mu.so',
 		ctypes_footer = footer,
@@ -39,7 +51,7 @@ if '--ogre' in sys.argv:
 	ignore_ogre += 'Any AnyNumeric AnimableObject Animation DefaultWorkQueueBase'.split()
 	ignore_rtss = 'UniformParameter NormalMapLighting TargetRenderState'.split()
 
-	rpythonic.wrap( 'Ogre', 
+	wrap( 'Ogre', 
 		header='/usr/local/include/OGRE/Ogre.h', 
 		insert_headers = ['/usr/local/include/OGRE/RTShaderSystem/OgreRTShaderSystem.h'],
 		library='/usr/local/lib/libOgreMain.so',
@@ -62,7 +74,7 @@ if '--qt' in sys.argv:
 
 	insert_headers = []
 
-	rpythonic.wrap( 'Qt', 
+	wrap( 'Qt', 
 		header='/usr/include/qt4/QtCore/QtCore',
 		includes=includes, insert_headers=insert_headers,
 		library = '',
@@ -74,7 +86,7 @@ if '--qt' in sys.argv:
 
 if '--g3d' in sys.argv:
 	ignore_funcs = ['G3D::'+n for n in 'toString glGetCurrentContext gcchtonl zipfileExists stringPtrCompare failureHook assertionHook debugPrint consolePrint consolePrintHook'.split()]
-	rpythonic.wrap( 'G3D', 
+	wrap( 'G3D', 
 		header='/usr/local/include/G3D/G3DAll.h',
 		static_libs=[ 'G3D' ],
 		ignore_classes = [],
@@ -95,7 +107,7 @@ if '--irr' in sys.argv:
 	#	if h.endswith('.h'):
 	#		insert.append( root+h )
 
-	rpythonic.wrap( 'Irrlicht', 
+	wrap( 'Irrlicht', 
 		header='/usr/local/include/irrlicht/irrlicht.h',
 		insert_headers = insert,
 		includes=['../../irrlicht-1.7.2/source/Irrlicht/'],
@@ -124,7 +136,7 @@ if os.path.isdir( nroot ) and '--naali' in sys.argv:
 	for h in 'SceneAPI.h Entity.h EntityAction.h IAttribute.h IComponent.h SceneEvents.h EC_Name.h'.split():
 		insert_headers.append( '%s/Scene/%s' %(nroot,h) )
 
-	rpythonic.wrap( 'Naali', 
+	wrap( 'Naali', 
 		header='%s/Foundation/Framework.h' %nroot,
 		includes=includes, insert_headers=insert_headers,
 		library = '',
@@ -143,7 +155,7 @@ if os.path.isdir( broot ) and '--bullet' in sys.argv:
 	# DOUBLE is off by default
 	#undefines = ['BT_USE_DOUBLE_PRECISION']	# build your bullet with FLOATING point precision
 
-	rpythonic.wrap( 'BulletPhysics', 
+	wrap( 'BulletPhysics', 
 		header='%s/btBulletDynamicsCommon.h' %broot,
 		insert_headers=['%s/btBulletCollisionCommon.h' %broot],
 		includes=includes,
@@ -161,7 +173,7 @@ if os.path.isdir( broot ) and '--bullet' in sys.argv:
 
 
 if '--sdl' in sys.argv or ALL:
-	rpythonic.wrap( 
+	wrap( 
 		'SDL', 
 		header='/usr/include/SDL/SDL.h', 
 		strip_prefixes = ['SDL_'],
@@ -191,7 +203,7 @@ for func in ( dBodyGetQuaternion,  ):
 ########### end of manual patch #########
 	'''
 	#ODE_API dJointID dJointCreateContact (dWorldID, dJointGroupID, const dContact *);
-	rpythonic.wrap(
+	wrap(
 		'ode', 
 		header='/usr/include/ode/ode.h', 
 		library_names=['ode-double', 'ode'],
@@ -243,7 +255,7 @@ IplImage.CvtColor = lambda a, b, t: cvCvtColor(a, b, t )
 IplImage.Convert = lambda a, b: cvConvertScale( a, b, 1.0, 0.0 )
 
 '''
-	rpythonic.wrap( 
+	wrap( 
 		name='opencv_core', 
 		library_names=['opencv_core', 'opencv_imgproc'],
 		defines = ['_MMINTRIN_H_INCLUDED', '_XMMINTRIN_H_INCLUDED', '_EMMINTRIN_H_INCLUDED'],
@@ -259,7 +271,7 @@ IplImage.Convert = lambda a, b: cvConvertScale( a, b, 1.0, 0.0 )
 
 
 	defines = []
-	rpythonic.wrap(
+	wrap(
 		'opencv_highgui',
 		library_names=['opencv_highgui'],
 		defines = ['_MMINTRIN_H_INCLUDED', '_XMMINTRIN_H_INCLUDED', '_EMMINTRIN_H_INCLUDED'],
@@ -269,7 +281,7 @@ IplImage.Convert = lambda a, b: cvConvertScale( a, b, 1.0, 0.0 )
 
 
 if '--openal' in sys.argv or ALL:
-	rpythonic.wrap(
+	wrap(
 		'openal', 
 		header='/usr/include/AL/al.h', 
 		insert_headers = ['/usr/include/AL/alc.h'],
@@ -278,12 +290,12 @@ if '--openal' in sys.argv or ALL:
 
 if '--alut' in sys.argv or ALL:
 
-	rpythonic.wrap( 'alut', header='/usr/include/AL/alut.h',  )
+	wrap( 'alut', header='/usr/include/AL/alut.h',  )
 
 
 if '--freenect' in sys.argv or ALL:
 	#git clone https://github.com/OpenKinect/libfreenect.git
-	rpythonic.wrap( 
+	wrap( 
 		'libfreenect', 
 		header='/usr/local/include/libfreenect/libfreenect.h',
 		strip_prefixes = ['freenect_', '_freenect_', 'FREENECT_'],
@@ -291,7 +303,7 @@ if '--freenect' in sys.argv or ALL:
 
 if '--freenect-sync' in sys.argv or ALL:
 	# note: freenect_sync broken on Fedora?
-	rpythonic.wrap(
+	wrap(
 		'libfreenect_sync', 
 		header='/usr/include/libfreenect_sync.h',
 		strip_prefixes = ['freenect_'],
@@ -300,7 +312,7 @@ if '--freenect-sync' in sys.argv or ALL:
 
 
 if '--opengl' in sys.argv or ALL:
-	rpythonic.wrap(
+	wrap(
 		'openGL',
 		header='/usr/include/GL/gl.h',
 		library_names=['libGL'],
@@ -309,21 +321,21 @@ if '--opengl' in sys.argv or ALL:
 	)
 
 if '--openglu' in sys.argv or ALL:
-	rpythonic.wrap(
+	wrap(
 		'openGLU',
 		header='/usr/include/GL/glu.h',
 		library_names=['libGLU'],
 	)
 
 if '--openglut' in sys.argv or ALL:
-	rpythonic.wrap(
+	wrap(
 		'openGLUT',
 		header='/usr/include/GL/glut.h',
 		library_names=['libglut'],
 	)
 
 if '--xlib' in sys.argv:
-	rpythonic.wrap(
+	wrap(
 		'xlib', 
 		header='/usr/include/X11/Xlib.h',
 		library_names=['libX11'],
@@ -333,19 +345,19 @@ if '--xlib' in sys.argv:
 
 
 if '--openjpeg' in sys.argv or ALL:
-	rpythonic.wrap( 'openjpeg', header='/usr/include/openjpeg.h' )
+	wrap( 'openjpeg', header='/usr/include/openjpeg.h' )
 
 
 if '--vnc' in sys.argv:
 	mod = rpythonic.load( 'vncserver', debug=debug )
 	if not mod:
-		rpythonic.wrap( 'vncserver', header='/usr/include/rfb/rfb.h' )
+		wrap( 'vncserver', header='/usr/include/rfb/rfb.h' )
 	else:
 		print( mod )
 
 	mod = rpythonic.load( 'vncclient', debug=debug )
 	if not mod:
-		rpythonic.wrap( 'vncclient', header='/usr/include/rfb/rfbclient.h' )
+		wrap( 'vncclient', header='/usr/include/rfb/rfbclient.h' )
 	else:
 		print( mod )
 
@@ -391,7 +403,7 @@ WIIMOTE_STATE_IR_SENS_LVL5 = 0x2000
 WIIMOTE_INIT_STATES = WIIMOTE_STATE_IR_SENS_LVL3
 
 	'''
-	rpythonic.wrap( 'wiiuse', 
+	wrap( 'wiiuse', 
 		header='/usr/local/include/wiiuse.h',
 		library = '/usr/local/lib/libwiiuse.so',
 		ctypes_footer = footer,
@@ -400,7 +412,7 @@ WIIMOTE_INIT_STATES = WIIMOTE_STATE_IR_SENS_LVL3
 
 
 if '--fluid' in sys.argv or ALL:
-	rpythonic.wrap( 'fluidsynth', 
+	wrap( 'fluidsynth', 
 		header='/usr/include/fluidsynth.h',
 		library = '/usr/lib/libfluidsynth.so',
 		strip_prefixes = ['fluid_'],
@@ -408,28 +420,28 @@ if '--fluid' in sys.argv or ALL:
 
 
 if '--fftw' in sys.argv or ALL:
-	rpythonic.wrap( 'fftw', 
+	wrap( 'fftw', 
 		header='/usr/include/fftw3.h',
 		library = '/usr/lib/libfftw3.so',
 		strip_prefixes = ['fftw_', 'FFTW_'],
 	)
 
 if '--avcodec' in sys.argv or ALL:
-	rpythonic.wrap( 'avcodec', 
+	wrap( 'avcodec', 
 		header='/usr/include/libavcodec/avcodec.h',
 		library = '/usr/lib/libavcodec.so',
 		strip_prefixes = ['AV', 'FF_'],
 	)
 
 if '--avformat' in sys.argv or ALL:
-	rpythonic.wrap( 'avformat', 
+	wrap( 'avformat', 
 		header='/usr/include/libavformat/avformat.h',
 		library = '/usr/lib/libavformat.so',
 		strip_prefixes = ['AV', 'FF_'],
 	)
 
 if '--libmlt' in sys.argv or ALL:
-	rpythonic.wrap( 'libmlt', 
+	wrap( 'libmlt', 
 		header='/usr/include/mlt/framework/mlt.h',
 		library = '/usr/lib/libmlt.so',
 		strip_prefixes = ['mlt_'],
@@ -439,7 +451,7 @@ if '--verse' in sys.argv or ALL:
 	# mkdir verse2
 	# cd verse2
 	# svn checkout  https://dev.nti.tul.cz/repos/verse2/verse2/trunk
-	rpythonic.wrap( 'libverse', 
+	wrap( 'libverse', 
 		header='../../verse2/trunk/include/verse.h',
 		library = '/usr/lib/libverse.so',
 		strip_prefixes = ['ve_'],
@@ -456,7 +468,7 @@ if '--mono' in sys.argv or ALL:
 		'/usr/include/mono-2.0/mono/metadata/assembly.h',
 	]
 
-	rpythonic.wrap( 'libmono', 
+	wrap( 'libmono', 
 		header='/usr/include/mono-2.0/mono/jit/jit.h',
 		library = '/usr/lib/libmono-2.0.so',
 		includes=['/usr/include/mono-2.0'],
@@ -469,7 +481,7 @@ if '--mono' in sys.argv or ALL:
 # gevent is moving from libevent to libev
 # http://dist.schmorp.de/libev/libev-4.11.tar.gz
 if '--libev' in sys.argv or ALL:
-	rpythonic.wrap( 'libev', 
+	wrap( 'libev', 
 		header='/usr/local/include/ev.h',
 		library_names=['libev'],
 		strip_prefixes = ['ev_', 'EV_'],
@@ -478,7 +490,7 @@ if '--libev' in sys.argv or ALL:
 
 #http://c-ares.haxx.se/download/c-ares-1.9.1.tar.gz
 if '--cares' in sys.argv or ALL:
-	rpythonic.wrap( 'cares', 
+	wrap( 'cares', 
 		header='/usr/local/include/ares.h',
 		library_names=['libcares'],
 		strip_prefixes = ['ares_', 'ARES_'],
@@ -490,7 +502,7 @@ IN_MOVE = IN_MOVED_FROM | IN_MOVED_TO
 IN_CLOSE = IN_CLOSE_WRITE | IN_CLOSE_NOWRITE
 IN_ALL_EVENTS = IN_ACCESS | IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_CLOSE_NOWRITE | IN_OPEN | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
 	'''
-	rpythonic.wrap( 'inotify', 
+	wrap( 'inotify', 
 		header='/usr/include/x86_64-linux-gnu/sys/inotify.h',
 		library_names=[''],
 		strip_prefixes = ['inotify_', 'IN_'],
@@ -498,17 +510,17 @@ IN_ALL_EVENTS = IN_ACCESS | IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_CLOSE_NO
 	)
 
 if '--unistd' in sys.argv or ALL:
-	rpythonic.wrap( 'unistd', 
+	wrap( 'unistd', 
 		header='/usr/include/unistd.h',
 		library_names=[''],
 	)
 
 if '--libvnc' in sys.argv or ALL:
-	rpythonic.wrap( 'vncserver', 
+	wrap( 'vncserver', 
 		header='/usr/include/rfb/rfb.h',
 		library_names=['libvncserver'],
 	)
-	rpythonic.wrap( 'vncclient', 
+	wrap( 'vncclient', 
 		header='/usr/include/rfb/rfbclient.h',
 		library_names=['libvncclient'],
 	)
@@ -522,14 +534,14 @@ for name in dir(wl_event_loop):
 
 '''
 
-	rpythonic.wrap( 'wayland_server', 
+	wrap( 'wayland_server', 
 		header='../../wayland/src/wayland-server.h',
 		includes=['../../wayland/src/'],
 		library_names=['libwayland-server'],
 		strip_prefixes = ['wl_', 'WL_'],
 		ctypes_footer = footer,
 	)
-	rpythonic.wrap( 'wayland_client', 
+	wrap( 'wayland_client', 
 		header='../../wayland/src/wayland-client.h',
 		includes=['../../wayland/src/'],
 		library_names=['libwayland-client'],
@@ -538,7 +550,9 @@ for name in dir(wl_event_loop):
 
 
 if '--test' in sys.argv:
-	rpythonic.wrap( 'testing', 
+	wrap( 'testing', 
 		header='./test.h',
 	)
 
+
+if BATCH: rpythonic.wrap_batch( BATCH, jobs=JOBS )
@@ -18,10 +18,8 @@ class _nice_callback_(object):
 
 		n = len(argspec.args) - len(args)
 		if not inspect.ismethod( func ): n += 1		# if not a bound-method
-		self.cfunc_prototype = ctypes.CFUNCTYPE( ctypes.c_void_p, *([ctypes.c_void_p]*n) )
-		g_signal_connect_data.change_argument_type( 'c_handler', self.cfunc_prototype )	# ugly workaround
-
-		self.cfunc = self.cfunc_prototype( self.call )
+		self.cfunc_prototype = _rpythonic_prototype_( ctypes.c_void_p, *([ctypes.c_void_p]*n) )		# one per arity
+		self.cfunc = _rpythonic_callback_( self.call, self.cfunc_prototype )		# pinned until the handler is destroyed
 
 		self.wrapped_args = _nice_callback_args_container_( args )
 		userdata = ctypes.pointer( ctypes.py_object(self.wrapped_args) )
@@ -43,7 +41,8 @@ class _nice_callback_(object):
 
 def connect( ptr, name, func, *args ):
 	wrapper = _nice_callback_( ptr.pyobject, func, args )
-	return g_signal_connect_data( ptr, name, wrapper.cfunc, wrapper.userdata )
+	notify = _rpythonic_destroy_notify_( g_signal_connect_data.argtypes[4], wrapper.call, wrapper.cfunc_prototype )
+	return g_signal_connect_data( ptr, name, wrapper.cfunc, wrapper.userdata, notify )
 
 
 ################## Charp to Python String ###############
@@ -53,8 +52,8 @@ _GLIB_RETURNS_CHARP_ = (
 	g_value_get_string,
 )
 
-for func in _GLIB_RETURNS_CHARP_:
-	func.return_wrapper = lambda pointer=None: _CHARP2STRING(pointer)
+for func in _GLIB_RETURNS_CHARP_:	# borrowed, owned by glib
+	func.return_string()
 
 
 
@@ -7,15 +7,9 @@ gtk_box_pack_start.defaults[3] = True		# fill
 gtk_box_pack_end.defaults[2] = True		# expand
 gtk_box_pack_end.defaults[3] = True		# fill
 
-_RETURNS_CHARP_ = [
-	gtk_accelerator_get_label,
+_RETURNS_CHARP_ = [		# borrowed, owned by gtk
 	gtk_widget_path_iter_get_name,
 
-	gtk_rc_get_theme_dir,
-	gtk_rc_get_module_dir,
-	gtk_rc_get_im_module_path,
-	gtk_rc_get_im_module_file,
-
 	gtk_icon_size_get_name,
 
 	gtk_icon_source_get_filename,
@@ -24,15 +18,9 @@ _RETURNS_CHARP_ = [
 
 	gtk_widget_get_name,
 
-	gtk_widget_get_composite_name,
-
-	gtk_widget_get_tooltip_text,
-	gtk_widget_get_tooltip_markup,
-
 	gtk_menu_get_accel_path,
 	gtk_menu_get_title,
 
-
 	gtk_action_get_name,
 	gtk_action_get_accel_path,
 	gtk_action_get_label,
@@ -45,31 +33,17 @@ _RETURNS_CHARP_ = [
 	gtk_label_get_text,
 	gtk_label_get_label,
 
-	gtk_app_chooser_get_content_type,
 	gtk_app_chooser_dialog_get_heading,
 
-	gtk_tree_path_to_string,
-
-	gtk_tree_model_get_string_from_iter,
 	gtk_cell_area_get_current_path_string,
 
 	gtk_tree_view_column_get_title,
 
-	gtk_text_iter_get_slice,
-	gtk_text_iter_get_text,
-	gtk_text_iter_get_visible_slice,
-	gtk_text_iter_get_visible_text,
-
-	gtk_editable_get_chars,
-
 	gtk_entry_buffer_get_text,
 
 	gtk_combo_box_get_title,
-	gtk_combo_box_text_get_active_text,
 	gtk_entry_get_text,
 	gtk_entry_get_icon_name,
-	gtk_entry_get_icon_tooltip_text,
-	gtk_entry_get_icon_tooltip_markup,
 
 	gtk_app_chooser_button_get_heading,
 
@@ -85,34 +59,21 @@ _RETURNS_CHARP_ = [
 
 	gtk_menu_item_get_accel_path,
 
-	gtk_clipboard_wait_for_text,
-
 	gtk_color_button_get_title,
 
-	gtk_color_selection_palette_to_string,
-
 	gtk_expander_get_label,
 
 	gtk_file_filter_get_name,
-	gtk_file_chooser_get_filename,
-	gtk_file_chooser_get_uri,
-	gtk_file_chooser_get_current_folder_uri,
 
-	gtk_file_chooser_get_preview_filename,
-	gtk_file_chooser_get_preview_uri,
 	gtk_file_chooser_button_get_title,
 
 	gtk_font_button_get_title,
 
 	gtk_font_button_get_font_name,
-	gtk_font_selection_get_font_name,
 	gtk_font_selection_get_preview_text,
 
-	gtk_font_selection_dialog_get_font_name,
 	gtk_font_selection_dialog_get_preview_text,
 
-	gtk_icon_theme_get_example_icon_name,
-
 	gtk_icon_info_get_filename,
 	gtk_icon_info_get_display_name,
 
@@ -140,28 +101,76 @@ _RETURNS_CHARP_ = [
 	gtk_recent_info_get_uri,
 	gtk_recent_info_get_description,
 	gtk_recent_info_get_mime_type,
-	gtk_recent_info_last_application,
-	gtk_recent_info_get_short_name,
-	gtk_recent_info_get_uri_display,
 
 	gtk_recent_filter_get_name,
-	gtk_recent_chooser_get_current_uri,
 	gtk_status_icon_get_icon_name,
 
 	gtk_status_icon_get_title,
-	gtk_status_icon_get_tooltip_text,
 
 	gtk_text_mark_get_name,
 
-	gtk_text_buffer_get_text,
-	gtk_text_buffer_get_slice,
-
 	gtk_tool_item_group_get_label,
 
 	gdk_display_get_name,
+	gdk_keyval_name,
+]
+
+_RETURNS_CHARP_GFREE_ = [		# newly allocated, freed with g_free after the copy
+	gtk_accelerator_get_label,
+
+	gtk_rc_get_theme_dir,
+	gtk_rc_get_module_dir,
+	gtk_rc_get_im_module_path,
+	gtk_rc_get_im_module_file,
+
+	gtk_widget_get_composite_name,
+	gtk_widget_get_tooltip_text,
+	gtk_widget_get_tooltip_markup,
+
+	gtk_app_chooser_get_content_type,
+
+	gtk_tree_path_to_string,
+	gtk_tree_model_get_string_from_iter,
+
+	gtk_text_iter_get_slice,
+	gtk_text_iter_get_text,
+	gtk_text_iter_get_visible_slice,
+
+	gtk_text_iter_get_visible_text,
+
+	gtk_editable_get_chars,
+
+	gtk_combo_box_text_get_active_text,
+	gtk_entry_get_icon_tooltip_text,
+	gtk_entry_get_icon_tooltip_markup,
+
+	gtk_clipboard_wait_for_text,
+
+	gtk_color_selection_palette_to_string,
+
+	gtk_file_chooser_get_filename,
+	gtk_file_chooser_get_uri,
+	gtk_file_chooser_get_current_folder_uri,
+	gtk_file_chooser_get_preview_filename,
+	gtk_file_chooser_get_preview_uri,
+
+	gtk_font_selection_get_font_name,
+	gtk_font_selection_dialog_get_font_name,
+
+	gtk_icon_theme_get_example_icon_name,
+
+	gtk_recent_info_last_application,
+	gtk_recent_info_get_short_name,
+	gtk_recent_info_get_uri_display,
+	gtk_recent_chooser_get_current_uri,
+
+	gtk_status_icon_get_tooltip_text,
+
+	gtk_text_buffer_get_text,
+	gtk_text_buffer_get_slice,
+
 	gdk_rgba_to_string,
 	gdk_pixbuf_format_get_name,
-	gdk_keyval_name,
 ]
 
 
@@ -256,7 +265,7 @@ GTK_CONTAINER_CLASSES = {
 ################### WebKitGTK #####################
 if 'WebKitWebView' in globals():
 	GTK_WIDGET_CLASSES[ WebKitWebView ] = webkit_web_view_new
-	_RETURNS_CHARP_.append( webkit_dom_html_element_get_inner_html )
+	_RETURNS_CHARP_GFREE_.append( webkit_dom_html_element_get_inner_html )
 	_RETURNS_CHARP_.append( webkit_web_frame_get_title )
 	_RETURNS_CHARP_.append( webkit_web_frame_get_uri )
 
@@ -303,7 +312,9 @@ if 'ClutterActor' in globals():
 ################################################
 
 for func in _RETURNS_CHARP_:
-	func.return_wrapper = lambda pointer=None: _CHARP2STRING(pointer)
+	func.return_string()
+for func in _RETURNS_CHARP_GFREE_:
+	func.return_string( ownership='g_free' )
 
 
 for d in (GTK_WIDGET_CLASSES, GTK_CONTAINER_CLASSES):
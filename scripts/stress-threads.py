@@ -0,0 +1,113 @@
+#!/usr/bin/python
+## drives one generated wrapper from many threads at once, exits 1 on a wrong result or an error ##
+## builds a small C library with gcc and wraps it as source, bound at import and lazily, and as a descriptor with
+## eager and lazy structs (struct pointer types are resolved when a function is bound), then every thread loops over:
+##	calls		- the call stubs, char* strings, struct objects and lists through _call_, callbacks, keyword arguments
+##	patching	- defaults, change_argument_type and hold_gil of the same functions, the profiler on and off
+## the lazy module is hit by all threads together first, so they race to bind each function and freeze each struct.
+## usage: python stress-threads.py [--threads=N] [--loops=N] [--output=dir]
+import os, sys, shutil, tempfile, subprocess, threading, traceback
+sys.path.append('..')
+import rpythonic
+
+THREADS = 16
+LOOPS = 2000
+OUTPUT = None
+for arg in sys.argv:
+	if arg.startswith('--threads='): THREADS = int( arg.split('=')[-1] )
+	elif arg.startswith('--loops='): LOOPS = int( arg.split('=')[-1] )
+	elif arg.startswith('--output='): OUTPUT = arg.split('=')[-1]
+
+HEADER = '''
+struct stress_obj { int v; double w; };
+typedef int (*stress_cb)( int a, void *data );
+int stress_add( int a, int b );
+double stress_scale( double x, float k );
+int stress_len( const char *s );
+int stress_obj_get( struct stress_obj *o );
+void stress_obj_set( struct stress_obj *o, int v );
+int stress_sum( int *p, int n );
+int stress_call( stress_cb f, int a );
+'''
+SOURCE = '''
+#include <string.h>
+#include "stress.h"
+int stress_add( int a, int b ) { return a + b; }
+double stress_scale( double x, float k ) { return x * k; }
+int stress_len( const char *s ) { return (int)strlen( s ); }
+int stress_obj_get( struct stress_obj *o ) { return o->v; }
+void stress_obj_set( struct stress_obj *o, int v ) { o->v = v; }
+int stress_sum( int *p, int n ) { int i, s = 0; for (i = 0; i < n; i++) s += p[i]; return s; }
+int stress_call( stress_cb f, int a ) { return f( a, 0 ); }
+'''
+
+tmp = OUTPUT or tempfile.mkdtemp( prefix='rpythonic-stress-' )
+try:
+	if not os.path.isdir( tmp ): os.makedirs( tmp )
+	open( os.path.join(tmp,'stress.h'), 'w' ).write( HEADER )
+	open( os.path.join(tmp,'stress.c'), 'w' ).write( SOURCE )
+	lib = os.path.join( tmp, 'libstress.so' )
+	subprocess.check_call( ['gcc', '-O2', '-shared', '-fPIC', '-o', lib, os.path.join(tmp,'stress.c')] )
+
+	rpythonic.set_cache( tmp )
+	rpythonic.wrap( 'rpythonic_stress', header=os.path.join(tmp,'stress.h'), library_names=[lib] )
+	rpythonic.wrap( 'rpythonic_stress_lazy', header=os.path.join(tmp,'stress.h'), library_names=[lib], lazy_functions=True )
+	rpythonic.wrap( 'rpythonic_stress_rpyd', header=os.path.join(tmp,'stress.h'), library_names=[lib], output_format='descriptor' )
+	rpythonic.wrap( 'rpythonic_stress_rpyd_eager', header=os.path.join(tmp,'stress.h'), library_names=[lib], output_format='descriptor' )
+	sys.path.insert( 0, tmp )
+	import rpythonic_stress as E
+	import rpythonic_stress_lazy as L
+	import rpythonic_stress_rpyd as D
+	os.environ[ 'RPYTHONIC_LAZY_STRUCTS' ] = '0'		# read at import, structs are frozen and converted before any function is bound
+	import rpythonic_stress_rpyd_eager as DE
+
+	ERRORS = []
+	START = threading.Event()
+
+	def check( ok, what ):
+		if not ok: raise AssertionError( what )
+
+	def calls( M, n ):
+		cb = lambda a, data: a + n		# a trampoline held by each call, never pinned
+		for i in range( LOOPS ):
+			check( M.stress_add( i, n ) == i + n, 'stress_add' )
+			check( M.stress_add( a=i, b=n ) == i + n, 'stress_add keywords' )
+			check( abs( M.stress_scale( i, 0.5 ) - i * 0.5 ) < 1e-6, 'stress_scale' )
+			check( M.stress_len( 'x' * (n % 7) ) == n % 7, 'stress_len' )
+			o = M.stress_obj(); M.stress_obj_set( o, i )		# a meta object, through _call_
+			check( M.stress_obj_get( o ) == i and o.v == i, 'stress_obj' )
+			check( M.stress_sum( (M.ctypes.c_int * 3)( i, n, 1 ), 3 ) == i + n + 1, 'stress_sum' )
+			check( M.stress_call( cb, i ) == i + n, 'stress_call' )
+
+	def patching( M, n ):
+		for i in range( LOOPS ):
+			M.stress_add.defaults[ 1 ] = 0		# the same value, rebuilds the stub
+			M.stress_scale.change_argument_type( 'k', M.ctypes.c_float )
+			M.stress_len.hold_gil( i % 2 == 0 )
+			if n == 1: M._rpythonic_profile_( i % 2 == 0 )
+
+	def worker( M, n ):
+		START.wait()
+		try:
+			if n % 4 == 1: patching( M, n )		# while the others call the same functions
+			else: calls( M, n )
+		except Exception:
+			ERRORS.append( traceback.format_exc() )
+
+	for M in ( L, E, D, DE ):
+		threads = [ threading.Thread( target=worker, args=(M, n) ) for n in range(THREADS) ]
+		for t in threads: t.start()
+		START.set()		# the lazy module binds on the first calls of all threads together
+		for t in threads: t.join()
+		START.clear()
+		for name in ( 'stress_add', 'stress_scale', 'stress_len', 'stress_obj_get', 'stress_obj_set', 'stress_sum', 'stress_call' ):
+			if M.RPYTHONIC_WRAPPER_FUNCTIONS.get( name ) is not getattr( M, name ): ERRORS.append( '%s.%s bound twice' %(M.__name__, name) )
+		M._rpythonic_profile_( False )
+		if M._RPYTHONIC_CALLBACKS_: ERRORS.append( '%s: %s callbacks left pinned' %(M.__name__, len(M._RPYTHONIC_CALLBACKS_)) )
+		print( '%s: %s threads x %s loops, %s callbacks pinned' %(M.__name__, THREADS, LOOPS, len(M._RPYTHONIC_CALLBACKS_)) )
+
+	for error in ERRORS: print( error )
+	print( ERRORS and 'FAILED: %s errors' %len(ERRORS) or 'ok' )
+	sys.exit( ERRORS and 1 or 0 )
+finally:
+	if not OUTPUT: shutil.rmtree( tmp, ignore_errors=True )		# a temp dir of this run, --output keeps it